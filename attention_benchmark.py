@@ -0,0 +1,66 @@
+import argparse
+import multiprocessing
+import resource
+import time
+import torch
+import clearvoice.models.mossformer_gan_se.mossformer as mossformer
+from clearvoice.models.mossformer_gan_se.generator import SyncANet
+
+# The MossFormerGAN_SE_16K STFT: 16 kHz, hop 100, 201 frequency bins
+SAMPLING_RATE = 16000
+HOP = 100
+NUM_FEATURES = 201
+
+# A tile larger than any score matrix makes the tiled attentions build the full matrices in a
+# single tile, which is exactly the memory and arithmetic of the untiled code
+FULL = 1 << 62
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 1024 ** 2
+
+
+def run(seconds, tile_size, queue):
+    """Runs SyncANet once on `seconds` of input in a fresh process and reports its peak memory."""
+    torch.manual_seed(0)
+    mossformer.ATTENTION_TILE_SIZE = tile_size
+    model = SyncANet(num_channel=64, num_features=NUM_FEATURES).eval()
+    x = torch.randn(1, 2, seconds * SAMPLING_RATE // HOP + 1, NUM_FEATURES)
+    baseline = current_rss_mb()
+    with torch.no_grad():
+        start = time.perf_counter()
+        out = model(x)
+        elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((elapsed, peak - baseline, out[0][0, 0, :, :8].numpy()))
+
+
+def measure(seconds, tile_size):
+    queue = multiprocessing.get_context("spawn").Queue()
+    process = multiprocessing.get_context("spawn").Process(target=run, args=(seconds, tile_size, queue))
+    process.start()
+    process.join()
+    if process.exitcode != 0 or queue.empty():
+        return None  # Usually killed for running out of memory
+    return queue.get()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Peak memory and runtime of SyncANet with full and tiled attention")
+    parser.add_argument("--seconds", type=int, nargs="+", default=[5, 10, 20, 40, 60, 120])
+    parser.add_argument("--tile-size", type=int, default=mossformer.ATTENTION_TILE_SIZE, help="Scores per attention tile")
+    parser.add_argument("--max-full-seconds", type=int, default=60,
+                        help="Longest input run with full attention, whose memory is quadratic")
+    args = parser.parse_args()
+
+    print(f"SyncANet forward on CPU, random weights, tiles of {args.tile_size} scores")
+    print(f"{'input':>6} {'full (s)':>9} {'full (MB)':>10} {'tiled (s)':>10} {'tiled (MB)':>11} {'max diff':>9}")
+    for seconds in args.seconds:
+        tiled = measure(seconds, args.tile_size)
+        full = measure(seconds, FULL) if seconds <= args.max_full_seconds else None
+        cells = []
+        for result in (full, tiled):
+            cells += [f"{result[0]:.2f}", f"{result[1]:.0f}"] if result else ["-", "-"]
+        diff = f"{abs(full[2] - tiled[2]).max():.1e}" if full and tiled else "-"
+        print(f"{seconds:>5}s {cells[0]:>9} {cells[1]:>10} {cells[2]:>10} {cells[3]:>11} {diff:>9}")
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import timeit
+import av
+import numpy as np
+from pydub import AudioSegment
+from clearvoice.dataloader.audio_io import read_pcm, pcm_scale, deinterleave
+
+SAMPLE_RATE = 48000
+SECONDS = 30
+
+# The formats listed in clearvoice.dataloader.misc, with the container and codec used to write them
+FORMATS = {
+    "wav": ("wav", "pcm_s16le"),
+    "aac": ("adts", "aac"),
+    "ac3": ("ac3", "ac3"),
+    "aiff": ("aiff", "pcm_s16be"),
+    "flac": ("flac", "flac"),
+    "m4a": ("ipod", "aac"),
+    "mp3": ("mp3", "libmp3lame"),
+    "ogg": ("ogg", "vorbis"),
+    "opus": ("opus", "libopus"),
+    "wma": ("asf", "wmav2"),
+    "webm": ("webm", "libopus"),
+}
+
+
+def audioread_pydub(path):
+    """The original decoding in audioread: the file is decoded twice and scanned with max()."""
+    data = AudioSegment.from_file(path)
+    data = AudioSegment.from_file(path)
+    data_array = np.array(data.get_array_of_samples())
+    if max(data_array) > 32768.0:
+        audio_np = data_array / 2147483648.0
+    else:
+        audio_np = data_array / 32768.0
+    if data.channels == 2:
+        return [audio_np[::2], audio_np[1::2]]
+    return [audio_np]
+
+
+def audioread_fast(path):
+    samples, sample_rate, channels, sample_width = read_pcm(path)
+    return deinterleave(samples, channels, pcm_scale(samples))
+
+
+def make_signal(seconds, seed=0):
+    """A stereo mix of tones and noise, as int16."""
+    rng = np.random.default_rng(seed)
+    time = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    left = 0.3 * np.sin(2 * np.pi * 220 * time) + 0.05 * rng.standard_normal(len(time))
+    right = 0.3 * np.sin(2 * np.pi * 330 * time) + 0.05 * rng.standard_normal(len(time))
+    return (np.stack([left, right]) * 32767).astype(np.int16)
+
+
+def encode(path, container_format, codec_name, signal):
+    """Writes the signal with PyAV. Returns False if this build can't encode the format."""
+    try:
+        with av.open(path, "w", format=container_format) as container:
+            codec = av.codec.Codec(codec_name, "w")
+            rate = SAMPLE_RATE if not codec.audio_rates or SAMPLE_RATE in codec.audio_rates else max(codec.audio_rates)
+            stream = container.add_stream(codec_name, rate=rate, layout="stereo")
+            stream.bit_rate = 128000
+            stream.codec_context.options = {"strict": "experimental"}  # The native vorbis encoder
+            frame = av.AudioFrame.from_ndarray(np.ascontiguousarray(signal.T).reshape(1, -1), format="s16", layout="stereo")
+            frame.sample_rate = SAMPLE_RATE
+            resampler = av.AudioResampler(format=stream.codec_context.format.name, layout="stereo", rate=rate)
+            for resampled in resampler.resample(frame) + resampler.resample(None):
+                container.mux(stream.encode(resampled))
+            container.mux(stream.encode(None))
+        return True
+    except Exception:
+        return False
+
+
+if __name__ == "__main__":
+    signal = make_signal(SECONDS)
+    print(f"{SECONDS}s stereo at {SAMPLE_RATE} Hz")
+    print(f"{'format':>6} {'pydub (ms)':>12} {'new (ms)':>10} {'speedup':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for ext, (container_format, codec_name) in FORMATS.items():
+            path = os.path.join(tmp, f"test.{ext}")
+            if not encode(path, container_format, codec_name, signal):
+                print(f"{ext:>6}   (no encoder in this PyAV build)")
+                continue
+
+            fast = audioread_fast(path)
+            fast_time = min(timeit.repeat(lambda: audioread_fast(path), number=3, repeat=3)) / 3
+            try:
+                reference = audioread_pydub(path)
+                pydub_time = min(timeit.repeat(lambda: audioread_pydub(path), number=1, repeat=3))
+            except Exception:
+                print(f"{ext:>6} {'n/a':>12} {fast_time * 1000:>10.1f}    (pydub needs ffmpeg for this format)")
+                continue
+
+            # Decoders may prime a few samples differently, so only the shared length is compared
+            length = min(len(reference[0]), len(fast[0]))
+            assert len(reference) == len(fast), f"Channel count differs for {ext}"
+            difference = max(np.abs(r[:length] - f[:length]).max() for r, f in zip(reference, fast))
+            print(f"{ext:>6} {pydub_time * 1000:>12.1f} {fast_time * 1000:>10.1f} {pydub_time / fast_time:>8.1f}x"
+                  f"   max diff {difference:.2e}")
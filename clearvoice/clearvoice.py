@@ -8,7 +8,8 @@ class ClearVoice:
     """ The main class inferface to the end users for performing speech processing
         this class provides the desired model to perform the given task
     """
-    def __init__(self, task, model_names):
+    def __init__(self, task, model_names, precision='fp32', int8_guard_samples=None, compile=False, compile_seconds=None,
+                 backend='torch'):
         """ Load the desired models for the specified task. Perform all the given models and return all results.
    
         Parameters:
@@ -25,6 +26,20 @@ class ClearVoice:
             'MossFormerGAN_SE_16K'
             'MossFormer2_SS_16K'
             'AV_MossFormer2_TSE_16K'
+        precision: str
+            'fp32' (default), or 'int8' for dynamically quantized inference on CPU. int8 is
+            only enabled for a model if the PESQ of its outputs against fp32 passes a guard
+        int8_guard_samples: list of str
+            audio files the int8 guard decodes, synthetic speech if None
+        compile: bool
+            run TorchScript artifacts traced for the decoding window shapes, cached next to the
+            checkpoint, other input shapes run eager
+        compile_seconds: list of float
+            extra input lengths in seconds to compile for, e.g. the chunk length of a live stream
+        backend: str
+            'torch' (default), or 'onnxruntime' to run the network of FRCRN_SE_16K and
+            MossFormerGAN_SE_16K on ONNX Runtime, with the STFT and iSTFT in torch around it.
+            The graph is exported next to the checkpoint and checked against torch once
 
         Returns:
         --------
@@ -33,13 +48,14 @@ class ClearVoice:
         self.network_wrapper = network_wrapper()
         self.models = []
         for model_name in model_names:
-            model = self.network_wrapper(task, model_name)
+            model = self.network_wrapper(task, model_name, precision, int8_guard_samples, compile, compile_seconds,
+                                         backend)
             self.models += [model]  
             
-    def __call__(self, input_path, online_write=False, output_path=None):
+    def __call__(self, input_path, online_write=False, output_path=None, streaming=False, cache_dir=None):
         results = {}
         for model in self.models:
-            result = model.process(input_path, online_write, output_path)
+            result = model.process(input_path, online_write, output_path, streaming, cache_dir)
             if not online_write:
                 results[model.name] = result
 
@@ -53,6 +69,21 @@ class ClearVoice:
         for model in self.models:
             return cast(SpeechModel, model).process_wav_bytes_directly_se(wav_bytes)
 
+    def process_bytes_batch(self, list_of_chunks):
+        """ Enhance several chunks of 16-bit PCM bytes in one batched pass.
+        Returns a list of int16 numpy arrays, one per chunk, in input order.
+        """
+        for model in self.models:
+            return cast(SpeechModel, model).process_wav_bytes_batch_se(list_of_chunks)
+
+    def stream_session(self, **kwargs):
+        """ Start a streaming enhancement session with the first model.
+        The returned session's push(pcm) takes 16-bit PCM bytes and returns the enhanced
+        int16 audio that is ready so far, and flush() returns the rest at the end of the stream.
+        """
+        for model in self.models:
+            return cast(SpeechModel, model).stream_session(**kwargs)
+
     def write(self, results, output_path):
         add_subdir = False
         use_key = False
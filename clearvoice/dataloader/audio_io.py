@@ -0,0 +1,204 @@
+#!/usr/bin/env python -u
+# -*- coding: utf-8 -*-
+
+import struct
+import numpy as np
+import soundfile as sf
+
+MAX_WAV_VALUE_16B = 32768.0
+MAX_WAV_VALUE_32B = 2147483648.0
+
+# WAVE_FORMAT_EXTENSIBLE, the real format tag is the first two bytes of its SubFormat GUID
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Lossless containers read with soundfile (libsndfile), everything else is decoded with PyAV.
+# Ogg is left to PyAV too, libsndfile trusts the granule positions and can stop short
+SOUNDFILE_FORMATS = ['wav', 'flac', 'aiff']
+
+def detect_format(path):
+    """
+    Detects the container of an audio file from its first bytes, rather than trusting the extension.
+
+    Parameters:
+    path (str): The file path of the audio file.
+
+    Returns:
+    str: One of 'wav', 'flac', 'aiff', 'ogg', 'mp3', 'm4a', 'aac', 'ac3', 'webm', 'wma',
+         or None if the header isn't recognized.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(16)
+
+    if header[:4] in (b'RIFF', b'RF64', b'BW64') and header[8:12] == b'WAVE':
+        return 'wav'
+    if header[:4] == b'fLaC':
+        return 'flac'
+    if header[:4] == b'FORM' and header[8:12] in (b'AIFF', b'AIFC'):
+        return 'aiff'
+    if header[:4] == b'OggS':
+        return 'ogg'  # Vorbis, Opus and FLAC in Ogg alike
+    if header[4:8] == b'ftyp':
+        return 'm4a'
+    if header[:4] == b'\x1a\x45\xdf\xa3':
+        return 'webm'  # Matroska / WebM
+    if header[:4] == b'\x30\x26\xb2\x75':
+        return 'wma'  # ASF
+    if header[:3] == b'ID3':
+        return 'mp3'
+    if header[:2] == b'\x0b\x77':
+        return 'ac3'
+    if len(header) >= 2 and header[0] == 0xFF and header[1] & 0xF0 == 0xF0 and header[1] & 0x06 == 0:
+        return 'aac'  # ADTS, layer bits are always 0
+    if len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0:
+        return 'mp3'  # MPEG audio frame sync
+    return None
+
+def pcm_scale(samples):
+    """
+    Returns the full-scale value to divide integer PCM samples by.
+
+    Samples above the 16-bit range can only come from 32-bit audio, so a single vectorized
+    peak check decides between the two.
+
+    Parameters:
+    samples (numpy.ndarray): Integer PCM samples, in any shape.
+
+    Returns:
+    float: MAX_WAV_VALUE_32B or MAX_WAV_VALUE_16B.
+    """
+    if samples.size and samples.dtype.itemsize > 2 and samples.max() > MAX_WAV_VALUE_16B:
+        return MAX_WAV_VALUE_32B
+    return MAX_WAV_VALUE_16B
+
+def _read_wav_memmap(path):
+    """
+    Maps the sample data of a plain 16 or 32-bit integer PCM WAV file without reading it.
+
+    Returns:
+    tuple: (samples, sample_rate, channels, sample_width) with samples an interleaved
+           numpy.memmap, or None if the file needs a real decoder.
+    """
+    with open(path, 'rb') as f:
+        riff = f.read(12)
+        if riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            return None  # RF64 and friends keep their sizes elsewhere
+
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                if chunk_size % 2:
+                    f.seek(1, 1)
+            elif chunk_id == b'data':
+                data_offset = f.tell()
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, 1)  # Chunks are word aligned
+        file_size = f.seek(0, 2)
+
+    if fmt is None or len(fmt) < 16:
+        return None
+    format_tag, channels, sample_rate, _, block_align, bits = struct.unpack('<HHIIHH', fmt[:16])
+    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        format_tag = struct.unpack('<H', fmt[24:26])[0]
+    if format_tag != WAVE_FORMAT_PCM or bits not in (16, 32) or block_align != channels * bits // 8:
+        return None
+
+    # Streamed WAVs may leave the data size at 0 or 0xFFFFFFFF, so trust the file size instead
+    data_size = min(chunk_size, file_size - data_offset) if chunk_size else file_size - data_offset
+    count = data_size // block_align * channels
+    if count == 0:
+        return None
+    dtype = '<i2' if bits == 16 else '<i4'
+    samples = np.memmap(path, dtype=dtype, mode='r', offset=data_offset, shape=(count,))
+    return samples, sample_rate, channels, bits // 8
+
+def _read_soundfile(path):
+    """
+    Decodes a WAV, FLAC or AIFF file with soundfile into interleaved integer PCM.
+    """
+    with sf.SoundFile(path) as f:
+        # Up to 16 bits stays 16-bit, anything finer is read as 32-bit like ffmpeg's pcm_s32le
+        sample_width = 2 if f.subtype in ('PCM_16', 'PCM_S8', 'PCM_U8', 'ULAW', 'ALAW') else 4
+        samples = f.read(dtype='int16' if sample_width == 2 else 'int32', always_2d=True)
+        return samples.reshape(-1), f.samplerate, f.channels, sample_width
+
+def _read_pyav(path):
+    """
+    Decodes a compressed file with PyAV, frame by frame, into interleaved integer PCM.
+    """
+    import av
+
+    with av.open(path) as container:
+        stream = container.streams.audio[0]
+        channels = stream.codec_context.channels
+        sample_rate = stream.codec_context.sample_rate
+        # Lossy codecs decode to float and come out as 16-bit, integer codecs keep their width
+        sample_width = 4 if stream.codec_context.format.name.rstrip('p') == 's32' else 2
+        layout = stream.codec_context.layout.name
+        resampler = av.AudioResampler(format='s16' if sample_width == 2 else 's32', layout=layout, rate=sample_rate)
+
+        chunks = []
+        for frame in container.decode(stream):
+            frame.pts = None  # Let the resampler run on sample counts, ignoring pts gaps
+            for out_frame in resampler.resample(frame):
+                chunks.append(out_frame.to_ndarray().reshape(-1))
+        for out_frame in resampler.resample(None):
+            chunks.append(out_frame.to_ndarray().reshape(-1))
+
+    dtype = np.int16 if sample_width == 2 else np.int32
+    samples = np.concatenate(chunks) if chunks else np.zeros(0, dtype=dtype)
+    return samples, sample_rate, channels, sample_width
+
+def read_pcm(path):
+    """
+    Decodes an audio file once into interleaved integer PCM.
+
+    Plain 16 and 32-bit PCM WAV files are memory mapped, other WAV, FLAC and AIFF files are
+    read with soundfile, and compressed formats are decoded with PyAV. The container is
+    detected from the file header, and anything unrecognized is left for PyAV to probe.
+
+    Parameters:
+    path (str): The file path of the audio file.
+
+    Returns:
+    tuple: (samples, sample_rate, channels, sample_width), with samples a 1-D int16 or int32
+           array of interleaved channels.
+    """
+    audio_format = detect_format(path)
+    if audio_format == 'wav':
+        result = _read_wav_memmap(path)
+        if result is not None:
+            return result
+    if audio_format in SOUNDFILE_FORMATS:
+        try:
+            return _read_soundfile(path)
+        except Exception:
+            pass  # Left to PyAV, e.g. a codec this libsndfile build doesn't have
+    return _read_pyav(path)
+
+def deinterleave(samples, channels, scale):
+    """
+    Splits interleaved PCM into float64 channels scaled to [-1, 1).
+
+    Each channel is taken as a strided view, so only the converted outputs are allocated.
+    Mono and two-channel audio give one array per channel, other channel counts are kept
+    interleaved as a single array, as before.
+
+    Parameters:
+    samples (numpy.ndarray): Interleaved integer PCM samples.
+    channels (int): Number of channels.
+    scale (float): The full-scale value from pcm_scale.
+
+    Returns:
+    list of numpy.ndarray: One float array per channel.
+    """
+    if channels == 2:
+        samples = samples[:len(samples) - len(samples) % 2]
+        return [samples[0::2] / scale, samples[1::2] / scale]
+    return [samples / scale]
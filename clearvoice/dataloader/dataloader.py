@@ -13,6 +13,8 @@ import sys
 sys.path.append(os.path.dirname(__file__))
 from pydub import AudioSegment
 from clearvoice.dataloader.misc import read_and_config_file, get_file_extension
+from clearvoice.dataloader.audio_io import read_pcm, pcm_scale, deinterleave
+from clearvoice.utils.stage_timer import stage
 import librosa
 import random
 EPS = 1e-6
@@ -89,31 +91,22 @@ def audioread(path, sampling_rate, use_norm):
     ext = get_file_extension(path).replace('.', '')
     audio_info['ext']=ext
     
+    # Decode the file once, WAV is memory mapped and compressed formats are streamed through PyAV
     try:
-        data = AudioSegment.from_file(path)
+        with stage('io'):
+            data_array, sample_rate, channels, sample_width = read_pcm(path)
     except Exception as e:
         print(f"Error loading file: {e}")
         return None
-        
-    data = read_audio(path)
-   
-    audio_info['sample_rate'] = data.frame_rate
-    audio_info['channels'] = data.channels
-    audio_info['sample_width'] = data.sample_width
 
-    data_array = np.array(data.get_array_of_samples())
-    if max(data_array) > MAX_WAV_VALUE_16B:
-        audio_np = data_array / MAX_WAV_VALUE_32B
-    else:
-        audio_np = data_array / MAX_WAV_VALUE_16B
+    audio_info['sample_rate'] = sample_rate
+    audio_info['channels'] = channels
+    audio_info['sample_width'] = sample_width
 
-    audios = []
-    # Check if the audio is stereo
-    if audio_info['channels'] == 2:
-        audios.append(audio_np[::2])  # Even indices (left channel)
-        audios.append(audio_np[1::2])  # Odd indices (right channel)
-    else:
-        audios.append(audio_np)
+    # Split the channels (left and right for stereo) and scale them to [-1, 1), this pages in
+    # the memory mapped samples
+    with stage('io'):
+        audios = deinterleave(data_array, channels, pcm_scale(data_array))
     
     # Normalize the audio data.
     audios_normed = []
@@ -130,7 +123,8 @@ def audioread(path, sampling_rate, use_norm):
     if audio_info['sample_rate'] != sampling_rate:
         index = 0
         for audio_normed in audios_normed:
-            audios_normed[index] = librosa.resample(audio_normed, orig_sr=audio_info['sample_rate'], target_sr=sampling_rate)
+            with stage('resample'):
+                audios_normed[index] = librosa.resample(audio_normed, orig_sr=audio_info['sample_rate'], target_sr=sampling_rate)
             index = index + 1
     
     # Return the processed audio data.
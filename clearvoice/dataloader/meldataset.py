@@ -210,22 +210,26 @@ def mel_spectrogram(y, n_fft, num_mels, sampling_rate, hop_size, win_size, fmin,
         print('max value is ', torch.max(y))
     '''
     global mel_basis, hann_window
-    if fmax not in mel_basis:
+    # The filterbank depends on every mel setting, not only fmax, and both live on y's device
+    mel_key = f'{sampling_rate}_{n_fft}_{num_mels}_{fmin}_{fmax}_{y.device}'
+    window_key = f'{win_size}_{y.device}'
+    if mel_key not in mel_basis:
         #mel = librosa_mel_fn(sampling_rate, n_fft, num_mels, fmin, fmax)
         # sr, n_fft, n_mels=128, fmin=0.0, fmax
         mel = librosa.filters.mel(sr=sampling_rate, n_fft=n_fft, n_mels=num_mels, fmin=fmin, fmax=fmax)
-        mel_basis[str(fmax)+'_'+str(y.device)] = torch.from_numpy(mel).float().to(y.device)
-        hann_window[str(y.device)] = torch.hann_window(win_size).to(y.device)
+        mel_basis[mel_key] = torch.from_numpy(mel).float().to(y.device)
+    if window_key not in hann_window:
+        hann_window[window_key] = torch.hann_window(win_size).to(y.device)
 
     y = torch.nn.functional.pad(y.unsqueeze(1), (int((n_fft-hop_size)/2), int((n_fft-hop_size)/2)), mode='reflect')
     y = y.squeeze(1)
 
-    spec = torch.stft(y, n_fft, hop_length=hop_size, win_length=win_size, window=hann_window[str(y.device)],
+    spec = torch.stft(y, n_fft, hop_length=hop_size, win_length=win_size, window=hann_window[window_key],
                       center=center, pad_mode='reflect', normalized=False, onesided=True, return_complex=False)
 
     spec = torch.sqrt(spec.pow(2).sum(-1)+(1e-9))
 
-    spec = torch.matmul(mel_basis[str(fmax)+'_'+str(y.device)], spec)
+    spec = torch.matmul(mel_basis[mel_key], spec)
     spec = spectral_normalize_torch(spec)
 
     return spec
@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+
+class EnhancementBatcher:
+    """ A micro-batching service in front of ClearVoice.process_bytes_batch.
+
+    Every live transcriber submits its loud chunks here instead of calling process_bytes
+    directly. A single worker thread waits until it has `max_batch_size` chunks of the same
+    length, or until the oldest chunk has waited `max_wait` seconds, and then enhances the
+    whole group in one batched forward pass.
+
+    Chunks are bucketed by their exact length, since padding would change the enhanced
+    audio. The transcribers read whole 8192-sample frames, so the lengths repeat and buckets
+    still fill up. The bucket holding the oldest chunk is always served first so nothing
+    waits on a bucket that never fills up.
+    """
+
+    def __init__(self, clearvoice, max_batch_size=8, max_wait=0.05):
+        self.clearvoice = clearvoice
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        # bucket key -> deque of (submitted_at, wav_bytes, future)
+        self.buckets = OrderedDict()
+        self.condition = threading.Condition()
+        self.running = True
+        self.batches_run = 0
+        self.chunks_run = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    @property
+    def queue_depth(self):
+        with self.condition:
+            return sum(len(chunks) for chunks in self.buckets.values())
+
+    def submit(self, wav_bytes):
+        """ Queue a chunk of 16-bit PCM bytes. The future resolves to the enhanced int16 array. """
+        future = Future()
+        key = len(wav_bytes)
+        with self.condition:
+            self.buckets.setdefault(key, deque()).append((time.monotonic(), wav_bytes, future))
+            self.condition.notify()
+        return future
+
+    def process_bytes(self, wav_bytes):
+        """ Drop-in, blocking replacement for ClearVoice.process_bytes. """
+        return self.submit(wav_bytes).result()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+
+    def _oldest_bucket(self):
+        return min(self.buckets, key=lambda key: self.buckets[key][0][0])
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.buckets:
+                    self.condition.wait()
+                if not self.running:
+                    return
+
+                # Wait for the oldest chunk's bucket to fill up, but never past its deadline
+                while self.running:
+                    key = self._oldest_bucket()
+                    if len(self.buckets[key]) >= self.max_batch_size:
+                        break
+                    remaining = self.buckets[key][0][0] + self.max_wait - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                chunks = self.buckets[key]
+                batch = [chunks.popleft() for _ in range(min(len(chunks), self.max_batch_size))]
+                if not chunks:
+                    del self.buckets[key]
+
+            self._process(batch)
+
+    def _process(self, batch):
+        try:
+            outputs = self.clearvoice.process_bytes_batch([wav_bytes for _, wav_bytes, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches_run += 1
+        self.chunks_run += len(batch)
+        for (_, _, future), output in zip(batch, outputs):
+            future.set_result(output)
@@ -7,6 +7,7 @@ sys.path.append(os.path.dirname(__file__))
 from clearvoice.models.frcrn_se.conv_stft import ConvSTFT, ConviSTFT
 import numpy as np
 from clearvoice.models.frcrn_se.unet import UNet
+from clearvoice.utils.stage_timer import stage
 
 class FRCRN_Wrapper_StandAlone(nn.Module):
     """
@@ -134,7 +135,8 @@ class DCCRN(nn.Module):
         """
         out_list = []
         # Compute the complex spectrogram using STFT
-        cmp_spec = self.stft(inputs)  # [B, D*2, T]
+        with stage('stft'):
+            cmp_spec = self.stft(inputs)  # [B, D*2, T]
         cmp_spec = torch.unsqueeze(cmp_spec, 1)  # [B, 1, D*2, T]
         
         # Split into real and imaginary parts
@@ -146,13 +148,8 @@ class DCCRN(nn.Module):
         cmp_spec = torch.unsqueeze(cmp_spec, 4)  # [B, 2, D, T, 1]
         cmp_spec = torch.transpose(cmp_spec, 1, 4)  # [B, 1, D, T, 2]
         
-        # Pass through the UNet to estimate masks
-        unet1_out = self.unet(cmp_spec)  # First UNet output
-        cmp_mask1 = torch.tanh(unet1_out)  # First mask
-
-        unet2_out = self.unet2(unet1_out)  # Second UNet output
-        cmp_mask2 = torch.tanh(unet2_out)  # Second mask
-        cmp_mask2 = cmp_mask2 + cmp_mask1  # Combine masks
+        # Pass through the UNets to estimate the mask
+        cmp_mask2 = self.estimate_mask(cmp_spec)
 
         # Apply the estimated mask to the complex spectrogram
         est_spec, est_wav, est_mask = self.apply_mask(cmp_spec, cmp_mask2)
@@ -175,7 +172,8 @@ class DCCRN(nn.Module):
             torch.Tensor: Estimated waveform after processing.
         """
         # Compute the complex spectrogram using STFT
-        cmp_spec = self.stft(inputs)  # [B, D*2, T]
+        with stage('stft'):
+            cmp_spec = self.stft(inputs)  # [B, D*2, T]
         cmp_spec = torch.unsqueeze(cmp_spec, 1)  # [B, 1, D*2, T]
 
         # Split into real and imaginary parts
@@ -187,18 +185,30 @@ class DCCRN(nn.Module):
         cmp_spec = torch.unsqueeze(cmp_spec, 4)  # [B, 2, D, T, 1]
         cmp_spec = torch.transpose(cmp_spec, 1, 4)  # [B, 1, D, T, 2]
 
-        # Pass through the UNet to estimate masks
-        unet1_out = self.unet(cmp_spec)
-        cmp_mask1 = torch.tanh(unet1_out)
-        
-        unet2_out = self.unet2(unet1_out)
-        cmp_mask2 = torch.tanh(unet2_out)
-        cmp_mask2 = cmp_mask2 + cmp_mask1  # Combine masks
+        # Pass through the UNets to estimate the mask
+        cmp_mask2 = self.estimate_mask(cmp_spec)
 
         # Apply the estimated mask to compute the estimated waveform
         _, est_wav, _ = self.apply_mask(cmp_spec, cmp_mask2)
         return est_wav[0]  # Return the estimated waveform
 
+    def estimate_mask(self, cmp_spec):
+        """
+        Estimates the complex mask with the two UNets, the network core between the STFT and the iSTFT.
+
+        Args:
+            cmp_spec (torch.Tensor): Complex spectrogram [B, 1, D, T, 2].
+
+        Returns:
+            torch.Tensor: Complex mask [B, 1, D, T, 2].
+        """
+        unet1_out = self.unet(cmp_spec)  # First UNet output
+        cmp_mask1 = torch.tanh(unet1_out)  # First mask
+
+        unet2_out = self.unet2(unet1_out)  # Second UNet output
+        cmp_mask2 = torch.tanh(unet2_out)  # Second mask
+        return cmp_mask2 + cmp_mask1  # Combine masks
+
     def apply_mask(self, cmp_spec, cmp_mask):
         """
         Apply the estimated masks to the complex spectrogram.
@@ -220,7 +230,8 @@ class DCCRN(nn.Module):
         cmp_mask = torch.squeeze(cmp_mask, 1)
         cmp_mask = torch.cat([cmp_mask[:, :, :, 0], cmp_mask[:, :, :, 1]], 1)  # Combine masks
 
-        est_wav = self.istft(est_spec)  # Inverse STFT to obtain waveform
+        with stage('istft'):
+            est_wav = self.istft(est_spec)  # Inverse STFT to obtain waveform
         est_wav = torch.squeeze(est_wav, 1)  # Remove unnecessary dimensions
         return est_spec, est_wav, cmp_mask
 
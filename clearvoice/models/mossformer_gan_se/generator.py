@@ -8,10 +8,11 @@ from torch.nn.parameter import Parameter
 
 from clearvoice.models.mossformer_gan_se.fsmn import UniDeepFsmn
 from clearvoice.models.mossformer_gan_se.conv_module import ConvModule
-from clearvoice.models.mossformer_gan_se.mossformer import MossFormer
+from clearvoice.models.mossformer_gan_se.mossformer import MossFormer, tiled_softmax_attention
 from clearvoice.models.mossformer_gan_se.se_layer import SELayer
 from clearvoice.models.mossformer_gan_se.get_layer_from_string import get_layer
 from clearvoice.models.mossformer_gan_se.discriminator import Discriminator
+from clearvoice.utils.misc import apply_phase
 
 # Check if the installed version of PyTorch is 1.9.0 or higher
 is_torch_1_9_plus = V(torch.__version__) >= V("1.9.0")
@@ -369,8 +370,8 @@ class SyncANet(nn.Module):
             list: List containing the real and imaginary parts of the output tensor.
         """
         out_list = []  # List to store outputs
-        mag = torch.sqrt(x[:, 0, :, :]**2 + x[:, 1, :, :]**2).unsqueeze(1)  # Calculate magnitude
-        noisy_phase = torch.angle(torch.complex(x[:, 0, :, :], x[:, 1, :, :])).unsqueeze(1)  # Calculate phase
+        noisy_real, noisy_imag = x[:, 0:1, :, :], x[:, 1:2, :, :]
+        mag = torch.sqrt(noisy_real**2 + noisy_imag**2)  # Calculate magnitude
         x_in = torch.cat([mag, x], dim=1)  # Concatenate magnitude and input for processing
 
         x = self.dense_encoder(x_in)  # Feature extraction using dense encoder
@@ -381,8 +382,7 @@ class SyncANet(nn.Module):
         out_mag = mask * mag  # Apply mask to magnitude
 
         complex_out = self.complex_decoder(x)  # Generate complex output
-        mag_real = out_mag * torch.cos(noisy_phase)  # Real part of the output
-        mag_imag = out_mag * torch.sin(noisy_phase)  # Imaginary part of the output
+        mag_real, mag_imag = apply_phase(out_mag, noisy_real, noisy_imag, mag)  # Masked magnitude with the noisy phase
         final_real = mag_real + complex_out[:, 0, :, :].unsqueeze(1)  # Final real output
         final_imag = mag_imag + complex_out[:, 1, :, :].unsqueeze(1)  # Final imaginary output
         out_list.append(final_real)  # Append real output to list
@@ -626,9 +626,13 @@ class SyncANetBlock(nn.Module):
         """
         B, C, old_T, old_Q = x.shape
         
-        # Calculate new dimensions for padding
-        T = math.ceil((old_T - self.emb_ks) / self.emb_hs) * self.emb_hs + self.emb_ks
-        Q = math.ceil((old_Q - self.emb_ks) / self.emb_hs) * self.emb_hs + self.emb_ks
+        # Calculate new dimensions for padding. With a hop of 1 every length already fits, and
+        # keeping the input sizes lets the block be exported with a dynamic time axis
+        if self.emb_hs == 1:
+            T, Q = old_T, old_Q
+        else:
+            T = math.ceil((old_T - self.emb_ks) / self.emb_hs) * self.emb_hs + self.emb_ks
+            Q = math.ceil((old_Q - self.emb_ks) / self.emb_hs) * self.emb_hs + self.emb_ks
         
         # Pad the input tensor to match the new dimensions
         x = F.pad(x, (0, Q - old_Q, 0, T - old_T))
@@ -708,10 +712,9 @@ class SyncANetBlock(nn.Module):
         V = V.flatten(start_dim=2)  # Flatten for attention calculation
         emb_dim = Q.shape[-1]
 
-        # Compute scaled dot-product attention
-        attn_mat = torch.matmul(Q, K.transpose(1, 2)) / (emb_dim**0.5)  # Attention matrix
-        attn_mat = F.softmax(attn_mat, dim=2)  # Softmax over attention scores
-        V = torch.matmul(attn_mat, V)  # Weighted sum of values
+        # Scaled dot-product attention over time, tiled with an online softmax so the
+        # (T, T) attention matrix is never built
+        V = tiled_softmax_attention(Q, K, V, 1.0 / (emb_dim**0.5))
 
         V = V.reshape(old_shape)  # Reshape back
         V = V.transpose(1, 2)  # Final reshaping
@@ -50,6 +50,105 @@ def padding_to_multiple_of(n, mult):
         return 0
     return mult - remainder
 
+# Number of attention scores computed at once by the tiled attentions (16 MB of float32),
+# read at call time
+ATTENTION_TILE_SIZE = 1 << 22
+
+def tiled_relu_attention(q, k, values, scale, dropout=None, key_mask=None, causal=False, exclude_diagonal=False,
+                         tile_size=None):
+    """
+    Squared-ReLU attention, sum_j relu(q_i . k_j * scale)^2 * v_j, computed a tile of queries at a time.
+
+    Each tile takes as many queries as fit `tile_size` scores against all m keys, so memory
+    grows linearly with the sequence length instead of quadratically. The attention is not
+    normalized over the keys, so tiles are independent and the result is the same as the
+    full computation.
+
+    Args:
+        q (Tensor): Queries (..., n, d).
+        k (Tensor): Keys (..., m, d).
+        values (tuple): Value tensors (..., m, e), all weighted by the same attention.
+        scale (float): Factor applied to the dot products.
+        dropout (nn.Module, optional): Dropout applied to the attention weights.
+        key_mask (Tensor, optional): Boolean mask broadcastable to (..., 1, m), False keys are ignored.
+        causal (bool): Whether query i only attends to keys j <= i.
+        exclude_diagonal (bool): Whether query i ignores key i.
+        tile_size (int): Number of scores per tile, ATTENTION_TILE_SIZE if None.
+
+    Returns:
+        list: One output (..., n, e) per value tensor.
+    """
+    n, m = q.shape[-2], k.shape[-2]
+    batch = q.numel() // max(1, n * q.shape[-1])
+    chunk_size = max(1, (tile_size or ATTENTION_TILE_SIZE) // max(1, batch * m))
+    key_t = k.transpose(-1, -2)
+    outputs = [[] for _ in values]
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        attn = F.relu(torch.matmul(q[..., start:end, :], key_t) * scale) ** 2
+        if exists(dropout):
+            attn = dropout(attn)
+        if causal or exclude_diagonal:
+            rows = torch.arange(start, end, device=q.device).unsqueeze(-1)
+            cols = torch.arange(m, device=q.device)
+            drop = torch.zeros((end - start, m), dtype=torch.bool, device=q.device)
+            if causal:
+                drop = drop | (cols > rows)
+            if exclude_diagonal:
+                drop = drop | (cols == rows)
+            attn = attn.masked_fill(drop, 0.)
+        if exists(key_mask):
+            attn = attn.masked_fill(~key_mask, 0.)
+        for output, value in zip(outputs, values):
+            output.append(torch.matmul(attn, value))
+    return [torch.cat(output, dim=-2) for output in outputs]
+
+def tiled_softmax_attention(q, k, v, scale, tile_size=None):
+    """
+    Softmax attention, softmax(q k^T * scale) v, computed tile by tile with an online softmax.
+
+    Each tile of queries walks over the keys a tile at a time, keeping the running maximum
+    score, the running sum of exponentials and the weighted sum of values, rescaled whenever
+    the maximum grows. Tiles are square and hold about `tile_size` scores, instead of the full
+    (n, m) matrix, and the result matches F.softmax up to float rounding.
+
+    Args:
+        q (Tensor): Queries (..., n, d).
+        k (Tensor): Keys (..., m, d).
+        v (Tensor): Values (..., m, e).
+        scale (float): Factor applied to the dot products.
+        tile_size (int): Number of scores per tile, ATTENTION_TILE_SIZE if None.
+
+    Returns:
+        Tensor: The attention output (..., n, e).
+    """
+    n, m = q.shape[-2], k.shape[-2]
+    batch = q.numel() // max(1, n * q.shape[-1])
+    chunk_size = max(1, math.isqrt((tile_size or ATTENTION_TILE_SIZE) // max(1, batch)))
+    outputs = []
+    for q_start in range(0, n, chunk_size):
+        q_tile = q[..., q_start:q_start + chunk_size, :] * scale
+        running_max = running_sum = acc = None
+        for k_start in range(0, m, chunk_size):
+            scores = torch.matmul(q_tile, k[..., k_start:k_start + chunk_size, :].transpose(-1, -2))
+            tile_max = scores.amax(dim=-1, keepdim=True)
+            if running_max is None:
+                new_max = tile_max
+            else:
+                new_max = torch.maximum(running_max, tile_max)
+            weights = torch.exp(scores - new_max)
+            tile_out = torch.matmul(weights, v[..., k_start:k_start + chunk_size, :])
+            if running_max is None:
+                running_sum = weights.sum(dim=-1, keepdim=True)
+                acc = tile_out
+            else:
+                correction = torch.exp(running_max - new_max)
+                running_sum = running_sum * correction + weights.sum(dim=-1, keepdim=True)
+                acc = acc * correction + tile_out
+            running_max = new_max
+        outputs.append(acc / running_sum)
+    return torch.cat(outputs, dim=-2)
+
 # ScaleNorm
 class ScaleNorm(nn.Module):
     """
@@ -416,34 +515,13 @@ class MossFormer(nn.Module):
         if exists(mask):
             mask = rearrange(mask, 'b (g j) -> b g 1 j', j = n)  # Adjust mask dimensions
 
-        # Calculate quadratic attention output
-        sim = einsum('... i d, ... j d -> ... i j', quad_q, quad_k) / n
-        sim_c = einsum('... i d, ... j d -> ... i j', quad_q_c, quad_k_c) / quad_q_c.shape[-2]
-        
-        # Avoid introducing infinite loss probability
-        attn = F.relu(sim) ** 2
-        attn = self.dropout(attn)  # Apply dropout for regularization
-        
-        attn_c = F.relu(sim_c) ** 2
-        attn_c = self.dropout(attn_c)  # Apply dropout for the computed attention
-        mask_c = torch.eye(quad_q_c.shape[-2], dtype = torch.bool, device = device)
-        attn_c = attn_c.masked_fill(mask_c, 0.)  # Mask diagonal for attention
-
-        if exists(mask):
-            attn = attn.masked_fill(~mask, 0.)  # Apply the mask to the main attention
-
-        if self.causal:
-            # Create a causal mask for the attention
-            causal_mask = torch.ones((g, g), dtype = torch.bool, device = device).triu(1)
-            attn = attn.masked_fill(causal_mask, 0.)  # Apply causal mask
-
-        # Calculate the output for quadratic attention
-        quad_out_v = einsum('... i j, ... j d -> ... i d', attn, v)
-        quad_out_u = einsum('... i j, ... j d -> ... i d', attn, u)
-
-        # Calculate output for the causal quadratic attention
-        quad_out_v_c = einsum('... i j, ... j d -> ... i d', attn_c, v_c)
-        quad_out_u_c = einsum('... i j, ... j d -> ... i d', attn_c, u_c)
+        # Quadratic attention over the sequence, and across the batch axis (the other grid axis).
+        # Both are squared ReLU of the scaled similarities, computed a tile of queries at a time
+        # so the score matrices never exist in full. The cross attention masks its diagonal
+        quad_out_v, quad_out_u = tiled_relu_attention(quad_q, quad_k, (v, u), 1. / n, dropout = self.dropout,
+                                                      key_mask = mask, causal = self.causal)
+        quad_out_v_c, quad_out_u_c = tiled_relu_attention(quad_q_c, quad_k_c, (v_c, u_c), 1. / quad_q_c.shape[-2],
+                                                          dropout = self.dropout, exclude_diagonal = True)
         quad_out_v_c = quad_out_v_c.transpose(2, 1).contiguous().view(BT, K, Q, C)
         quad_out_u_c = quad_out_u_c.transpose(2, 1).contiguous().view(BT, K, Q, C)
 
@@ -43,6 +43,11 @@ class network_wrapper(nn.Module):
         parser.add_argument('--sampling-rate', dest='sampling_rate', type=int, default=16000, help='Sampling rate')
         parser.add_argument('--one-time-decode-length', dest='one_time_decode_length', type=float, default=60.0, help='Max segment length for one-pass decoding')
         parser.add_argument('--decode-window', dest='decode_window', type=float, default=1.0, help='Decoding chunk size')
+        parser.add_argument('--decode-batch-size', dest='decode_batch_size', type=int, default=4, help='Number of windows decoded per forward pass in segmented decoding')
+        parser.add_argument('--num-read-workers', dest='num_read_workers', type=int, default=2, help='Number of threads reading and decoding input files ahead of the model')
+        parser.add_argument('--num-write-workers', dest='num_write_workers', type=int, default=2, help='Number of threads resampling and encoding output files')
+        parser.add_argument('--result-cache-dir', dest='result_cache_dir', type=str, default=None, help='Directory of the on-disk result cache, disabled if not set')
+        parser.add_argument('--result-cache-size', dest='result_cache_size', type=float, default=10.0, help='Size limit of the result cache in GB')
 
         # FFT parameters for feature extraction
         parser.add_argument('--window-len', dest='win_len', type=int, default=400, help='Window length for framing')
@@ -50,6 +55,11 @@ class network_wrapper(nn.Module):
         parser.add_argument('--fft-len', dest='fft_len', type=int, default=512, help='FFT length for feature extraction')
         parser.add_argument('--num-mels', dest='num_mels', type=int, default=60, help='Number of mel-spectrogram bins')
         parser.add_argument('--window-type', dest='win_type', type=str, default='hamming', help='Window type: hamming or hanning')
+        parser.add_argument('--dither-seed', dest='dither_seed', type=int, default=None, help='Seed of the filter bank dither, random if not set')
+
+        # ONNX Runtime backend settings
+        parser.add_argument('--onnx-intra-op-threads', dest='onnx_intra_op_threads', type=int, default=0, help='Threads within an ONNX Runtime operator, 0 for its default')
+        parser.add_argument('--onnx-inter-op-threads', dest='onnx_inter_op_threads', type=int, default=0, help='Threads across ONNX Runtime operators, 0 for its default')
 
         # Parse arguments from the config file
         self.args = parser.parse_args(['--config', self.config_path])
@@ -78,6 +88,11 @@ class network_wrapper(nn.Module):
         parser.add_argument('--num-spks', dest='num_spks', type=int, default=2, help='Number of speakers to separate')
         parser.add_argument('--one-time-decode-length', dest='one_time_decode_length', type=float, default=60.0, help='Max segment length for one-pass decoding')
         parser.add_argument('--decode-window', dest='decode_window', type=float, default=1.0, help='Decoding chunk size')
+        parser.add_argument('--decode-batch-size', dest='decode_batch_size', type=int, default=4, help='Number of windows decoded per forward pass in segmented decoding')
+        parser.add_argument('--num-read-workers', dest='num_read_workers', type=int, default=2, help='Number of threads reading and decoding input files ahead of the model')
+        parser.add_argument('--num-write-workers', dest='num_write_workers', type=int, default=2, help='Number of threads resampling and encoding output files')
+        parser.add_argument('--result-cache-dir', dest='result_cache_dir', type=str, default=None, help='Directory of the on-disk result cache, disabled if not set')
+        parser.add_argument('--result-cache-size', dest='result_cache_size', type=float, default=10.0, help='Size limit of the result cache in GB')
 
         # Encoder settings
         parser.add_argument('--encoder_kernel-size', dest='encoder_kernel_size', type=int, default=16, help='Kernel size for Conv1D encoder')
@@ -129,6 +144,11 @@ class network_wrapper(nn.Module):
         parser.add_argument('--sampling-rate', dest='sampling_rate', type=int, default=16000, help='Sampling rate')
         parser.add_argument('--one-time-decode-length', dest='one_time_decode_length', type=float, default=60.0, help='Max segment length for one-pass decoding')
         parser.add_argument('--decode-window', dest='decode_window', type=float, default=1.0, help='Decoding chunk size')
+        parser.add_argument('--decode-batch-size', dest='decode_batch_size', type=int, default=4, help='Number of windows decoded per forward pass in segmented decoding')
+        parser.add_argument('--num-read-workers', dest='num_read_workers', type=int, default=2, help='Number of threads reading and decoding input files ahead of the model')
+        parser.add_argument('--num-write-workers', dest='num_write_workers', type=int, default=2, help='Number of threads resampling and encoding output files')
+        parser.add_argument('--result-cache-dir', dest='result_cache_dir', type=str, default=None, help='Directory of the on-disk result cache, disabled if not set')
+        parser.add_argument('--result-cache-size', dest='result_cache_size', type=float, default=10.0, help='Size limit of the result cache in GB')
 
         # Parse arguments from the config file
         self.args = parser.parse_args(['--config', self.config_path])
@@ -162,11 +182,17 @@ class network_wrapper(nn.Module):
         # Decode parameters for streaming or chunk-based decoding
         parser.add_argument('--one-time-decode-length', dest='one_time_decode_length', type=int, default=60, help='Max segment length for one-pass decoding')
         parser.add_argument('--decode-window', dest='decode_window', type=int, default=1, help='Chunk length for streaming')
+        parser.add_argument('--decode-batch-size', dest='decode_batch_size', type=int, default=4, help='Number of windows decoded per forward pass in segmented decoding')
+        parser.add_argument('--num-read-workers', dest='num_read_workers', type=int, default=2, help='Number of threads reading and decoding input files ahead of the model')
+        parser.add_argument('--num-write-workers', dest='num_write_workers', type=int, default=2, help='Number of threads resampling and encoding output files')
+        parser.add_argument('--result-cache-dir', dest='result_cache_dir', type=str, default=None, help='Directory of the on-disk result cache, disabled if not set')
+        parser.add_argument('--result-cache-size', dest='result_cache_size', type=float, default=10.0, help='Size limit of the result cache in GB')
 
         # Parse arguments from the config file
         self.args = parser.parse_args(['--config', self.config_path])
 
-    def __call__(self, task, model_name):
+    def __call__(self, task, model_name, precision='fp32', int8_guard_samples=None, compile=False, compile_seconds=None,
+                 backend='torch'):
         """
         Calls the appropriate argument-loading function based on the task type 
         (e.g., 'speech_enhancement', 'speech_separation', or 'target_speaker_extraction').
@@ -175,6 +201,11 @@ class network_wrapper(nn.Module):
         Args:
         - task (str): The task type ('speech_enhancement', 'speech_separation', 'target_speaker_extraction').
         - model_name (str): The name of the model to load (e.g., 'FRCRN_SE_16K').
+        - precision (str): 'fp32', or 'int8' for dynamically quantized CPU inference.
+        - int8_guard_samples (list): Audio files the int8 accuracy guard decodes, synthetic speech if None.
+        - compile (bool): Whether to run compiled TorchScript artifacts for the decoding window shapes.
+        - compile_seconds (list): Extra input lengths in seconds to compile for.
+        - backend (str): 'torch', or 'onnxruntime' to run the network core of the SE models on ONNX Runtime.
         
         Returns:
         - self.network: The instantiated neural network model.
@@ -200,6 +231,11 @@ class network_wrapper(nn.Module):
         #print(self.args)  # Display the parsed arguments
         self.args.task = task 
         self.args.network = self.model_name  # Set the network name to the model name
+        self.args.precision = precision
+        self.args.int8_guard_samples = int8_guard_samples
+        self.args.compile = compile
+        self.args.compile_seconds = compile_seconds
+        self.args.backend = backend
 
         # Initialize the corresponding network based on the selected model
         if self.args.network == 'FRCRN_SE_16K':
@@ -20,8 +20,13 @@ import librosa
 from tqdm import tqdm
 import numpy as np
 from pydub import AudioSegment
-from clearvoice.utils.decode import decode_one_audio
+from clearvoice.utils.decode import decode_one_audio, decode_batch_audio_mossformergan_se_16k
+from clearvoice.utils.stream_file import decode_file_streaming
+from clearvoice.utils.pipeline import StageTimer, BoundedExecutor, prefetch_map
+from clearvoice.utils.result_cache import ResultCache
+from clearvoice.utils.stage_timer import stage
 from clearvoice.dataloader.dataloader import DataReader
+from clearvoice.dataloader.audio_io import pcm_scale
 
 MAX_WAV_VALUE = 32768.0
 
@@ -157,7 +162,97 @@ class SpeechModel:
             checkpoint_path = os.path.join(self.args.checkpoint_dir, model_name)
             self._load_model(self.model, checkpoint_path, model_key='model')
 
+    def apply_precision(self):
+        """
+        Switches the loaded model to the precision in args.precision, 'fp32' (default) or 'int8'.
+
+        int8 applies dynamic quantization to the linear, recurrent and 1x1 convolution layers,
+        for CPU inference. It is only enabled if the PESQ of its outputs against the fp32
+        outputs passes the guard in clearvoice.utils.quantization, and the quantized weights are
+        cached next to the checkpoint.
+        """
+        precision = getattr(self.args, 'precision', 'fp32')
+        if precision == 'fp32':
+            return
+        if precision != 'int8':
+            print(f'Precision {precision} is not supported, please select from: fp32, int8')
+            return
+        if getattr(self.args, 'backend', 'torch') != 'torch':
+            print(f'{self.name}: int8 is only supported by the torch backend, keeping fp32')
+            return
+
+        from clearvoice.utils.quantization import INT8_NETWORKS, load_int8_model
+        if self.device.type != 'cpu':
+            print(f'{self.name}: int8 inference is CPU only, keeping fp32 on {self.device}')
+        elif self.name not in INT8_NETWORKS:
+            print(f'{self.name}: int8 inference is not supported, keeping fp32')
+        else:
+            self.model = load_int8_model(self.model, self.args, self.device, getattr(self.args, 'int8_guard_samples', None))
+
+    def apply_backend(self):
+        """
+        Runs the network core on the backend in args.backend, 'torch' (default) or 'onnxruntime'.
+
+        onnxruntime exports the network between the STFT and the iSTFT to ONNX, with dynamic
+        batch and time axes, and keeps the rest in torch so decode_one_audio() and
+        process_bytes() work unchanged. The graph is cached next to the checkpoint.
+        """
+        backend = getattr(self.args, 'backend', 'torch')
+        if backend == 'torch':
+            return
+        if backend != 'onnxruntime':
+            print(f'Backend {backend} is not supported, please select from: torch, onnxruntime')
+            return
+
+        from clearvoice.utils.onnx_backend import ONNX_NETWORKS, load_onnx_model
+        if self.name not in ONNX_NETWORKS:
+            print(f'{self.name}: the onnxruntime backend is not supported, running on torch')
+        else:
+            self.model = load_onnx_model(self.model, self.args, self.device)
+
+    def apply_compile(self):
+        """
+        Wraps the model with TorchScript artifacts traced for the shapes of its decoding windows,
+        when args.compile is set. Artifacts are cached next to the checkpoint, keyed by the torch
+        version and the config, and any shape that can't be traced runs eager.
+        """
+        if not getattr(self.args, 'compile', False):
+            return
+        if getattr(self.args, 'backend', 'torch') != 'torch':
+            print(f'{self.name}: compiling is only supported by the torch backend')
+            return
+
+        from clearvoice.utils.compiled import COMPILED_NETWORKS, load_compiled_model
+        if self.name not in COMPILED_NETWORKS:
+            print(f'{self.name}: compiling is not supported, running eager')
+        else:
+            self.model = load_compiled_model(self.model, self.args, self.device)
+
+    def _load_mmap(self, model, checkpoint_path, mmap_path):
+        """
+        Loads the weights of model from its converted checkpoint, if there is one newer than the
+        checkpoint. The converted file holds just the model's state dict, which torch maps into
+        memory and assigns to the model as is, without unpickling or copying the tensors.
+
+        Returns:
+        bool: Whether the weights were loaded.
+        """
+        if not os.path.isfile(mmap_path) or os.path.getmtime(mmap_path) < os.path.getmtime(checkpoint_path):
+            return False
+        try:
+            state = torch.load(mmap_path, map_location='cpu', mmap=True, weights_only=True)
+            model.load_state_dict(state, assign=True)
+            return True
+        except Exception as e:
+            print(f'Ignoring the converted checkpoint {mmap_path}: {e}')
+            return False
+
     def _load_model(self, model, checkpoint_path, model_key=None):
+        # Converted on the first load, next to the checkpoint, for memory mapped loading afterwards
+        mmap_path = f'{checkpoint_path}.{model_key}.mmap.pt'
+        if self._load_mmap(model, checkpoint_path, mmap_path):
+            return
+
         # Load the checkpoint file into memory (map_location ensures compatibility with different devices)
         checkpoint = torch.load(checkpoint_path, map_location=lambda storage, loc: storage, weights_only=False)
         # Load the model's state dictionary (weights and biases) into the current model
@@ -176,6 +271,14 @@ class SpeechModel:
             elif self.print: print(f'{key} not loaded')
         model.load_state_dict(state)
 
+        # Written under a temporary name, so a concurrent load never maps a partial file
+        try:
+            temp_path = f'{mmap_path}.{os.getpid()}.tmp'
+            torch.save(state, temp_path)
+            os.replace(temp_path, mmap_path)
+        except OSError as e:
+            print(f'Could not convert {checkpoint_path} for memory mapped loading: {e}')
+
     def decode(self):
         """
         Decodes the input audio data using the loaded model and ensures the output matches the original audio length.
@@ -214,7 +317,7 @@ class SpeechModel:
             output_audios_np = np.array(output_audios)
         return output_audios_np
 
-    def process(self, input_path, online_write=False, output_path=None):
+    def process(self, input_path, online_write=False, output_path=None, streaming=False, cache_dir=None):
         """
         Load and process audio files from the specified input path. Optionally, 
         write the output audio files to the specified output directory.
@@ -224,6 +327,12 @@ class SpeechModel:
             online_write (bool): Whether to write the processed audio to disk in real-time.
             output_path (str): Optional path for writing output files. If None, output 
                                will be stored in self.result.
+            streaming (bool): With online_write, read, decode and write long files block by block
+                              so memory doesn't grow with the file length. Files or models that
+                              can't be streamed go through the normal path.
+            cache_dir (str): Directory of the on-disk result cache, overriding result_cache_dir
+                             in the config. Files whose outputs are cached skip decoding and
+                             the model entirely.
         
         Returns:
             dict or ndarray: Processed audio results either as a dictionary or as a single array, 
@@ -253,44 +362,103 @@ class SpeechModel:
             assert online_write == True
             process_tse(self.args, self.model, self.device, data_reader, output_wave_dir)
         else:
-            # Disable gradient calculation for better efficiency during inference
-            with torch.no_grad():
-                for idx in tqdm(range(num_samples)):  # Loop over all audio samples
-                    self.data = {}
-                    # Read the audio, waveform ID, and audio length from the data reader
-                    input_audio, wav_id, input_len, scalars, audio_info = data_reader[idx]
-                    # Store the input audio and metadata in self.data
-                    self.data['audio'] = input_audio
-                    self.data['id'] = wav_id
-                    self.data['audio_len'] = input_len
-                    self.data.update(audio_info)
-                    
-                    # Perform the audio decoding/processing
-                    output_audios = self.decode()
-
-                    # Perform audio renormalization
-                    if not isinstance(output_audios, list):
-                        if len(scalars) > 1:
-                            for i in range(len(scalars)):
-                                output_audios[:,i] = output_audios[:,i] * scalars[i]
+            indices = range(num_samples)
+            if streaming and online_write:
+                # Long files are streamed straight to disk, the rest go through the pipeline below
+                indices = []
+                for idx in tqdm(range(num_samples)):
+                    input_file = data_reader.file_list[idx]
+                    output_file = os.path.join(output_wave_dir, input_file.split('/')[-1])
+                    if not decode_file_streaming(self.model, self.device, self.args, input_file, output_file):
+                        indices.append(idx)
+
+            # Files are read ahead by a pool of readers and written by a pool of writers,
+            # so the model stage doesn't sit idle during decoding, resampling and encoding
+            timer = StageTimer()
+            writer = BoundedExecutor(self.args.num_write_workers) if online_write else None
+            cache = None
+            cache_dir = cache_dir or getattr(self.args, 'result_cache_dir', None)
+            if cache_dir:
+                cache = ResultCache(cache_dir, self.name, self.args,
+                                    int(getattr(self.args, 'result_cache_size', 10.0) * 1024 ** 3))
+
+            def read(idx):
+                # Returns the cache key with either the cached outputs or the decoded input
+                with timer.stage('read'):
+                    key = None
+                    if cache is not None:
+                        key = cache.key(data_reader.file_list[idx])
+                        cached = cache.get(key)
+                        if cached is not None:
+                            return key, cached, data_reader.file_list[idx].split('/')[-1]
+                    return key, None, data_reader[idx]
+
+            def write(output_file, spk, output_audios, data):
+                with timer.stage('write'):
+                    self.write_audio(output_file, key=None, spk=spk, audio=output_audios, data=data)
+
+            try:
+                samples = prefetch_map(read, indices, self.args.num_read_workers)
+                # Disable gradient calculation for better efficiency during inference
+                with torch.no_grad():
+                    for _ in tqdm(range(len(indices))):  # Loop over all audio samples
+                        with timer.waiting('read'):
+                            key, cached, sample = next(samples)
+                        self.data = {}
+                        if cached is not None:
+                            # Cache hit, the outputs come with the metadata of the input they were made from
+                            output_audios, audio_info = cached
+                            wav_id = sample
+                            self.data['id'] = wav_id
+                            self.data.update(audio_info)
                         else:
-                            output_audios = output_audios * scalars[0]
-                        
-                    if online_write:
-                        # If online writing is enabled, save the output audio to files
-                        if isinstance(output_audios, list):
-                            # In case of multi-speaker output, save each speaker's output separately
-                            for spk in range(self.args.num_spks):
-                                output_file = os.path.join(output_wave_dir, wav_id.replace('.'+self.data['ext'], f'_s{spk+1}.'+self.data['ext']))
-                                self.write_audio(output_file, key=None, spk=spk, audio=output_audios)
+                            # Read the audio, waveform ID, and audio length from the data reader
+                            input_audio, wav_id, input_len, scalars, audio_info = sample
+                            # Store the input audio and metadata in self.data
+                            self.data['audio'] = input_audio
+                            self.data['id'] = wav_id
+                            self.data['audio_len'] = input_len
+                            self.data.update(audio_info)
+
+                            with timer.stage('model'):
+                                # Perform the audio decoding/processing
+                                output_audios = self.decode()
+
+                                # Perform audio renormalization
+                                if not isinstance(output_audios, list):
+                                    if len(scalars) > 1:
+                                        for i in range(len(scalars)):
+                                            output_audios[:,i] = output_audios[:,i] * scalars[i]
+                                    else:
+                                        output_audios = output_audios * scalars[0]
+
+                            if cache is not None:
+                                with timer.stage('cache'):
+                                    cache.put(key, output_audios, audio_info)
+
+                        if online_write:
+                            # If online writing is enabled, hand the output audio to the writers
+                            with timer.waiting('write'):
+                                if isinstance(output_audios, list):
+                                    # In case of multi-speaker output, save each speaker's output separately
+                                    for spk in range(self.args.num_spks):
+                                        output_file = os.path.join(output_wave_dir, wav_id.replace('.'+self.data['ext'], f'_s{spk+1}.'+self.data['ext']))
+                                        writer.submit(write, output_file, spk, output_audios, self.data)
+                                else:
+                                    # Single-speaker or standard output
+                                    output_file = os.path.join(output_wave_dir, wav_id)
+                                    writer.submit(write, output_file, None, output_audios, self.data)
                         else:
-                            # Single-speaker or standard output
-                            output_file = os.path.join(output_wave_dir, wav_id)
-                            self.write_audio(output_file, key=None, spk=None, audio=output_audios)
-                    else:
-                        # If not writing to disk, store the output in the result dictionary
-                        self.result[wav_id] = output_audios
-            
+                            # If not writing to disk, store the output in the result dictionary
+                            self.result[wav_id] = output_audios
+            finally:
+                if writer is not None:
+                    with timer.waiting('write'):
+                        writer.close()
+            timer.report(f'{self.name} stage timings ({len(indices)} files)')
+            if cache is not None:
+                cache.report()
+
             # Return the processed results if not writing to disk
             if not online_write:
                 if len(self.result) == 1:
@@ -302,20 +470,12 @@ class SpeechModel:
 
     def process_wav_bytes_directly_se(self, wav_bytes):
         with torch.no_grad():
-            did16 = False
-            MAX_WAV_VALUE_16B = 32768.0
-            MAX_WAV_VALUE_32B = 2147483648.0
             self.data = {}
 
             # Prepare the bytes so they're in the format the tensor needs
             data = np.frombuffer(wav_bytes, dtype=np.int16)
-            if max(data) > MAX_WAV_VALUE_16B:
-                audio_np = data / MAX_WAV_VALUE_32B
-            else:
-                did16 = True
-                audio_np = data / MAX_WAV_VALUE_16B
-
-            audio_np = audio_np.astype(np.float32)
+            scale = pcm_scale(data)
+            audio_np = (data / scale).astype(np.float32)
 
             # Reshape the data to ensure it's in the format [1, data_length].
             old_shape_0 = audio_np.shape[0]
@@ -329,12 +489,54 @@ class SpeechModel:
             output_audios = self.decode()
 
             output_audios = np.reshape(output_audios, (old_shape_0,))
-            output_audios = output_audios * MAX_WAV_VALUE_16B if did16 else output_audios * MAX_WAV_VALUE_32B
+            output_audios = output_audios * scale
             output_audios = output_audios.astype(np.int16)
                 
             return output_audios
 
-    def write_audio(self, output_path, key=None, spk=None, audio=None):
+    def process_wav_bytes_batch_se(self, wav_bytes_list):
+        """
+        Enhances several chunks of 16-bit PCM bytes at once.
+
+        For MossFormerGAN_SE_16K the chunks are stacked into a single [B, T] batch and run
+        through one STFT and model forward. Other models don't support batched decoding yet,
+        so their chunks are processed one at a time.
+
+        Args:
+            wav_bytes_list (list of bytes): Chunks of mono 16-bit PCM audio.
+
+        Returns:
+            list of numpy.ndarray: The enhanced int16 audio for each chunk, in input order.
+        """
+        if self.args.network != 'MossFormerGAN_SE_16K':
+            return [self.process_wav_bytes_directly_se(wav_bytes) for wav_bytes in wav_bytes_list]
+
+        with torch.no_grad():
+            audios = [np.frombuffer(wav_bytes, dtype=np.int16).astype(np.float32) / MAX_WAV_VALUE for wav_bytes in wav_bytes_list]
+            output_audios = decode_batch_audio_mossformergan_se_16k(self.model, self.device, audios, self.args)
+            return [(output_audio * MAX_WAV_VALUE).astype(np.int16) for output_audio in output_audios]
+
+    def stream_session(self, **kwargs):
+        """
+        Creates a stateful streaming session for live enhancement. Only MossFormerGAN_SE_16K
+        supports streaming for now.
+
+        Args:
+            **kwargs: Streaming options (block_ms, context_ms, lookahead_ms, norm_decay)
+                      forwarded to MossFormerGANStreamer.
+
+        Returns:
+            MossFormerGANStreamer: An object whose push(pcm) returns enhanced pcm, or None
+                                   if the model doesn't support streaming.
+        """
+        if self.args.network != 'MossFormerGAN_SE_16K':
+            print(f'Streaming is not supported for {self.name}, please use MossFormerGAN_SE_16K')
+            return None
+
+        from clearvoice.utils.stream_decode import MossFormerGANStreamer
+        return MossFormerGANStreamer(self.model, self.device, self.args, **kwargs)
+
+    def write_audio(self, output_path, key=None, spk=None, audio=None, data=None):
         """
         This function writes an audio signal to an output file, applying necessary transformations
         such as resampling, channel handling, and format conversion based on the provided parameters
@@ -348,7 +550,12 @@ class SpeechModel:
                                  audio from a multi-speaker dataset or result.
             audio (numpy.ndarray, optional): A numpy array containing the audio data to be written.
                                  If provided, key and spk are ignored.
+            data (dict, optional): The metadata (sample rate, channels, sample width, extension)
+                                 of the input the audio came from. Defaults to self.data, writer
+                                 threads pass the metadata of their own file.
         """
+        if data is None:
+            data = self.data
         
         if audio is not None:
             if spk is not None:
@@ -361,29 +568,30 @@ class SpeechModel:
             else:
                 result_ = self.result[key]
                 
-        if self.data['sample_rate'] != self.args.sampling_rate:
-            if self.data['channels'] == 2:
-                left_channel = librosa.resample(result_[0,:], orig_sr=self.args.sampling_rate, target_sr=self.data['sample_rate'])
-                right_channel = librosa.resample(result_[1,:], orig_sr=self.args.sampling_rate, target_sr=self.data['sample_rate'])
-                result = np.vstack((left_channel, right_channel)).T
-            else:
-                result = librosa.resample(result_[0,:], orig_sr=self.args.sampling_rate, target_sr=self.data['sample_rate'])
+        if data['sample_rate'] != self.args.sampling_rate:
+            with stage('resample'):
+                if data['channels'] == 2:
+                    left_channel = librosa.resample(result_[0,:], orig_sr=self.args.sampling_rate, target_sr=data['sample_rate'])
+                    right_channel = librosa.resample(result_[1,:], orig_sr=self.args.sampling_rate, target_sr=data['sample_rate'])
+                    result = np.vstack((left_channel, right_channel)).T
+                else:
+                    result = librosa.resample(result_[0,:], orig_sr=self.args.sampling_rate, target_sr=data['sample_rate'])
         else:
-            if self.data['channels'] == 2:
+            if data['channels'] == 2:
                 left_channel = result_[0,:]
                 right_channel = result_[1,:]
                 result = np.vstack((left_channel, right_channel)).T
             else:
                 result = result_[0,:]
                 
-        if self.data['sample_width'] == 4: ##32 bit float
+        if data['sample_width'] == 4: ##32 bit float
             MAX_WAV_VALUE = 2147483648.0
             np_type = np.int32
-        elif self.data['sample_width'] == 2: ##16 bit int
+        elif data['sample_width'] == 2: ##16 bit int
             MAX_WAV_VALUE = 32768.0
             np_type = np.int16
         else:
-            self.data['sample_width'] = 2 ##16 bit int
+            data['sample_width'] = 2 ##16 bit int
             MAX_WAV_VALUE = 32768.0
             np_type = np.int16
                         
@@ -391,12 +599,13 @@ class SpeechModel:
         result = result.astype(np_type)
         audio_segment = AudioSegment(
             result.tobytes(),  # Raw audio data as bytes
-            frame_rate=self.data['sample_rate'],  # Sample rate
-            sample_width=self.data['sample_width'],          # No. bytes per sample
-            channels=self.data['channels']               # No. channels
+            frame_rate=data['sample_rate'],  # Sample rate
+            sample_width=data['sample_width'],          # No. bytes per sample
+            channels=data['channels']               # No. channels
         )
-        audio_format = 'ipod' if self.data['ext'] in ['m4a', 'aac'] else self.data['ext']
-        audio_segment.export(output_path, format=audio_format)
+        audio_format = 'ipod' if data['ext'] in ['m4a', 'aac'] else data['ext']
+        with stage('io'):
+            audio_segment.export(output_path, format=audio_format)
                     
     def write(self, output_path, add_subdir=False, use_key=False):
         """
@@ -487,6 +696,9 @@ class CLS_FRCRN_SE_16K(SpeechModel):
         
         # Set the model to evaluation mode (no gradient calculation)
         self.model.eval()
+        self.apply_precision()
+        self.apply_backend()
+        self.apply_compile()
 
 class CLS_MossFormer2_SE_48K(SpeechModel):
     """
@@ -517,6 +729,9 @@ class CLS_MossFormer2_SE_48K(SpeechModel):
         
         # Set the model to evaluation mode (no gradient calculation)
         self.model.eval()
+        self.apply_precision()
+        self.apply_backend()
+        self.apply_compile()
 
 class CLS_MossFormer2_SR_48K(SpeechModel):
     """
@@ -534,10 +749,11 @@ class CLS_MossFormer2_SR_48K(SpeechModel):
         # Import the MossFormer2 speech enhancement model for 48 kHz
         from clearvoice.models.mossformer2_sr.mossformer2_sr_wrapper import MossFormer2_SR_48K
         
-        # Initialize the model
+        # Initialize the model, both stages come from the same wrapper
+        sr_model = MossFormer2_SR_48K(args)
         self.model = nn.ModuleList()
-        self.model.append(MossFormer2_SR_48K(args).model_m)
-        self.model.append(MossFormer2_SR_48K(args).model_g)
+        self.model.append(sr_model.model_m)
+        self.model.append(sr_model.model_g)
         self.name = 'MossFormer2_SR_48K'
         
         # Load pre-trained model checkpoint
@@ -552,6 +768,9 @@ class CLS_MossFormer2_SR_48K(SpeechModel):
         for model in self.model:
             model.eval()
         self.model[1].remove_weight_norm()
+        self.apply_precision()
+        self.apply_backend()
+        self.apply_compile()
 
 class CLS_MossFormerGAN_SE_16K(SpeechModel):
     """
@@ -582,6 +801,9 @@ class CLS_MossFormerGAN_SE_16K(SpeechModel):
         
         # Set the model to evaluation mode (no gradient calculation)
         self.model.eval()
+        self.apply_precision()
+        self.apply_backend()
+        self.apply_compile()
 
 class CLS_MossFormer2_SS_16K(SpeechModel):
     """
@@ -612,6 +834,9 @@ class CLS_MossFormer2_SS_16K(SpeechModel):
         
         # Set the model to evaluation mode (no gradient calculation)
         self.model.eval()
+        self.apply_precision()
+        self.apply_backend()
+        self.apply_compile()
 
 class CLS_AV_MossFormer2_TSE_16K(SpeechModel):
     """
@@ -643,3 +868,6 @@ class CLS_AV_MossFormer2_TSE_16K(SpeechModel):
         
         # Set the model to evaluation mode (no gradient calculation)
         self.model.eval()
+        self.apply_precision()
+        self.apply_backend()
+        self.apply_compile()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python -u
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import warnings
+import torch
+import torch.nn as nn
+from clearvoice.utils.result_cache import DECODE_PARAMS, checkpoint_identity
+
+# Networks called as model(x) with a fixed input shape per decoding window. SR runs two models
+# with a mel frontend in between and TSE needs the video frames, so both stay eager
+COMPILED_NETWORKS = ['FRCRN_SE_16K', 'MossFormerGAN_SE_16K', 'MossFormer2_SE_48K', 'MossFormer2_SS_16K']
+
+# Directory of the compiled artifacts, inside the checkpoint directory
+COMPILED_DIR = 'compiled'
+
+def example_input(args, seconds, batch_size=1):
+    """Returns a model input for `seconds` of audio, as the decoding functions build it.
+
+    Args:
+        args (Namespace): The model's config.
+        seconds (float): Length of the audio.
+        batch_size (int): Number of windows in the batch.
+    """
+    samples = int(args.sampling_rate * seconds)
+    generator = torch.Generator().manual_seed(0)
+    if args.network == 'MossFormerGAN_SE_16K':
+        # Compressed spectrum of SpectralFrontend, centered frames before the frequencies
+        frames = samples // args.win_inc + 1
+        return torch.randn(batch_size, 2, frames, args.fft_len // 2 + 1, generator=generator)
+    if args.network == 'MossFormer2_SE_48K':
+        # Filter banks with their first and second-order deltas
+        frames = 1 + (samples - args.win_len) // args.win_inc
+        return torch.randn(batch_size, frames, 3 * args.num_mels, generator=generator)
+    return torch.randn(batch_size, samples, generator=generator) * 0.1  # Waveforms
+
+def compile_shapes(args):
+    """The input shapes worth compiling: the decoding window, at the decode batch size and alone,
+    and any extra lengths in args.compile_seconds."""
+    seconds = [args.decode_window] + list(getattr(args, 'compile_seconds', None) or [])
+    batch_sizes = sorted({1, getattr(args, 'decode_batch_size', 1)}, reverse=True)
+    return [(length, batch_size) for length in dict.fromkeys(seconds) for batch_size in batch_sizes]
+
+def artifact_digest(args, **identity):
+    """A digest of the checkpoint, the decode config, the torch version and `identity`, which
+    names an artifact derived from the model so a stale one is never loaded."""
+    config = {name: getattr(args, name) for name in DECODE_PARAMS if hasattr(args, name)}
+    identity.update(checkpoint=checkpoint_identity(args.checkpoint_dir), config=config,
+                    torch_version=torch.__version__)
+    return hashlib.sha256(json.dumps(identity, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+def artifact_path(args, device, shape):
+    """The artifact of a model for one input shape, keyed by everything the trace depends on."""
+    digest = artifact_digest(args, shape=list(shape), device=device.type)
+    name = f"{args.network}_{'x'.join(str(size) for size in shape)}_{digest}.pt"
+    return os.path.join(args.checkpoint_dir, COMPILED_DIR, name)
+
+def _tensors(output):
+    if isinstance(output, torch.Tensor):
+        return [output]
+    if isinstance(output, (list, tuple)):
+        return [tensor for item in output for tensor in _tensors(item)]
+    return []
+
+def trace_model(model, example):
+    """Traces and freezes model for the shape of example. Returns None if it can't be traced or
+    the traced outputs don't match the eager ones."""
+    try:
+        with torch.no_grad(), warnings.catch_warnings():
+            # The tracer warns about every Python branch on a tensor, the comparison below checks the result
+            warnings.simplefilter('ignore')
+            traced = torch.jit.trace(model, example, strict=False, check_trace=False)
+            traced = torch.jit.freeze(traced.eval())
+            expected, actual = _tensors(model(example)), _tensors(traced(example))
+    except Exception as e:
+        print(f'Tracing failed, running eager: {e}')
+        return None
+    if len(expected) != len(actual) or not all(
+            e.shape == a.shape and torch.allclose(e, a, rtol=1e-3, atol=1e-4) for e, a in zip(expected, actual)):
+        print('Traced outputs differ from eager, running eager')
+        return None
+    return traced
+
+class CompiledModel(nn.Module):
+    """Runs a compiled artifact when the input has the shape it was traced for, and the eager
+    model otherwise. Other attributes, e.g. FRCRN's inference(), come from the eager model.
+
+    Args:
+        model (nn.Module): The eager model.
+        artifacts (dict): Compiled modules keyed by input shape.
+    """
+
+    def __init__(self, model, artifacts):
+        super().__init__()
+        self.model = model
+        self.artifacts = artifacts
+
+    def __getattr__(self, name):
+        try:
+            return super().__getattr__(name)
+        except AttributeError:
+            return getattr(super().__getattr__('model'), name)
+
+    def forward(self, x):
+        artifact = self.artifacts.get(tuple(x.shape))
+        if artifact is None:
+            return self.model(x)
+        return artifact(x)
+
+def load_compiled_model(model, args, device):
+    """Wraps model with compiled artifacts for the shapes of compile_shapes(args).
+
+    Artifacts are loaded from the checkpoint directory, or traced and saved there the first time.
+    Shapes that fail to trace run eager, and the model itself is returned if none succeed.
+
+    Args:
+        model (nn.Module): The loaded model, in eval mode and on its device.
+        args (Namespace): The model's config.
+        device (torch.device): The device the model runs on.
+    """
+    artifacts = {}
+    for seconds, batch_size in compile_shapes(args):
+        example = example_input(args, seconds, batch_size).to(device)
+        shape = tuple(example.shape)
+        path = artifact_path(args, device, shape)
+        artifact = None
+        if os.path.isfile(path):
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', FutureWarning)
+                    artifact = torch.jit.load(path, map_location=device)
+            except Exception as e:
+                print(f'Ignoring the compiled artifact {path}: {e}')
+        if artifact is None:
+            artifact = trace_model(model, example)
+            if artifact is not None:
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    temp_path = f'{path}.{os.getpid()}.tmp'
+                    with warnings.catch_warnings():
+                        warnings.simplefilter('ignore', FutureWarning)
+                        torch.jit.save(artifact, temp_path)
+                    os.replace(temp_path, path)
+                except OSError as e:
+                    print(f'Could not save the compiled artifact: {e}')
+        if artifact is not None:
+            artifacts[shape] = artifact
+
+    if not artifacts:
+        return model
+    print(f"{args.network}: compiled for input shapes {', '.join(str(list(shape)) for shape in artifacts)}")
+    return CompiledModel(model, artifacts).eval()
@@ -7,14 +7,19 @@ from __future__ import division
 from __future__ import print_function
 import torch 
 import numpy as np
-import torchaudio
-from clearvoice.utils.misc import power_compress, power_uncompress, stft, istft, compute_fbank
+from clearvoice.utils.misc import stft, istft, get_spectral_frontend
 from clearvoice.utils.bandwidth_sub import bandwidth_sub
-from clearvoice.dataloader.meldataset import mel_spectrogram
+from clearvoice.utils.feature_plans import DitherNoise, SlidingFeatureBuffer, get_fbank_plan, get_mel_plan
+from clearvoice.utils.stage_timer import stage
 
 # Constant for normalizing audio values
 MAX_WAV_VALUE = 32768.0
 
+def _network(model, *inputs):
+    """Calls model on inputs, timed as the 'network' stage."""
+    with stage('network'):
+        return model(*inputs)
+
 def decode_one_audio(model, device, inputs, args):
     """Decodes audio using the specified model based on the provided network type.
 
@@ -45,6 +50,200 @@ def decode_one_audio(model, device, inputs, args):
         print("No network found!")  # Print error message if no valid network is specified
         return 
 
+def decode_sliding_windows(inputs, window, stride, forward_fn, batch_size=1, give_up_length=None, align_last=False, keep_tail=False):
+    """Decodes a long 1-D signal window by window, several windows per forward pass.
+
+    The input is unfolded into a [num_windows, window] view with windows starting every
+    `stride` samples, and the windows are passed to `forward_fn` in batches of `batch_size`.
+    The results are stitched back together like the original one-window-at-a-time loops:
+    the first `give_up_length` and last `give_up_length` samples of each window are dropped
+    (except at the very start), and every output sample is taken from the latest window that
+    still covers it. Stitching is done with index arrays per batch, so only one batch of
+    window outputs is held in memory at a time.
+
+    Args:
+        inputs (torch.Tensor): The signal of shape (T,), already padded as needed.
+        window (int): Window length in samples.
+        stride (int): Distance between window starts in samples.
+        forward_fn (callable): Called as forward_fn(windows, starts) with a (B, window) tensor
+                               and a list of the B window start indices. Returns a tensor or
+                               array of shape (B, window) or (B, C, window).
+        batch_size (int): Number of windows per forward pass.
+        give_up_length (int): Samples dropped at each window edge. Defaults to (window - stride) // 2.
+        align_last (bool): If the grid of windows doesn't end exactly at T, add one more window
+                           ending at T, as the AV TSE decoder does.
+        keep_tail (bool): Keep the right edge of the last window instead of giving it up.
+
+    Returns:
+        numpy.ndarray: The stitched output of shape (T,) or (C, T). Samples no window
+                       contributes to are left at zero.
+    """
+    if give_up_length is None:
+        give_up_length = (window - stride) // 2
+    batch_size = max(1, int(batch_size))
+    t = inputs.shape[-1]
+
+    windows = inputs.unfold(-1, window, stride)  # (num_windows, window) view, no copy
+    starts = [i * stride for i in range(windows.shape[0])]
+    if align_last and (not starts or starts[-1] + window < t):
+        starts.append(t - window)
+    num_windows = len(starts)
+
+    # Window k owns the output samples from its own region start up to the next window's
+    region_starts = np.array(starts) + give_up_length
+    region_starts[0] = 0
+    covered = starts[-1] + (window if keep_tail else window - give_up_length)
+
+    outputs = None
+    for first in range(0, num_windows, batch_size):
+        last = min(num_windows, first + batch_size)
+        if last > windows.shape[0]:
+            # The extra window added by align_last isn't part of the unfolded grid
+            batch = torch.cat([windows[first:last - 1], inputs[-window:].unsqueeze(0)], dim=0)
+        else:
+            batch = windows[first:last]
+
+        batch_out = forward_fn(batch, starts[first:last])
+        if isinstance(batch_out, torch.Tensor):
+            batch_out = batch_out.detach().cpu().numpy()
+        batch_out = np.reshape(batch_out, [last - first, -1, batch_out.shape[-1]])  # (B, C, window)
+
+        if outputs is None:
+            outputs = np.zeros((batch_out.shape[1], t), dtype=batch_out.dtype)
+
+        # Pick, for every output sample in this batch's span, the window and offset it comes from
+        begin = region_starts[first]
+        end = covered if last == num_windows else region_starts[last]
+        positions = np.arange(begin, end)
+        owners = np.searchsorted(region_starts, positions, side='right') - 1
+        offsets = positions - np.array(starts)[owners]
+        outputs[:, begin:end] = batch_out[owners - first, :, offsets].T
+
+    return outputs[0] if outputs.shape[0] == 1 else outputs
+
+def window_forward_fn(model, device, args, norm_factor=None):
+    """Returns the forward_fn used to decode a batch of windows for the speech enhancement networks.
+
+    Args:
+        model (nn.Module): The trained model used for decoding.
+        device (torch.device): The device (CPU or GPU) for computation.
+        args (Namespace): Contains arguments for network configuration.
+        norm_factor (torch.Tensor): MossFormerGAN_SE_16K only, the normalization factor of the
+                                    whole input, which every window is scaled by.
+
+    Returns:
+        callable: forward_fn(windows, starts) as expected by decode_sliding_windows, or None
+                  if the network has no windowed enhancement path.
+    """
+    if args.network == 'FRCRN_SE_16K':
+        # model.inference only returns the first item, the forward pass keeps the whole batch
+        return lambda windows, starts: _network(model, windows.to(device))[1]
+    elif args.network == 'MossFormerGAN_SE_16K':
+        return lambda windows, starts: _decode_one_audio_mossformergan_se_16k(
+            model, device, windows.to(device), norm_factor.reshape(-1)[:1].expand(windows.shape[0]), args)
+    elif args.network == 'MossFormer2_SE_48K':
+        # One buffer per signal, consecutive windows share their overlapping feature frames
+        features = SlidingFeatureBuffer(args, dither_seed=getattr(args, 'dither_seed', None))
+        return lambda windows, starts: _decode_windows_mossformer2_se_48k(
+            model, device, windows, args, features.extract(windows, starts))
+    return None
+
+class StreamingWindowDecoder:
+    """Incremental version of decode_sliding_windows for signals that don't fit in memory.
+
+    Samples are pushed in blocks of any size. As soon as `batch_size` more windows are
+    complete they are decoded, and the output samples no later window can overwrite are
+    returned. Only the input needed by the next windows is kept, so memory stays at about
+    window + batch_size * stride samples no matter how long the signal is.
+
+    Args:
+        window (int): Window length in samples.
+        stride (int): Distance between window starts in samples.
+        forward_fn (callable): As for decode_sliding_windows, returning (B, window).
+        batch_size (int): Number of windows per forward pass.
+        give_up_length (int): Samples dropped at each window edge. Defaults to (window - stride) // 2.
+    """
+
+    def __init__(self, window, stride, forward_fn, batch_size=1, give_up_length=None):
+        self.window = window
+        self.stride = stride
+        self.forward_fn = forward_fn
+        self.batch_size = max(1, int(batch_size))
+        self.give_up_length = (window - stride) // 2 if give_up_length is None else give_up_length
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.buffer_start = 0  # Absolute index of buffer[0]
+        self.next_window = 0
+        self.received = 0
+
+    def _region_start(self, k):
+        return 0 if k == 0 else k * self.stride + self.give_up_length
+
+    def _available_windows(self):
+        if self.received < self.window:
+            return 0
+        return (self.received - self.window) // self.stride + 1
+
+    def _decode(self, num_windows, end=None):
+        """Decodes the next num_windows windows, returning the outputs of their regions up to `end`."""
+        first = self.next_window
+        starts = [(first + k) * self.stride for k in range(num_windows)]
+        views = np.lib.stride_tricks.sliding_window_view(self.buffer, self.window)
+        offset = starts[0] - self.buffer_start
+        batch = torch.from_numpy(np.array(views[offset:offset + (num_windows - 1) * self.stride + 1:self.stride]))
+
+        batch_out = self.forward_fn(batch, starts)
+        if isinstance(batch_out, torch.Tensor):
+            batch_out = batch_out.detach().cpu().numpy()
+        batch_out = np.reshape(batch_out, [num_windows, -1])
+
+        begin = self._region_start(first)
+        if end is None:
+            end = self._region_start(first + num_windows)
+        positions = np.arange(begin, end)
+        owners = np.minimum((positions - self.give_up_length) // self.stride, first + num_windows - 1)
+        owners = np.maximum(owners, first)
+        outputs = batch_out[owners - first, positions - owners * self.stride]
+
+        # Forget the input no later window reaches back to
+        self.next_window += num_windows
+        drop = self.next_window * self.stride - self.buffer_start
+        if drop > 0:
+            self.buffer = self.buffer[drop:]
+            self.buffer_start += drop
+        return outputs
+
+    def push(self, samples):
+        """Appends samples and returns the output samples that are final, as a 1-D array."""
+        self.buffer = np.concatenate([self.buffer, np.asarray(samples, dtype=np.float32)])
+        self.received += len(samples)
+
+        outputs = [np.zeros(0, dtype=np.float32)]
+        while self._available_windows() - self.next_window >= self.batch_size:
+            outputs.append(self._decode(self.batch_size))
+        return np.concatenate(outputs)
+
+    def finish(self):
+        """Zero-pads the signal so windows cover all of it, and returns the remaining output."""
+        total = self.received
+        # Every window whose region starts before the end is needed, the last one keeps its tail
+        needed = self.next_window
+        while self._region_start(needed) < total:
+            needed += 1
+        if needed == self.next_window:
+            return np.zeros(0, dtype=np.float32)
+
+        required = (needed - 1) * self.stride + self.window
+        if required > self.received:
+            self.buffer = np.concatenate([self.buffer, np.zeros(required - self.received, dtype=np.float32)])
+            self.received = required
+
+        outputs = [np.zeros(0, dtype=np.float32)]
+        while self.next_window < needed:
+            num_windows = min(self.batch_size, needed - self.next_window)
+            end = total if self.next_window + num_windows == needed else None
+            outputs.append(self._decode(num_windows, end))
+        return np.concatenate(outputs)
+
 def decode_one_audio_mossformer2_ss_16k(model, device, inputs, args):
     """Decodes audio using the MossFormer2 model for speech separation at 16kHz.
 
@@ -89,27 +288,17 @@ def decode_one_audio_mossformer2_ss_16k(model, device, inputs, args):
 
     # Process the inputs in segments if necessary
     if decode_do_segment:
-        outputs = np.zeros((args.num_spks, t))  # Initialize output array for each speaker
-        give_up_length = (window - stride) // 2  # Calculate length to give up at each segment
-        current_idx = 0  # Initialize current index for segmentation
-        while current_idx + window <= t:
-            tmp_input = inputs[:, current_idx:current_idx + window]  # Get segment input
-            tmp_out_list = model(tmp_input)  # Forward pass through the model
-            for spk in range(args.num_spks):
-                # Convert output for the current speaker to numpy
-                tmp_out_list[spk] = tmp_out_list[spk][0, :].detach().cpu().numpy()
-                if current_idx == 0:
-                    # For the first segment, use the whole segment minus the give-up length
-                    outputs[spk, current_idx:current_idx + window - give_up_length] = tmp_out_list[spk][:-give_up_length]
-                else:
-                    # For subsequent segments, account for the give-up length at both ends
-                    outputs[spk, current_idx + give_up_length:current_idx + window - give_up_length] = tmp_out_list[spk][give_up_length:-give_up_length]
-            current_idx += stride  # Move to the next segment
+        # Stack the speakers of each window into (B, num_spks, window)
+        def forward_fn(windows, starts):
+            return torch.stack(_network(model, windows)[:args.num_spks], dim=1)
+
+        outputs = decode_sliding_windows(inputs[0], window, stride, forward_fn, args.decode_batch_size)
+        outputs = np.reshape(outputs, [args.num_spks, -1])
         for spk in range(args.num_spks):
             out.append(outputs[spk, :])  # Append outputs for each speaker
     else:
         # If no segmentation is required, process the entire input
-        out_list = model(inputs)
+        out_list = _network(model, inputs)
         for spk in range(args.num_spks):
             out.append(out_list[spk][0, :].detach().cpu().numpy())  # Append output for each speaker
 
@@ -166,25 +355,12 @@ def decode_one_audio_frcrn_se_16k(model, device, inputs, args):
 
     # Process the inputs in segments if necessary
     if decode_do_segment:
-        outputs = np.zeros(t)  # Initialize the output array
-        give_up_length = (window - stride) // 2  # Calculate length to give up at each segment
-        current_idx = 0  # Initialize current index for segmentation
-
-        while current_idx + window <= t:
-            tmp_input = inputs[:, current_idx:current_idx + window]  # Get segment input
-            tmp_output = model.inference(tmp_input).detach().cpu().numpy()  # Inference on segment
-
-            # For the first segment, use the whole segment minus the give-up length
-            if current_idx == 0:
-                outputs[current_idx:current_idx + window - give_up_length] = tmp_output[:-give_up_length]
-            else:
-                # For subsequent segments, account for the give-up length
-                outputs[current_idx + give_up_length:current_idx + window - give_up_length] = tmp_output[give_up_length:-give_up_length]
-
-            current_idx += stride  # Move to the next segment
+        outputs = decode_sliding_windows(inputs[0], window, stride, window_forward_fn(model, device, args),
+                                         args.decode_batch_size)
     else:
         # If no segmentation is required, process the entire input
-        outputs = model.inference(inputs).detach().cpu().numpy()  # Inference on full input
+        with stage('network'):
+            outputs = model.inference(inputs).detach().cpu().numpy()  # Inference on full input
 
     return outputs  # Return the decoded audio output
 
@@ -224,27 +400,54 @@ def decode_one_audio_mossformergan_se_16k(model, device, inputs, args):
 
     # Process the inputs in segments if necessary
     if decode_do_segment:
-        outputs = np.zeros(t)  # Initialize the output array
-        give_up_length = (window - stride) // 2  # Calculate length to give up at each segment
-        current_idx = 0  # Initialize current index for segmentation
+        # The input isn't padded here, so a last window aligned to the end covers the tail
+        forward_fn = window_forward_fn(model, device, args, norm_factor)
+        return decode_sliding_windows(inputs[0], window, stride, forward_fn, args.decode_batch_size,
+                                      align_last=True, keep_tail=True)
+    else:
+        # If no segmentation is required, process the entire input
+        return _decode_one_audio_mossformergan_se_16k(model, device, inputs, norm_factor, args)  # Inference on full input
 
-        while current_idx + window <= t:
-            tmp_input = inputs[:, current_idx:current_idx + window]  # Get segment input
-            tmp_output = _decode_one_audio_mossformergan_se_16k(model, device, tmp_input, norm_factor, args)  # Inference on segment
+def decode_batch_audio_mossformergan_se_16k(model, device, inputs_list, args):
+    """Decodes several audio clips with the MossFormerGAN model, one forward pass per length.
 
-            # For the first segment, use the whole segment minus the give-up length
-            if current_idx == 0:
-                outputs[current_idx:current_idx + window - give_up_length] = tmp_output[:-give_up_length]
-            else:
-                # For subsequent segments, account for the give-up length
-                outputs[current_idx + give_up_length:current_idx + window - give_up_length] = tmp_output[give_up_length:-give_up_length]
+    Clips of the same length are stacked into a [B, T] batch, so the STFT, SyncANet forward and
+    iSTFT run once for all of them, and each clip comes out as if it was decoded alone. Clips of
+    different lengths are never padded into one batch: SyncANet's InstanceNorms and time
+    attentions span the whole sequence, so the padded frames would change every output. Clips
+    longer than `one_time_decode_length` would need segmented decoding, so in that case each
+    clip is decoded on its own instead.
 
-            current_idx += stride  # Move to the next segment
+    Args:
+        model (nn.Module): The trained MossFormerGAN model used for decoding.
+        device (torch.device): The device (CPU or GPU) for computation.
+        inputs_list (list of numpy.ndarray): 1-D float audio clips, which may differ in length.
+        args (Namespace): Contains arguments for decoding configuration.
 
-        return outputs  # Return the accumulated outputs from segments
-    else:
-        # If no segmentation is required, process the entire input
-        return _decode_one_audio_mossformergan_se_16k(model, device, inputs, norm_factor, args)  # Inference on full input
+    Returns:
+        list of numpy.ndarray: The enhanced clips, each trimmed back to its input length.
+    """
+    if max(len(inputs) for inputs in inputs_list) > args.sampling_rate * args.one_time_decode_length:
+        return [decode_one_audio_mossformergan_se_16k(model, device, np.reshape(inputs, [1, -1]), args) for inputs in inputs_list]
+
+    # Indices of the clips of each length
+    groups = {}
+    for i, inputs in enumerate(inputs_list):
+        groups.setdefault(len(inputs), []).append(i)
+
+    results = [None] * len(inputs_list)
+    for length, indices in groups.items():
+        batch = np.stack([np.asarray(inputs_list[i], dtype=np.float32) for i in indices])
+        inputs = torch.from_numpy(batch).to(device)
+
+        # Each clip keeps its own normalization factor
+        norm_factor = torch.sqrt(length / torch.sum((inputs ** 2.0), dim=-1))
+
+        outputs = _decode_one_audio_mossformergan_se_16k(model, device, inputs, norm_factor, args)
+        outputs = np.reshape(outputs, [len(indices), -1])
+        for row, i in enumerate(indices):
+            results[i] = outputs[row, :length]
+    return results
 
 @torch.no_grad()
 def _decode_one_audio_mossformergan_se_16k(model, device, inputs, norm_factor, args):
@@ -262,11 +465,12 @@ def _decode_one_audio_mossformergan_se_16k(model, device, inputs, norm_factor, a
         model (nn.Module): The trained MossFormerGAN model used for decoding.
         device (torch.device): The device (CPU or GPU) for computation.
         inputs (torch.Tensor): Input audio tensor of shape (B, T), where B is the batch size and T is the number of time steps.
-        norm_factor (torch.Tensor): A norm tensor to regularize input amplitude
+        norm_factor (torch.Tensor): A norm tensor of shape (B,) to regularize input amplitude
         args (Namespace): Contains arguments for STFT parameters and normalization.
 
     Returns:
         numpy.ndarray: The decoded audio output, which has been enhanced by the model.
+                       Shape (T,) for a single input, (B, T) for a batch.
     """
     input_len = inputs.size(-1)  # Get the length of the input audio
     nframe = int(np.ceil(input_len / args.win_inc))  # Calculate the number of frames based on window increment
@@ -280,27 +484,50 @@ def _decode_one_audio_mossformergan_se_16k(model, device, inputs, norm_factor, a
     inputs = torch.transpose(inputs, 0, 1)  # Change shape for STFT
     inputs = torch.transpose(inputs * norm_factor, 0, 1)  # Apply normalization factor and transpose back
 
-    # Perform Short-Time Fourier Transform (STFT) on the normalized inputs
-    inputs_spec = stft(inputs, args, center=True, periodic=True, onesided=True)
-    inputs_spec = inputs_spec.to(torch.float32)  # Ensure the spectrogram is in float32 format
-
-    # Compress the power of the spectrogram to improve model performance
-    inputs_spec = power_compress(inputs_spec).permute(0, 1, 3, 2)
+    # STFT of the normalized inputs with the power compressed to improve model performance,
+    # the frontend keeps the window for this device and config between calls
+    frontend = get_spectral_frontend(args, inputs.device)
+    with stage('stft'):
+        inputs_spec = frontend.compress_stft(inputs.to(torch.float32)).permute(0, 1, 3, 2)
 
     # Pass the compressed spectrogram through the model to get predicted real and imaginary parts
-    out_list = model(inputs_spec)
+    out_list = _network(model, inputs_spec)
     pred_real, pred_imag = out_list[0].permute(0, 1, 3, 2), out_list[1].permute(0, 1, 3, 2)
 
-    # Uncompress the predicted spectrogram to get the magnitude and phase
-    pred_spec_uncompress = power_uncompress(pred_real, pred_imag).squeeze(1)
+    # Uncompress the predicted spectrogram and convert back to time domain audio
+    with stage('istft'):
+        outputs = frontend.uncompress_istft(pred_real, pred_imag)
 
-    # Perform Inverse STFT (iSTFT) to convert back to time domain audio
-    outputs = istft(pred_spec_uncompress, args, center=True, periodic=True, onesided=True)
+    # Normalize the output audio by dividing each item by its normalization factor
+    outputs = outputs / norm_factor.unsqueeze(-1)
 
-    # Normalize the output audio by dividing by the normalization factor
-    outputs = outputs.squeeze(0) / norm_factor
+    return outputs[..., :input_len].squeeze(0).detach().cpu().numpy()  # Return the output as a numpy array
 
-    return outputs[:input_len].detach().cpu().numpy()  # Return the output as a numpy array
+@torch.no_grad()
+def _decode_windows_mossformer2_se_48k(model, device, windows, args, features=None):
+    """Enhances a batch of equal-length windows (B, T), scaled to the MAX_WAV_VALUE range, with MossFormer2_SE_48K.
+
+    `features` is the (fbanks, spectrum) pair of the windows from a SlidingFeatureBuffer. Without
+    it, filter banks, deltas and spectra are computed for all windows in one batched call. Then
+    all windows go through the model at once.
+    """
+    if features is None:
+        with stage('stft'):
+            fbanks = get_fbank_plan(args, windows.device, windows.dtype).fbank_with_deltas(windows)
+            spectrum = stft(windows, args)
+    else:
+        fbanks, spectrum = features
+    fbanks = fbanks.to(device)
+
+    # Pass filter banks through the model and get the predicted masks, (B, frames, F)
+    Out_List = _network(model, fbanks)
+    pred_mask = Out_List[-1].permute(0, 2, 1).unsqueeze(-1)
+
+    # Apply the masks to the spectra of the windows and reconstruct them
+    with stage('istft'):
+        masked_spec = spectrum * pred_mask.detach().cpu()
+        masked_spec_complex = masked_spec[..., 0] + 1j * masked_spec[..., 1]  # Convert to complex form
+        return istft(masked_spec_complex, args, windows.shape[-1])
 
 def decode_one_audio_mossformer2_se_48k(model, device, inputs, args):
     """Processes audio inputs through the MossFormer2 model for speech enhancement at 48kHz.
@@ -347,93 +574,44 @@ def decode_one_audio_mossformer2_se_48k(model, device, inputs, args):
                     inputs = np.concatenate([inputs, np.zeros(padding)], 0)
 
             audio = torch.from_numpy(inputs).type(torch.FloatTensor)  # Convert to Torch tensor
-            t = audio.shape[0]  # Update length after conversion
-            outputs = torch.from_numpy(np.zeros(t))  # Initialize output tensor
-            give_up_length = (window - stride) // 2  # Determine length to ignore at the edges
-            dfsmn_memory_length = 0  # Placeholder for potential memory length
-            current_idx = 0  # Initialize current index for sliding window
-
-            # Process audio in sliding window segments
-            while current_idx + window <= t:
-                # Select appropriate segment of audio for processing
-                if current_idx < dfsmn_memory_length:
-                    audio_segment = audio[0:current_idx + window]
-                else:
-                    audio_segment = audio[current_idx - dfsmn_memory_length:current_idx + window]
-
-                # Compute filter banks for the audio segment
-                fbanks = compute_fbank(audio_segment.unsqueeze(0), args)
-                
-                # Compute deltas for filter banks
-                fbank_tr = torch.transpose(fbanks, 0, 1)  # Transpose for delta computation
-                fbank_delta = torchaudio.functional.compute_deltas(fbank_tr)  # First-order delta
-                fbank_delta_delta = torchaudio.functional.compute_deltas(fbank_delta)  # Second-order delta
-                
-                # Transpose back to original shape
-                fbank_delta = torch.transpose(fbank_delta, 0, 1)
-                fbank_delta_delta = torch.transpose(fbank_delta_delta, 0, 1)
-
-                # Concatenate the original filter banks with their deltas
-                fbanks = torch.cat([fbanks, fbank_delta, fbank_delta_delta], dim=1)
-                fbanks = fbanks.unsqueeze(0).to(device)  # Add batch dimension and move to device
-
-                # Pass filter banks through the model
-                Out_List = model(fbanks)
-                pred_mask = Out_List[-1]  # Get the predicted mask from the output
-
-                # Apply STFT to the audio segment
-                spectrum = stft(audio_segment, args)
-                pred_mask = pred_mask.permute(2, 1, 0)  # Permute dimensions for masking
-                masked_spec = spectrum.cpu() * pred_mask.detach().cpu()  # Apply mask to the spectrum
-                masked_spec_complex = masked_spec[:, :, 0] + 1j * masked_spec[:, :, 1]  # Convert to complex form
-
-                # Reconstruct audio from the masked spectrogram
-                output_segment = istft(masked_spec_complex, args, len(audio_segment))
-
-                # Store the output segment in the output tensor
-                if current_idx == 0:
-                    outputs[current_idx:current_idx + window - give_up_length] = output_segment[:-give_up_length]
-                else:
-                    output_segment = output_segment[-window:]  # Get the latest window of output
-                    outputs[current_idx + give_up_length:current_idx + window - give_up_length] = output_segment[give_up_length:-give_up_length]
-                
-                current_idx += stride  # Move to the next segment
+
+            outputs = torch.from_numpy(
+                decode_sliding_windows(audio, window, stride, window_forward_fn(model, device, args), args.decode_batch_size))
 
     else:
         # Process the entire audio at once if it is shorter than the threshold
         audio = torch.from_numpy(inputs).type(torch.FloatTensor)
-        fbanks = compute_fbank(audio.unsqueeze(0), args)
 
-        # Compute deltas for filter banks
-        fbank_tr = torch.transpose(fbanks, 0, 1)
-        fbank_delta = torchaudio.functional.compute_deltas(fbank_tr)
-        fbank_delta_delta = torchaudio.functional.compute_deltas(fbank_delta)
-        fbank_delta = torch.transpose(fbank_delta, 0, 1)
-        fbank_delta_delta = torch.transpose(fbank_delta_delta, 0, 1)
-
-        # Concatenate the original filter banks with their deltas
-        fbanks = torch.cat([fbanks, fbank_delta, fbank_delta_delta], dim=1)
-        fbanks = fbanks.unsqueeze(0).to(device)  # Add batch dimension and move to device
+        # Filter banks concatenated with their first and second-order deltas, with a batch dimension
+        plan = get_fbank_plan(args)
+        with stage('stft'):
+            noise = None
+            if getattr(args, 'dither_seed', None) is not None:
+                noise = DitherNoise(plan.window_size, args.dither_seed).frames(0, plan.num_frames(len(audio))).unsqueeze(0)
+            fbanks = plan.fbank_with_deltas(audio.unsqueeze(0), noise=noise).to(device)
 
         # Pass filter banks through the model
-        Out_List = model(fbanks)
+        Out_List = _network(model, fbanks)
         pred_mask = Out_List[-1]  # Get the predicted mask
-        spectrum = stft(audio, args)  # Apply STFT to the audio
+        with stage('stft'):
+            spectrum = stft(audio, args)  # Apply STFT to the audio
         pred_mask = pred_mask.permute(2, 1, 0)  # Permute dimensions for masking
-        masked_spec = spectrum * pred_mask.detach().cpu()  # Apply mask to the spectrum
-        masked_spec_complex = masked_spec[:, :, 0] + 1j * masked_spec[:, :, 1]  # Convert to complex form
-        
-        # Reconstruct audio from the masked spectrogram
-        outputs = istft(masked_spec_complex, args, len(audio))
+        with stage('istft'):
+            masked_spec = spectrum * pred_mask.detach().cpu()  # Apply mask to the spectrum
+            masked_spec_complex = masked_spec[:, :, 0] + 1j * masked_spec[:, :, 1]  # Convert to complex form
+
+            # Reconstruct audio from the masked spectrogram
+            outputs = istft(masked_spec_complex, args, len(audio))
 
     return outputs.numpy() / MAX_WAV_VALUE  # Return the output normalized to [-1, 1]
 
 def get_mel(x, args):
     """
-    Calls mel_spectrogram() and returns the mel-spectrogram output
+    Returns the mel-spectrogram of x (B, T), the same as mel_spectrogram() but with the
+    filterbank and window of the feature plan for these settings
     """
     
-    return mel_spectrogram(x, args.n_fft, args.num_mels, args.sampling_rate, args.hop_size, args.win_size, args.fmin, args.fmax)
+    return get_mel_plan(args, x.device, x.dtype).mel(x)
     
 def decode_one_audio_mossformer2_sr_48k(model, device, inputs, args):
     """
@@ -488,41 +666,26 @@ def decode_one_audio_mossformer2_sr_48k(model, device, inputs, args):
                     inputs = np.concatenate([inputs, np.zeros(padding)], 0)
 
             audio = torch.from_numpy(inputs).type(torch.FloatTensor)  # Convert to Torch tensor
-            t = audio.shape[0]  # Update length after conversion
-            outputs = torch.from_numpy(np.zeros(t))  # Initialize output tensor
-            give_up_length = (window - stride) // 2  # Determine length to ignore at the edges
-            dfsmn_memory_length = 0  # Placeholder for potential memory length
-            current_idx = 0  # Initialize current index for sliding window
-
-            # Process audio in sliding window segments
-            while current_idx + window <= t:
-                # Select appropriate segment of audio for processing
-                if current_idx < dfsmn_memory_length:
-                    audio_segment = audio[0:current_idx + window]
-                else:
-                    audio_segment = audio[current_idx - dfsmn_memory_length:current_idx + window]
-
-                # Pass filter banks through the model
-                mel_segment = get_mel(audio_segment.unsqueeze(0), args)
-                mossformer_output_segment = model[0](mel_segment.to(device))
-                generator_output_segment = model[1](mossformer_output_segment)
-                generator_output_segment = generator_output_segment.squeeze()
-                offset = len(audio_segment) - len(generator_output_segment)
-                # Store the output segment in the output tensor
-                if current_idx == 0:
-                    outputs[current_idx:current_idx + window - give_up_length] = generator_output_segment[:-give_up_length+offset]
-                else:
-                    generator_output_segment = generator_output_segment[-window:]  # Get the latest window of output
-                    outputs[current_idx + give_up_length:current_idx + window - give_up_length] = generator_output_segment[give_up_length:-give_up_length+offset]
-                
-                current_idx += stride  # Move to the next segment
+
+            def forward_fn(windows, starts):
+                with stage('stft'):
+                    mel_segment = get_mel(windows, args)
+                mossformer_output_segment = _network(model[0], mel_segment.to(device))
+                generator_output_segment = _network(model[1], mossformer_output_segment).squeeze(1)
+                # The vocoder can come up a few samples short, the missing end is given up anyway
+                offset = windows.shape[-1] - generator_output_segment.shape[-1]
+                return torch.nn.functional.pad(generator_output_segment, (0, max(offset, 0)))[..., :windows.shape[-1]]
+
+            outputs = torch.from_numpy(
+                decode_sliding_windows(audio, window, stride, forward_fn, args.decode_batch_size))
 
     else:
         # Process the entire audio at once if it is shorter than the threshold
         audio = torch.from_numpy(inputs).type(torch.FloatTensor)
-        mel_input = get_mel(audio.unsqueeze(0), args)
-        mossformer_output = model[0](mel_input.to(device))
-        generator_output = model[1](mossformer_output)
+        with stage('stft'):
+            mel_input = get_mel(audio.unsqueeze(0), args)
+        mossformer_output = _network(model[0], mel_input.to(device))
+        generator_output = _network(model[1], mossformer_output)
         outputs = generator_output.squeeze()
 
     outputs = outputs.cpu().numpy()
@@ -567,36 +730,24 @@ def decode_one_audio_AV_MossFormer2_TSE_16K(model, inputs, args):
 
     if decode_do_segement:
         print('********')
-        outputs = np.zeros(t)  # Initialize output array
         window = args.sampling_rate * args.decode_window  # Window length for processing
         window_v = 25 * args.decode_window
         stride = int(window * 0.6)  # Decoding stride for segmenting the input
-        give_up_length = (window - stride) // 2  # Calculate length to give up at each segment
-        current_idx = 0  # Initialize current index for sliding window
-
-        # Process the audio in overlapping segments
-        while current_idx + window < t:
-            tmp_audio = audio[:, current_idx:current_idx + window]  # Select current audio segment
-
-            current_idx_v = int(current_idx/args.sampling_rate*25)  # Select current video segment index
-            tmp_video = visual[:, current_idx_v:current_idx_v + window_v, :, :] # Select current video segment
-            
-            tmp_output = model(tmp_audio, tmp_video).detach().squeeze().cpu().numpy()  # Apply model to the segment
-            
-            # For the first segment, use the whole segment minus the give-up length
-            if current_idx == 0:
-                outputs[current_idx:current_idx + window - give_up_length] = tmp_output[:-give_up_length]
-            else:
-                # For subsequent segments, account for the give-up length
-                outputs[current_idx + give_up_length:current_idx + window - give_up_length] = tmp_output[give_up_length:-give_up_length]
 
-            current_idx += stride  # Move to the next segment
+        def forward_fn(windows, starts):
+            # Cut the matching video segments out at 25 fps, the last window is aligned to the end
+            videos = []
+            for start in starts:
+                if start + window == t:
+                    videos.append(visual[0, -window_v:, :, :])
+                else:
+                    current_idx_v = int(start / args.sampling_rate * 25)
+                    videos.append(visual[0, current_idx_v:current_idx_v + window_v, :, :])
+            return model(windows, torch.stack(videos)).reshape(windows.shape[0], -1)
 
-        # Process the last window of audio
-        tmp_audio = audio[:, -window:]
-        tmp_video = visual[:, -window_v:, :, :]
-        tmp_output = model(tmp_audio, tmp_video).detach().squeeze().cpu().numpy()  # Apply model to the segment
-        outputs[-window + give_up_length:] = tmp_output[give_up_length:]
+        # The last window is aligned to the end of the audio and keeps its tail
+        outputs = decode_sliding_windows(audio[0], window, stride, forward_fn, args.decode_batch_size,
+                                         align_last=True, keep_tail=True)
     else:
         # Process the entire input at once if segmentation is not needed
         outputs = model(audio, visual).detach().squeeze().cpu().numpy()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python -u
+# -*- coding: utf-8 -*-
+
+import math
+import threading
+import librosa
+import torch
+import torch.nn.functional as F
+import torchaudio
+from clearvoice.dataloader.meldataset import spectral_normalize_torch
+from clearvoice.utils.stage_timer import stage
+
+# Kaldi's floor for log energies, torch.finfo(torch.float).eps
+KALDI_EPSILON = torch.finfo(torch.float).eps
+
+# Plans, keyed by (kind, sr, n_fft, n_mels, fmin, fmax, win, hop, device, dtype)
+_plans = {}
+_plans_lock = threading.Lock()
+
+def _get_plan(key, factory):
+    """Returns the plan stored under key, building it with factory() the first time.
+
+    Plans are read-only once built, so only creation needs the lock.
+    """
+    plan = _plans.get(key)
+    if plan is None:
+        with _plans_lock:
+            plan = _plans.get(key)
+            if plan is None:
+                plan = factory()
+                _plans[key] = plan
+    return plan
+
+def delta_kernel(win_length=5, device='cpu', dtype=torch.float32):
+    """The regression kernel of torchaudio.functional.compute_deltas, divided by its denominator."""
+    n = (win_length - 1) // 2
+    denom = n * (n + 1) * (2 * n + 1) / 3
+    return (torch.arange(-n, n + 1, device=device, dtype=dtype) / denom).view(1, 1, -1)
+
+def compute_deltas(features, kernel):
+    """Batched compute_deltas along the last axis of features (..., frames), with a prebuilt kernel."""
+    shape = features.shape
+    n = (kernel.shape[-1] - 1) // 2
+    features = F.pad(features.reshape(-1, 1, shape[-1]), (n, n), mode='replicate')
+    return F.conv1d(features, kernel).reshape(shape)
+
+class MelPlan:
+    """The log-mel spectrogram of meldataset.mel_spectrogram, with its filterbank and window built once.
+
+    Args:
+        sr (int): Sampling rate.
+        n_fft (int): FFT size.
+        n_mels (int): Number of mel bins.
+        fmin (float): Lowest mel frequency.
+        fmax (float): Highest mel frequency.
+        win_size (int): Window length in samples.
+        hop_size (int): Hop size in samples.
+        device (torch.device): The device the features are computed on.
+        dtype (torch.dtype): The data type of the signals.
+    """
+
+    def __init__(self, sr, n_fft, n_mels, fmin, fmax, win_size, hop_size, device='cpu', dtype=torch.float32):
+        self.n_fft = n_fft
+        self.win_size = win_size
+        self.hop_size = hop_size
+        mel = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels, fmin=fmin, fmax=fmax)
+        self.mel_basis = torch.from_numpy(mel).to(device=device, dtype=dtype)
+        self.window = torch.hann_window(win_size, device=device, dtype=dtype)
+
+    def mel(self, x):
+        """Returns the log-mel spectrogram (B, n_mels, frames) of a batch of signals x (B, T)."""
+        padding = int((self.n_fft - self.hop_size) / 2)
+        x = F.pad(x.unsqueeze(1), (padding, padding), mode='reflect').squeeze(1)
+        spec = torch.stft(x, self.n_fft, hop_length=self.hop_size, win_length=self.win_size, window=self.window,
+                          center=False, normalized=False, onesided=True, return_complex=True)
+        spec = torch.sqrt(spec.real ** 2 + spec.imag ** 2 + 1e-9)
+        return spectral_normalize_torch(torch.matmul(self.mel_basis, spec))
+
+class FbankPlan:
+    """Kaldi filter banks with first and second-order deltas, as compute_fbank plus compute_deltas.
+
+    torchaudio.compliance.kaldi.fbank takes one signal at a time and builds its window and mel
+    banks on every call. This does the same computation (snip_edges framing, DC removal,
+    pre-emphasis 0.97, power spectrum, log mel energies) for a whole batch of equal-length
+    signals, with the window, mel banks and delta kernel built once.
+
+    Args:
+        sr (int): Sampling rate.
+        win_len (int): Frame length in samples.
+        win_inc (int): Frame shift in samples.
+        n_mels (int): Number of mel bins.
+        win_type (str): Kaldi window type, 'hamming', 'hanning' or 'povey'.
+        device (torch.device): The device the features are computed on.
+        dtype (torch.dtype): The data type of the signals.
+    """
+
+    def __init__(self, sr, win_len, win_inc, n_mels, win_type, device='cpu', dtype=torch.float32):
+        # Same rounding as Kaldi, which gets the sizes back from milliseconds
+        self.window_size = int(sr * (win_len / sr * 1000) * 0.001)
+        self.window_shift = int(sr * (win_inc / sr * 1000) * 0.001)
+        self.padded_size = 1 << (self.window_size - 1).bit_length()
+        self.device = device
+        self.dtype = dtype
+
+        if win_type == 'hamming':
+            window = torch.hamming_window(self.window_size, periodic=False, alpha=0.54, beta=0.46, dtype=dtype)
+        elif win_type == 'hanning':
+            window = torch.hann_window(self.window_size, periodic=False, dtype=dtype)
+        elif win_type == 'povey':
+            window = torch.hann_window(self.window_size, periodic=False, dtype=dtype).pow(0.85)
+        else:
+            raise ValueError(f'Window type {win_type} is not supported')
+        self.window = window.to(device)
+
+        mel_banks, _ = torchaudio.compliance.kaldi.get_mel_banks(n_mels, self.padded_size, float(sr), 20.0, 0.0,
+                                                                 100.0, -500.0, 1.0)
+        # The banks leave out the Nyquist bin, which gets zero weight
+        self.mel_banks = F.pad(mel_banks, (0, 1)).to(device=device, dtype=dtype).T.contiguous()
+        self.delta_kernel = delta_kernel(device=device, dtype=dtype)
+        self.epsilon = torch.tensor(KALDI_EPSILON, device=device, dtype=dtype)
+
+    def num_frames(self, num_samples):
+        """Number of frames Kaldi's snip_edges framing gets out of num_samples samples."""
+        return max(0, 1 + (num_samples - self.window_size) // self.window_shift)
+
+    def fbank(self, x, dither=1.0, generator=None, noise=None):
+        """Returns the log mel filter banks (B, frames, n_mels) of a batch of signals x (B, T).
+
+        Args:
+            x (torch.Tensor): The signals, (B, T).
+            dither (float): Amplitude of the Gaussian dither added to every frame, as in Kaldi.
+            generator (torch.Generator): Random generator for the dither, the global one if None.
+            noise (torch.Tensor): Unit Gaussian noise (B, frames, window) to dither with instead
+                                  of drawing it, see DitherNoise.
+        """
+        frames = self.num_frames(x.shape[-1])
+        strided = x.unfold(-1, self.window_size, self.window_shift)[:, :frames]  # (B, frames, window)
+
+        if dither != 0.0:
+            if noise is None:
+                noise = torch.randn(strided.shape, generator=generator, dtype=strided.dtype)
+            strided = strided + noise.to(device=strided.device, dtype=strided.dtype) * dither
+        strided = strided - strided.mean(dim=-1, keepdim=True)  # Remove DC offset
+
+        # Pre-emphasis, the first sample of each frame is its own predecessor
+        previous = torch.cat([strided[..., :1], strided[..., :-1]], dim=-1)
+        strided = (strided - 0.97 * previous) * self.window
+
+        spectrum = torch.fft.rfft(strided, n=self.padded_size).abs().pow(2.0)
+        mel_energies = torch.matmul(spectrum, self.mel_banks)
+        return torch.max(mel_energies, self.epsilon).log()
+
+    def fbank_with_deltas(self, x, dither=1.0, generator=None, noise=None):
+        """Returns the filter banks with their first and second-order deltas, (B, frames, 3 * n_mels)."""
+        return self.add_deltas(self.fbank(x, dither, generator, noise))
+
+    def add_deltas(self, fbank):
+        """Appends the first and second-order deltas to filter banks (B, frames, n_mels)."""
+        fbank_tr = fbank.transpose(1, 2)  # Deltas are taken along the frames
+        fbank_delta = compute_deltas(fbank_tr, self.delta_kernel)
+        fbank_delta_delta = compute_deltas(fbank_delta, self.delta_kernel)
+        return torch.cat([fbank, fbank_delta.transpose(1, 2), fbank_delta_delta.transpose(1, 2)], dim=-1)
+
+class DitherNoise:
+    """Reproducible dither noise, indexed by the global frame number of the signal.
+
+    Noise is drawn in blocks of `block_frames` frames, each from a generator seeded with
+    (seed, block index), so a frame always gets the same noise however the signal is cut
+    into windows, and a run can be repeated exactly. With seed None, blocks come from the
+    global generator, which is random between runs but still consistent within one.
+
+    Args:
+        window_size (int): Frame length in samples.
+        seed (int): Base seed, or None.
+        block_frames (int): Number of frames drawn per block.
+    """
+
+    def __init__(self, window_size, seed=None, block_frames=64):
+        self.window_size = window_size
+        self.seed = seed
+        self.block_frames = block_frames
+        self.blocks = {}
+
+    def _block(self, index):
+        block = self.blocks.get(index)
+        if block is None:
+            generator = None
+            if self.seed is not None:
+                generator = torch.Generator().manual_seed(self.seed * 1000003 + index)
+            block = torch.randn(self.block_frames, self.window_size, generator=generator)
+            self.blocks[index] = block
+        return block
+
+    def frames(self, first, last):
+        """Returns the noise (last - first, window_size) of frames first to last - 1."""
+        first_block = first // self.block_frames
+        last_block = (last - 1) // self.block_frames + 1 if last > first else first_block
+        if last_block == first_block:
+            return torch.zeros(0, self.window_size)
+        noise = torch.cat([self._block(i) for i in range(first_block, last_block)])
+        offset = first_block * self.block_frames
+        return noise[first - offset:last - offset]
+
+    def forget(self, first):
+        """Drops the blocks that only hold frames before `first`."""
+        for index in [i for i in self.blocks if (i + 1) * self.block_frames <= first]:
+            del self.blocks[index]
+
+class SlidingFeatureBuffer:
+    """Incremental filter bank and STFT frames for overlapping windows of one signal (MossFormer2_SE_48K).
+
+    Consecutive decoding windows overlap (by 25% with the default stride), and when the stride
+    is a whole number of hops, a window's frames are exactly the frames of the whole signal
+    starting at start // hop. So the frames are computed once per signal position and kept in a
+    buffer that slides along with the windows, and each window only computes the frames of its
+    new samples. The deltas are still taken over each window's own frames, replicating its edge
+    frames like compute_deltas, which keeps the output identical to per-window extraction. They
+    cost little next to the FFTs.
+
+    Windows must be passed in order of their start. If a start doesn't line up with the hop or
+    goes backwards, the buffer starts over from that window.
+
+    Args:
+        args (Namespace): The SE 48K config (sampling_rate, win_len, win_inc, fft_len, num_mels, win_type).
+        dither (float): Dither amplitude of the filter banks.
+        dither_seed (int): Seed of the dither noise, see DitherNoise.
+    """
+
+    def __init__(self, args, dither=1.0, dither_seed=None):
+        from clearvoice.utils.misc import stft  # misc builds its plans from this module
+
+        self.args = args
+        self.stft = stft
+        self.plan = get_fbank_plan(args)
+        self.hop = args.win_inc
+        self.dither = dither
+        self.noise = DitherNoise(self.plan.window_size, dither_seed)
+        self.first_frame = 0  # Global index of the first buffered frame
+        self.fbank = torch.zeros(0, args.num_mels)
+        self.spectrum = torch.zeros(args.fft_len // 2 + 1, 0, 2)
+
+    def _compute(self, segment, first):
+        """Computes the fbank and STFT frames of a segment whose first frame has global index `first`."""
+        frames = self.plan.num_frames(segment.shape[-1])
+        noise = self.noise.frames(first, first + frames).unsqueeze(0) if self.dither != 0.0 else None
+        fbank = self.plan.fbank(segment.unsqueeze(0), self.dither, noise=noise)[0]
+        return fbank, self.stft(segment, self.args)
+
+    def _window(self, window, start):
+        """Returns the fbank (frames, n_mels) and STFT (F, frames, 2) frames of one window starting at global sample `start`."""
+        frames = self.plan.num_frames(window.shape[-1])
+        first = start // self.hop
+        buffered_end = self.first_frame + self.fbank.shape[0]
+        if start % self.hop != 0 or first < self.first_frame or first > buffered_end:
+            # Not continuous with the buffer, start over from this window
+            self.first_frame, buffered_end = first, first
+            self.fbank = self.fbank[:0]
+            self.spectrum = self.spectrum[:, :0]
+
+        # Drop the frames before this window, then compute the ones past the buffer's end
+        drop = first - self.first_frame
+        self.fbank = self.fbank[drop:]
+        self.spectrum = self.spectrum[:, drop:]
+        self.first_frame = first
+        self.noise.forget(first)
+
+        new_frames = first + frames - buffered_end
+        if new_frames > 0:
+            offset = (buffered_end - first) * self.hop
+            segment = window[offset:offset + (new_frames - 1) * self.hop + self.plan.window_size]
+            fbank, spectrum = self._compute(segment, buffered_end)
+            self.fbank = torch.cat([self.fbank, fbank])
+            self.spectrum = torch.cat([self.spectrum, spectrum], dim=1)
+        return self.fbank[:frames], self.spectrum[:, :frames]
+
+    def extract(self, windows, starts):
+        """Returns the filter banks with deltas (B, frames, 3 * n_mels) and the STFT (B, F, frames, 2) of a batch of windows.
+
+        Args:
+            windows (torch.Tensor): The windows (B, T), scaled to the MAX_WAV_VALUE range.
+            starts (list): Global start sample of each window.
+        """
+        fbanks, spectra = [], []
+        with stage('stft'):
+            for window, start in zip(windows, starts):
+                fbank, spectrum = self._window(window, start)
+                fbanks.append(fbank)
+                spectra.append(spectrum)
+            return self.plan.add_deltas(torch.stack(fbanks)), torch.stack(spectra)
+
+def get_mel_plan(args, device='cpu', dtype=torch.float32):
+    """Returns the MelPlan for the mel settings in args (MossFormer2_SR_48K)."""
+    key = ('mel', args.sampling_rate, args.n_fft, args.num_mels, args.fmin, args.fmax, args.win_size,
+           args.hop_size, str(device), dtype)
+    return _get_plan(key, lambda: MelPlan(args.sampling_rate, args.n_fft, args.num_mels, args.fmin, args.fmax,
+                                          args.win_size, args.hop_size, device, dtype))
+
+def get_fbank_plan(args, device='cpu', dtype=torch.float32):
+    """Returns the FbankPlan for the fbank settings in args (MossFormer2_SE_48K)."""
+    key = ('fbank', args.sampling_rate, args.win_len, args.num_mels, 20.0, 0.0, args.win_type, args.win_inc,
+           str(device), dtype)
+    return _get_plan(key, lambda: FbankPlan(args.sampling_rate, args.win_len, args.win_inc, args.num_mels,
+                                            args.win_type, device, dtype))
@@ -222,12 +222,13 @@ def pesq_loss(clean, noisy, sr=16000):
         pesq_score = -1  # Assign -1 to indicate error
     return pesq_score
 
-def batch_pesq(clean, noisy):
+def batch_pesq(clean, noisy, device='cuda'):
     """Computes the PESQ scores for batches of clean and noisy audio signals.
 
     Args:
         clean (list of ndarray): List of clean audio signals.
         noisy (list of ndarray): List of noisy audio signals.
+        device (str or torch.device): Device of the returned tensor (default is 'cuda').
 
     Returns:
         torch.FloatTensor: A tensor of normalized PESQ scores or None if any score is -1.
@@ -241,46 +242,164 @@ def batch_pesq(clean, noisy):
     
     # Normalize PESQ scores to a scale of 0 to 1
     pesq_score = (pesq_score - 1) / 3.5  
-    return torch.FloatTensor(pesq_score).to('cuda')  # Return normalized scores as a tensor
+    return torch.FloatTensor(pesq_score).to(device)  # Return normalized scores as a tensor
 
-def power_compress(x):
+# Smallest magnitude the phase of a bin is taken from, below it the bin counts as zero
+MIN_MAGNITUDE = 1e-20
+
+# Analysis windows, keyed by (win_type, win_len, periodic, device, dtype)
+_windows = {}
+
+# SpectralFrontend objects, keyed by (device, dtype, STFT config)
+_spectral_frontends = {}
+
+def get_window(win_type, win_len, periodic=False, device='cpu', dtype=torch.float32):
+    """Returns the analysis window for the STFT, built once per type, length, device and dtype.
+
+    Args:
+        win_type (str): 'hamming' or 'hanning'.
+        win_len (int): Window length in samples.
+        periodic (bool): Periodic window (for spectral analysis) instead of symmetric.
+        device (torch.device): The device the window lives on.
+        dtype (torch.dtype): The window's data type.
+
+    Returns:
+        torch.Tensor: The window, or None if win_type isn't supported. It's shared, so
+                      callers must not modify it in place.
+    """
+    key = (win_type, win_len, periodic, str(device), dtype)
+    window = _windows.get(key)
+    if window is None:
+        if win_type == 'hamming':
+            window = torch.hamming_window(win_len, periodic=periodic, dtype=dtype, device=device)
+        elif win_type == 'hanning':
+            window = torch.hann_window(win_len, periodic=periodic, dtype=dtype, device=device)
+        else:
+            return None
+        _windows[key] = window
+    return window
+
+def apply_phase(mag, real, imag, ref_mag):
+    """Gives `mag` the phase of the complex value real + j*imag, without any trigonometry.
+
+    mag * cos(angle) and mag * sin(angle) are mag * real / |x| and mag * imag / |x|. Bins of zero
+    magnitude take the phase torch.angle gives them, 0 or pi depending on the sign of the zero.
+
+    Args:
+        mag (torch.Tensor): The new magnitude.
+        real (torch.Tensor): Real part of the value the phase is taken from.
+        imag (torch.Tensor): Imaginary part of the value the phase is taken from.
+        ref_mag (torch.Tensor): |real + j*imag|, which callers usually have already.
+
+    Returns:
+        tuple: The real and imaginary parts of the result.
+    """
+    inv_mag = ref_mag.clamp_min(MIN_MAGNITUDE).reciprocal()
+    # The sign of a signed zero, as copysign(1, real), from 1/-0 = -inf, since ONNX has no copysign
+    ones = torch.ones_like(real)
+    cos = torch.where(ref_mag > 0, real * inv_mag, torch.where(real.reciprocal() < 0, -ones, ones))
+    return mag * cos, mag * (imag * inv_mag)
+
+def power_compress(x, power=0.3):
     """Compresses the power of a complex spectrogram.
 
+    The magnitude is raised to `power` while the phase is kept, which is the same as scaling
+    the complex value by |x|^(power - 1).
+
     Args:
         x (torch.Tensor): Input tensor with real and imaginary components.
+        power (float): The compression exponent.
 
     Returns:
         torch.Tensor: Compressed magnitude and phase representation of the input.
     """
     real = x[..., 0]  # Extract real part
     imag = x[..., 1]  # Extract imaginary part
-    spec = torch.complex(real, imag)  # Create complex tensor from real and imaginary parts
-    mag = torch.abs(spec)  # Compute magnitude
-    phase = torch.angle(spec)  # Compute phase
-    
-    mag = mag**0.3  # Compress magnitude using power of 0.3
-    real_compress = mag * torch.cos(phase)  # Reconstruct real part
-    imag_compress = mag * torch.sin(phase)  # Reconstruct imaginary part
-    return torch.stack([real_compress, imag_compress], 1)  # Stack compressed parts
+    mag = torch.sqrt(real ** 2 + imag ** 2)  # Compute magnitude
+    scale = mag.clamp_min(MIN_MAGNITUDE) ** (power - 1)  # Compress magnitude using power of 0.3
+    return torch.stack([real * scale, imag * scale], 1)  # Stack compressed parts
 
-def power_uncompress(real, imag):
+def power_uncompress(real, imag, power=0.3):
     """Uncompresses the power of a compressed complex spectrogram.
 
     Args:
         real (torch.Tensor): Compressed real component.
         imag (torch.Tensor): Compressed imaginary component.
+        power (float): The exponent the spectrogram was compressed with.
 
     Returns:
         torch.Tensor: Uncompressed complex spectrogram.
     """
-    spec = torch.complex(real, imag)  # Create complex tensor from real and imaginary parts
-    mag = torch.abs(spec)  # Compute magnitude
-    phase = torch.angle(spec)  # Compute phase
-    
-    mag = mag**(1./0.3)  # Uncompress magnitude by raising to the power of 1/0.3
-    real_uncompress = mag * torch.cos(phase)  # Reconstruct real part
-    imag_uncompress = mag * torch.sin(phase)  # Reconstruct imaginary part
-    return torch.stack([real_uncompress, imag_uncompress], -1)  # Stack uncompressed parts
+    mag = torch.sqrt(real ** 2 + imag ** 2)  # Compute magnitude
+    scale = mag ** (1. / power - 1)  # Uncompress magnitude by raising to the power of 1/0.3
+    return torch.stack([real * scale, imag * scale], -1)  # Stack uncompressed parts
+
+class SpectralFrontend:
+    """STFT with power compression, and the way back, for one STFT config on one device.
+
+    The window is built once and reused, and power compression scales the complex bins by
+    |x|^(power - 1) instead of going through angle, cos and sin. Get instances through
+    get_spectral_frontend, which keeps one per (device, dtype, config).
+
+    Args:
+        win_type (str): 'hamming' or 'hanning'.
+        win_len (int): Window length in samples.
+        win_inc (int): Hop size in samples.
+        fft_len (int): FFT size.
+        device (torch.device): The device the transforms run on.
+        dtype (torch.dtype): The data type of the signals.
+        center (bool): Whether frames are centered on their sample, as in torch.stft.
+        periodic (bool): Periodic window instead of symmetric.
+        power (float): The power compression exponent.
+    """
+
+    def __init__(self, win_type, win_len, win_inc, fft_len, device='cpu', dtype=torch.float32,
+                 center=True, periodic=True, power=0.3):
+        self.win_len = win_len
+        self.win_inc = win_inc
+        self.fft_len = fft_len
+        self.center = center
+        self.power = power
+        self.window = get_window(win_type, win_len, periodic, device, dtype)
+        if self.window is None:
+            raise ValueError(f'Window type {win_type} is not supported')
+
+    def compress_stft(self, x):
+        """Returns the power-compressed STFT of x (B, T) as real and imaginary planes (B, 2, F, frames)."""
+        spec = torch.stft(x, self.fft_len, self.win_inc, self.win_len, window=self.window,
+                          center=self.center, onesided=True, return_complex=True)
+        mag = spec.abs()
+        spec = spec * mag.clamp_min(MIN_MAGNITUDE) ** (self.power - 1)
+        return torch.view_as_real(spec).permute(0, 3, 1, 2)
+
+    def uncompress_istft(self, real, imag, length=None):
+        """Undoes the power compression of real and imaginary planes (B, 1, F, frames) and returns the signal (B, T)."""
+        mag = torch.sqrt(real ** 2 + imag ** 2)
+        scale = mag ** (1. / self.power - 1)
+        spec = torch.complex(real * scale, imag * scale).squeeze(1)
+        return torch.istft(spec, self.fft_len, self.win_inc, self.win_len, window=self.window,
+                           center=self.center, onesided=True, length=length)
+
+def get_spectral_frontend(args, device='cpu', dtype=torch.float32, center=True, periodic=True):
+    """Returns the SpectralFrontend for the STFT config in args, creating it on first use.
+
+    Args:
+        args (Namespace): Configuration arguments containing window type and lengths.
+        device (torch.device): The device the transforms run on.
+        dtype (torch.dtype): The data type of the signals.
+        center (bool): Whether to center the window.
+        periodic (bool): Periodic window instead of symmetric.
+
+    Returns:
+        SpectralFrontend: The shared frontend.
+    """
+    key = (str(device), dtype, args.win_type, args.win_len, args.win_inc, args.fft_len, center, periodic)
+    frontend = _spectral_frontends.get(key)
+    if frontend is None:
+        frontend = SpectralFrontend(args.win_type, args.win_len, args.win_inc, args.fft_len, device, dtype,
+                                    center=center, periodic=periodic)
+        _spectral_frontends[key] = frontend
+    return frontend
 
 def stft(x, args, center=False, periodic=False, onesided=None):
     """Computes the Short-Time Fourier Transform (STFT) of an audio signal.
@@ -298,12 +417,9 @@ def stft(x, args, center=False, periodic=False, onesided=None):
     win_inc = args.win_inc
     fft_len = args.fft_len
 
-    # Select window type and create window tensor
-    if win_type == 'hamming':
-        window = torch.hamming_window(win_len, periodic=periodic).to(x.device)
-    elif win_type == 'hanning':
-        window = torch.hann_window(win_len, periodic=periodic).to(x.device)
-    else:
+    # Get the cached window for this type and device
+    window = get_window(win_type, win_len, periodic, x.device, x.dtype if x.is_floating_point() else torch.float32)
+    if window is None:
         print(f"In STFT, {win_type} is not supported!")
         return
 
@@ -330,12 +446,9 @@ def istft(x, args, slen=None, center=False, normalized=False, periodic=False, on
     win_inc = args.win_inc
     fft_len = args.fft_len
 
-    # Select window type and create window tensor
-    if win_type == 'hamming':
-        window = torch.hamming_window(win_len, periodic=periodic).to(x.device)
-    elif win_type == 'hanning':
-        window = torch.hann_window(win_len, periodic=periodic).to(x.device)
-    else:
+    # Get the cached window for this type and device
+    window = get_window(win_type, win_len, periodic, x.device, x.real.dtype if x.is_complex() else x.dtype)
+    if window is None:
         print(f"In ISTFT, {win_type} is not supported!")
         return
 
@@ -362,10 +475,8 @@ def compute_fbank(audio_in, args):
     Returns:
         torch.Tensor: Computed filter bank features.
     """
-    frame_length = args.win_len / args.sampling_rate * 1000  # Frame length in milliseconds
-    frame_shift = args.win_inc / args.sampling_rate * 1000  # Frame shift in milliseconds
+    from clearvoice.utils.feature_plans import get_fbank_plan
 
-    # Compute and return filter bank features using Kaldi's implementation
-    return torchaudio.compliance.kaldi.fbank(audio_in, dither=1.0, frame_length=frame_length,
-                                             frame_shift=frame_shift, num_mel_bins=args.num_mels,
-                                             sample_frequency=args.sampling_rate, window_type=args.win_type)
+    # Same features as Kaldi's fbank on the first channel, with the window and mel banks built once
+    plan = get_fbank_plan(args, audio_in.device, audio_in.dtype)
+    return plan.fbank(audio_in[:1], dither=1.0)[0]
@@ -0,0 +1,193 @@
+#!/usr/bin/env python -u
+# -*- coding: utf-8 -*-
+
+import os
+import warnings
+import numpy as np
+import torch
+import torch.nn as nn
+import clearvoice.models.mossformer_gan_se.mossformer as mossformer
+from clearvoice.utils.compiled import artifact_digest
+
+# Networks whose core runs on ONNX Runtime. The STFT, the power compression and the iSTFT stay
+# in torch around it, as do the decoding windows
+ONNX_NETWORKS = ['FRCRN_SE_16K', 'MossFormerGAN_SE_16K']
+
+# Directory of the exported graphs, inside the checkpoint directory
+ONNX_DIR = 'onnx'
+OPSET_VERSION = 18
+
+# Largest difference of the decoded waveform against torch that the parity check accepts
+PARITY_ATOL = 1e-3
+
+# Shape of the example input the graphs are exported with, both axes stay dynamic. torch.export
+# specializes axes of size 1, so the batch has two items
+EXPORT_BATCH_SIZE = 2
+EXPORT_FRAMES = 64
+
+class FRCRNMaskCore(nn.Module):
+    """The two UNets of DCCRN, from the complex spectrogram [B, 1, D, T, 2] to the mask."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, cmp_spec):
+        return self.model.estimate_mask(cmp_spec)
+
+def _export_spec(model, args):
+    """The module to export, an example input and the names of its inputs and outputs."""
+    if args.network == 'FRCRN_SE_16K':
+        example = torch.randn(EXPORT_BATCH_SIZE, 1, model.feat_dim, EXPORT_FRAMES, 2)
+        return FRCRNMaskCore(model), example, ['cmp_spec'], ['cmp_mask'], 3
+    # SyncANet takes the compressed spectrum (B, 2, frames, F) and returns the real and imaginary parts
+    example = torch.randn(EXPORT_BATCH_SIZE, 2, EXPORT_FRAMES, args.fft_len // 2 + 1)
+    return model, example, ['spec'], ['real', 'imag'], 2
+
+def onnx_path(args):
+    """The exported graph of a model, keyed by the checkpoint, the config and the torch version."""
+    digest = artifact_digest(args, opset=OPSET_VERSION)
+    return os.path.join(args.checkpoint_dir, ONNX_DIR, f'{args.network}_{digest}.onnx')
+
+def export_onnx(model, args, path):
+    """Exports the network core of model to path, with dynamic batch and time axes.
+
+    This uses the torch.export based exporter, the TorchScript one gets the FRCRN UNets wrong.
+    The GAN is exported with its attentions in a single tile, since the tile loops are Python
+    loops over the sequence length.
+    """
+    module, example, input_names, output_names, time_axis = _export_spec(model, args)
+    dynamic_shapes = ({0: torch.export.Dim.AUTO, time_axis: torch.export.Dim.AUTO},)
+    device = next(module.parameters()).device
+    tile_size = mossformer.ATTENTION_TILE_SIZE
+    mossformer.ATTENTION_TILE_SIZE = 1 << 62
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with torch.no_grad(), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            torch.onnx.export(module.cpu(), (example,), temp_path, input_names=input_names,
+                              output_names=output_names, dynamic_shapes=dynamic_shapes,
+                              opset_version=OPSET_VERSION, dynamo=True, verbose=False)
+        os.replace(temp_path, path)
+    finally:
+        mossformer.ATTENTION_TILE_SIZE = tile_size
+        module.to(device)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def create_session(path, args, device):
+    """An ONNX Runtime session with all graph optimizations, and the thread pools of args."""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = getattr(args, 'onnx_intra_op_threads', 0)  # 0 lets ONNX Runtime decide
+    options.inter_op_num_threads = getattr(args, 'onnx_inter_op_threads', 0)
+    providers = ['CPUExecutionProvider']
+    if device.type == 'cuda' and 'CUDAExecutionProvider' in ort.get_available_providers():
+        providers.insert(0, 'CUDAExecutionProvider')
+    return ort.InferenceSession(path, options, providers=providers)
+
+class OnnxCore(nn.Module):
+    """Runs an exported graph on torch tensors, returning torch tensors on the input's device.
+
+    Args:
+        session (onnxruntime.InferenceSession): The session of the exported graph.
+    """
+
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+
+    def forward(self, x):
+        inputs = {self.input_name: x.detach().cpu().numpy().astype(np.float32, copy=False)}
+        outputs = [torch.from_numpy(output).to(x.device) for output in self.session.run(None, inputs)]
+        return outputs[0] if len(outputs) == 1 else tuple(outputs)
+
+class OnnxFRCRN(nn.Module):
+    """DCCRN with the mask estimated by ONNX Runtime, and the rest of its forward() and
+    inference(), the ConvSTFT, the masking and the ConviSTFT, in torch.
+
+    Args:
+        model (DCCRN): The loaded torch model.
+        session (onnxruntime.InferenceSession): The session of its exported FRCRNMaskCore.
+    """
+
+    def __init__(self, model, session):
+        super().__init__()
+        from clearvoice.models.frcrn_se.frcrn import DCCRN
+
+        self.feat_dim = model.feat_dim
+        self.stft = model.stft
+        self.istft = model.istft
+        self.core = OnnxCore(session)
+        self._forward, self._inference, self._apply_mask = DCCRN.forward, DCCRN.inference, DCCRN.apply_mask
+
+    def estimate_mask(self, cmp_spec):
+        return self.core(cmp_spec)
+
+    def apply_mask(self, cmp_spec, cmp_mask):
+        return self._apply_mask(self, cmp_spec, cmp_mask)
+
+    def forward(self, inputs):
+        return self._forward(self, inputs)
+
+    def inference(self, inputs):
+        return self._inference(self, inputs)
+
+def _wrap(model, session, args):
+    if args.network == 'FRCRN_SE_16K':
+        return OnnxFRCRN(model, session).eval()
+    return OnnxCore(session).eval()
+
+def _decode_parity(model, onnx_model, device, args, seconds=1.5):
+    """Largest difference between the waveforms decoded by torch and by ONNX Runtime, on noise
+    long enough that the time axis differs from the export."""
+    from clearvoice.utils.decode import decode_one_audio
+
+    inputs = np.random.RandomState(0).randn(1, int(args.sampling_rate * seconds)).astype(np.float32) * 0.1
+    with torch.no_grad():
+        expected = decode_one_audio(model, device, inputs, args)
+        actual = decode_one_audio(onnx_model, device, inputs, args)
+    return float(np.max(np.abs(np.asarray(expected) - np.asarray(actual))))
+
+def load_onnx_model(model, args, device):
+    """Returns model with its network core running on ONNX Runtime, or model itself if
+    onnxruntime is missing, the export fails or the decoded outputs differ from torch.
+
+    The graph is exported to the checkpoint directory the first time, and checked against the
+    torch model once per export.
+
+    Args:
+        model (nn.Module): The loaded model, in eval mode.
+        args (Namespace): The model's config.
+        device (torch.device): The device the model runs on.
+    """
+    path = onnx_path(args)
+    exported = not os.path.isfile(path)
+    try:
+        import onnxruntime  # noqa: F401
+        if exported:
+            import onnxscript  # noqa: F401, needed by the exporter only
+    except ImportError as e:
+        print(f'{e.name} is not installed, running on torch. Install it with: pip install {e.name}')
+        return model
+
+    try:
+        if exported:
+            export_onnx(model, args, path)
+        onnx_model = _wrap(model, create_session(path, args, device), args)
+    except Exception as e:
+        print(f'{args.network}: ONNX Runtime backend failed, running on torch: {e}')
+        return model
+
+    if exported:
+        difference = _decode_parity(model, onnx_model, device, args)
+        if difference > PARITY_ATOL:
+            print(f'{args.network}: ONNX Runtime outputs differ from torch by {difference:.1e}, running on torch')
+            os.remove(path)
+            return model
+    print(f'{args.network}: running on ONNX Runtime')
+    return onnx_model
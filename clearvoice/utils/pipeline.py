@@ -0,0 +1,119 @@
+#!/usr/bin/env python -u
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+class StageTimer:
+    """Accumulates time spent per pipeline stage across threads.
+
+    `busy` time is spent doing the stage's work, summed over all its workers. `wait` time is
+    spent by the model stage blocked on another stage: waiting for the next input to be
+    read, or for a free writer slot. A run is bound by model throughput when both waits
+    stay close to zero.
+    """
+
+    def __init__(self):
+        self.busy = defaultdict(float)
+        self.wait = defaultdict(float)
+        self.count = defaultdict(int)
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.busy[name] += elapsed
+                self.count[name] += 1
+
+    @contextmanager
+    def waiting(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.wait[name] += elapsed
+
+    def report(self, title):
+        """Prints the per-stage totals and the wall time since the timer was created."""
+        wall = time.perf_counter() - self.start
+        print(f'{title}: {wall:.2f}s wall time')
+        for name in self.busy:
+            count = max(1, self.count[name])
+            line = f'  {name:<6} {self.busy[name]:8.2f}s busy, {self.busy[name] / count * 1000:8.1f} ms/file'
+            if name in self.wait:
+                line += f', model waited {self.wait[name]:.2f}s'
+            print(line)
+
+def prefetch_map(fn, items, num_workers=2, depth=None):
+    """Yields fn(item) for every item in order, computing upcoming items ahead in a thread pool.
+
+    At most `depth` results are in flight at once, so a slow consumer holds back the workers
+    instead of letting decoded inputs pile up in memory.
+
+    Args:
+        fn (callable): The function to run on each item.
+        items (iterable): The items to process.
+        num_workers (int): Number of worker threads.
+        depth (int): Maximum number of items computed ahead. Defaults to 2 * num_workers.
+
+    Yields:
+        The results of fn, in the order of items.
+    """
+    num_workers = max(1, int(num_workers))
+    depth = max(1, int(depth or 2 * num_workers))
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= depth:
+                break
+        while pending:
+            result = pending.popleft().result()
+            for item in items:
+                pending.append(executor.submit(fn, item))
+                break
+            yield result
+
+class BoundedExecutor:
+    """A thread pool whose submit blocks once `max_pending` tasks are queued or running.
+
+    Exceptions raised by tasks are re-raised by the next submit or by close, so failed
+    writes aren't silently lost.
+    """
+
+    def __init__(self, num_workers=2, max_pending=None):
+        num_workers = max(1, int(num_workers))
+        self.executor = ThreadPoolExecutor(max_workers=num_workers)
+        self.slots = threading.BoundedSemaphore(max(1, int(max_pending or 2 * num_workers)))
+        self.futures = []
+
+    def _check(self):
+        done = [future for future in self.futures if future.done()]
+        self.futures = [future for future in self.futures if not future.done()]
+        for future in done:
+            future.result()
+
+    def submit(self, fn, *args, **kwargs):
+        self.slots.acquire()
+        self._check()
+        future = self.executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures.append(future)
+        return future
+
+    def close(self):
+        """Waits for every queued task to finish."""
+        self.executor.shutdown(wait=True)
+        self._check()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python -u
+# -*- coding: utf-8 -*-
+
+import copy
+import os
+import librosa
+import numpy as np
+import torch
+import torch.nn as nn
+from clearvoice.utils.decode import decode_one_audio
+from clearvoice.utils.misc import pesq_loss
+from clearvoice.utils.result_cache import checkpoint_identity
+
+# Networks that run on audio alone, so the guard can decode its samples with them
+INT8_NETWORKS = ['FRCRN_SE_16K', 'MossFormer2_SE_48K', 'MossFormer2_SR_48K', 'MossFormerGAN_SE_16K',
+                 'MossFormer2_SS_16K']
+
+# Layer types dynamic quantization covers, pointwise convolutions are turned into nn.Linear first
+QUANTIZED_TYPES = {nn.Linear, nn.GRU, nn.LSTM}
+
+# Lowest mean PESQ of the int8 outputs against the fp32 outputs that enables int8, 4.64 is identical
+MIN_PESQ = 4.0
+
+# Name of the quantized state dict, next to the checkpoints
+QUANTIZED_NAME = 'quantized_int8.pt'
+
+class PointwiseLinear(nn.Module):
+    """A 1x1 nn.Conv1d or nn.Conv2d computed as an nn.Linear over the channel axis.
+
+    Dynamic quantization only covers nn.Linear and recurrent layers, while the MossFormer blocks
+    spend much of their time in 1x1 convolutions, which are the same product with the channels
+    moved last.
+    """
+
+    def __init__(self, conv):
+        super().__init__()
+        self.linear = nn.Linear(conv.in_channels, conv.out_channels, bias=conv.bias is not None)
+        self.linear.weight.data = conv.weight.data.reshape(conv.out_channels, conv.in_channels).clone()
+        if conv.bias is not None:
+            self.linear.bias.data = conv.bias.data.clone()
+
+    def forward(self, x):
+        return self.linear(x.movedim(1, -1)).movedim(-1, 1)
+
+def _is_pointwise(module):
+    if type(module) not in (nn.Conv1d, nn.Conv2d):
+        return False
+    if hasattr(module, 'weight_g') or hasattr(module, 'parametrizations'):
+        return False  # Weight normalized, its weight is recomputed on every call
+    return (all(k == 1 for k in module.kernel_size) and all(s == 1 for s in module.stride)
+            and all(d == 1 for d in module.dilation) and module.groups == 1
+            and not isinstance(module.padding, str) and all(p == 0 for p in module.padding))
+
+def replace_pointwise_convs(model):
+    """Replaces every 1x1 convolution of model by a PointwiseLinear, in place."""
+    for name, child in model.named_children():
+        if _is_pointwise(child):
+            setattr(model, name, PointwiseLinear(child))
+        else:
+            replace_pointwise_convs(child)
+    return model
+
+def quantize_model(model):
+    """Returns an int8 copy of model: weights of the linear, recurrent and 1x1 conv layers are
+    stored as int8, and activations are quantized on the fly, per batch."""
+    model = replace_pointwise_convs(copy.deepcopy(model))
+    return torch.ao.quantization.quantize_dynamic(model, QUANTIZED_TYPES, dtype=torch.qint8)
+
+def synthetic_speech(sampling_rate, seconds=4, f0=120.0):
+    """A voiced, syllable-paced harmonic signal, for the guard when no samples are given."""
+    t = np.arange(int(sampling_rate * seconds)) / sampling_rate
+    pitch = f0 * (1 + 0.15 * np.sin(2 * np.pi * 0.5 * t))  # Slow intonation
+    phase = 2 * np.pi * np.cumsum(pitch) / sampling_rate
+    voiced = np.zeros_like(t)
+    for k in range(1, int(4000 / f0)):
+        voiced += np.sin(k * phase) / k
+    envelope = np.clip(np.sin(2 * np.pi * 2 * t), 0, None) ** 2  # Four syllables per second
+    noise = np.random.RandomState(0).randn(len(t)) * 0.01
+    audio = voiced * envelope + noise
+    return audio / np.max(np.abs(audio)) * 0.5
+
+def _guard_inputs(args, sample_paths=None):
+    from clearvoice.dataloader.dataloader import audioread
+
+    if not sample_paths:
+        return [synthetic_speech(args.sampling_rate, f0=f0) for f0 in (120.0, 210.0)]
+    inputs = []
+    for path in sample_paths:
+        result = audioread(path, args.sampling_rate, True)
+        if result is not None:
+            inputs.append(result[0][0])
+    return inputs
+
+def pesq_guard(fp32_model, int8_model, device, args, sample_paths=None):
+    """Returns the mean wideband PESQ of the int8 outputs against the fp32 outputs, or None if
+    no sample could be scored.
+
+    Args:
+        fp32_model (nn.Module): The model as loaded from the checkpoint.
+        int8_model (nn.Module): Its quantized copy.
+        device (torch.device): The device both run on.
+        args (Namespace): The model's config.
+        sample_paths (list): Audio files to decode, synthetic speech if None.
+    """
+    scores = []
+    with torch.no_grad():
+        for audio in _guard_inputs(args, sample_paths):
+            inputs = audio.reshape(1, -1).astype(np.float32)
+            references = decode_one_audio(fp32_model, device, inputs, args)
+            outputs = decode_one_audio(int8_model, device, inputs, args)
+            if not isinstance(references, list):
+                references, outputs = [references], [outputs]
+            for reference, output in zip(references, outputs):
+                reference = np.asarray(reference, dtype=np.float32).reshape(-1)
+                output = np.asarray(output, dtype=np.float32).reshape(-1)
+                if args.sampling_rate != 16000:
+                    reference = librosa.resample(reference, orig_sr=args.sampling_rate, target_sr=16000)
+                    output = librosa.resample(output, orig_sr=args.sampling_rate, target_sr=16000)
+                score = pesq_loss(reference, output, 16000)
+                if score != -1:
+                    scores.append(score)
+    return float(np.mean(scores)) if scores else None
+
+def _guard_identity(sample_paths):
+    """Identifies the guard samples by the path, size and mtime of each file, like the checkpoints."""
+    identity = []
+    for path in sample_paths or []:
+        path = os.path.abspath(path)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            identity.append([path, stat.st_size, stat.st_mtime_ns])
+        else:
+            identity.append([path, None, None])
+    return identity
+
+def load_int8_model(model, args, device, sample_paths=None):
+    """Returns the int8 version of a loaded fp32 model, or the fp32 model if int8 fails the guard.
+
+    The quantized state dict and its guard score are cached in the checkpoint directory, for the
+    checkpoint files, guard samples and torch version they were made with, so the guard only
+    runs once for each.
+
+    Args:
+        model (nn.Module): The model, with its fp32 weights loaded and in eval mode.
+        args (Namespace): The model's config.
+        device (torch.device): The device the model runs on, int8 is CPU only.
+        sample_paths (list): Audio files for the guard, synthetic speech if None.
+    """
+    cache_path = os.path.join(args.checkpoint_dir, QUANTIZED_NAME)
+    identity = {'checkpoint': checkpoint_identity(args.checkpoint_dir), 'guard_samples': _guard_identity(sample_paths),
+                'torch_version': torch.__version__}
+    int8_model = quantize_model(model).eval()
+    min_pesq = getattr(args, 'int8_min_pesq', MIN_PESQ)
+
+    cached = None
+    if os.path.isfile(cache_path):
+        try:
+            cached = torch.load(cache_path, map_location='cpu', weights_only=False)
+        except Exception as e:
+            print(f'Ignoring the quantized checkpoint {cache_path}: {e}')
+        if cached is not None and cached.get('identity') != identity:
+            cached = None  # Made from other weights, scored on other samples or by another torch version
+
+    if cached is not None:
+        score = cached['pesq']
+        int8_model.load_state_dict(cached['state_dict'])
+    else:
+        score = pesq_guard(model, int8_model, device, args, sample_paths)
+        try:
+            torch.save({'identity': identity, 'pesq': score, 'state_dict': int8_model.state_dict()}, cache_path)
+        except OSError as e:
+            print(f'Could not cache the quantized checkpoint: {e}')
+
+    if score is None or score < min_pesq:
+        print(f'{args.network}: int8 PESQ against fp32 is {score}, below {min_pesq}, keeping fp32')
+        return model
+    print(f'{args.network}: running int8, PESQ against fp32 {score:.2f}')
+    return int8_model
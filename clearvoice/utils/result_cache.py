@@ -0,0 +1,133 @@
+#!/usr/bin/env python -u
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+
+# Decoding parameters that change the output of a model, when the config has them
+DECODE_PARAMS = ['network', 'sampling_rate', 'decode_window', 'one_time_decode_length', 'win_len', 'win_inc',
+                 'fft_len', 'num_mels', 'win_type', 'fmin', 'fmax', 'fmax_for_loss', 'hop_size', 'win_size',
+                 'n_fft', 'num_spks', 'dither_seed', 'precision', 'backend', 'compile']
+
+def checkpoint_identity(checkpoint_dir):
+    """Identifies the weights a model loads by the name, size and mtime of its checkpoint files.
+
+    Hashing the checkpoints themselves would cost more than a short decode, and a retrained or
+    re-downloaded checkpoint always gets a new mtime.
+    """
+    identity = []
+    best_name = os.path.join(checkpoint_dir, 'last_best_checkpoint')
+    if os.path.isfile(best_name):
+        with open(best_name, 'r') as f:
+            for line in f:
+                name = line.strip()
+                path = os.path.join(checkpoint_dir, name)
+                if name and os.path.isfile(path):
+                    stat = os.stat(path)
+                    identity.append([name, stat.st_size, stat.st_mtime_ns])
+    return identity
+
+class ResultCache:
+    """Content-addressed on-disk cache of model outputs.
+
+    Entries are keyed by the SHA-256 of the input file's bytes together with the model name,
+    the checkpoint identity and the decoding parameters, so renaming or copying a file still
+    hits, while a changed file, model, checkpoint or config misses. Outputs are stored as
+    int16 scaled to their own peak, which is lossless to well below what the writers keep.
+    The cache is trimmed to `max_bytes` by evicting the least recently used entries.
+
+    Args:
+        cache_dir (str): Directory holding the cache entries, shared between runs and models.
+        model_name (str): Name of the model whose outputs are cached.
+        args (Namespace): The model's config, for the checkpoint directory and decode parameters.
+        max_bytes (int): Size limit of the whole cache directory.
+    """
+
+    def __init__(self, cache_dir, model_name, args, max_bytes=10 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        config = {name: getattr(args, name) for name in DECODE_PARAMS if hasattr(args, name)}
+        identity = {'model': model_name, 'checkpoint': checkpoint_identity(args.checkpoint_dir), 'config': config}
+        self.identity = json.dumps(identity, sort_keys=True, default=str).encode('utf-8')
+
+    def key(self, path):
+        """Returns the cache key of the input file at `path`."""
+        digest = hashlib.sha256(self.identity)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def get(self, key):
+        """Returns (output_audios, audio_info) for a cached key, or None, counting the hit or miss."""
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                audio_info = json.loads(str(entry['audio_info']))
+                outputs = [entry[f'out{i}'].astype(np.float32) * (float(entry[f'peak{i}']) / 32767.0)
+                           for i in range(int(entry['count']))]
+                is_list = bool(entry['is_list'])
+            os.utime(path)  # Mark as recently used
+        except (OSError, KeyError, ValueError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return (outputs if is_list else outputs[0]), audio_info
+
+    def put(self, key, output_audios, audio_info):
+        """Stores the outputs of one input file, then evicts old entries if the cache is too large."""
+        outputs = output_audios if isinstance(output_audios, list) else [output_audios]
+        entry = {'audio_info': json.dumps(audio_info), 'count': len(outputs), 'is_list': isinstance(output_audios, list)}
+        for i, output in enumerate(outputs):
+            output = np.asarray(output, dtype=np.float32)
+            peak = float(np.max(np.abs(output))) if output.size else 0.0
+            peak = peak if peak > 0 else 1.0
+            entry[f'out{i}'] = np.round(output * (32767.0 / peak)).astype(np.int16)
+            entry[f'peak{i}'] = peak
+
+        # Written under a temporary name, so readers never see a partial entry
+        path = self._path(key)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz'
+        np.savez(temp_path, **entry)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for item in os.scandir(self.cache_dir):
+            if item.name.endswith('.npz') and not item.name.endswith('.tmp.npz'):
+                stat = item.stat()
+                entries.append((stat.st_mtime, stat.st_size, item.path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return
+
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def report(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        print(f'Result cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate)')
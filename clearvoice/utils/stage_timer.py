@@ -0,0 +1,61 @@
+#!/usr/bin/env python -u
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from contextlib import contextmanager
+
+# The stages the decoding code is split into. 'stft' covers every analysis transform, filter
+# banks and mel spectra included
+STAGES = ['io', 'stft', 'network', 'istft', 'resample']
+
+_local = threading.local()
+
+class StageTimes:
+    """Wall time spent in each stage, exclusive of the stages nested in it: the STFT that
+    FRCRN computes inside its forward pass counts as 'stft', not as 'network'."""
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.calls = dict.fromkeys(STAGES, 0)
+        self.active = []  # [name, start, seconds of nested stages] of the open stages
+
+    def as_dict(self):
+        return dict(self.seconds)
+
+@contextmanager
+def recording():
+    """Records the stages run on this thread while the block runs, and yields the StageTimes.
+
+    Outside of it, stage() only costs an attribute lookup, so the decoding code can stay
+    instrumented.
+    """
+    previous = getattr(_local, 'times', None)
+    _local.times = times = StageTimes()
+    try:
+        yield times
+    finally:
+        _local.times = previous
+
+@contextmanager
+def stage(name):
+    """Times the block as the stage `name`, when a recording() is active on this thread.
+
+    Args:
+        name (str): One of STAGES.
+    """
+    times = getattr(_local, 'times', None)
+    if times is None:
+        yield
+        return
+    entry = [name, time.perf_counter(), 0.0]
+    times.active.append(entry)
+    try:
+        yield
+    finally:
+        times.active.pop()
+        elapsed = time.perf_counter() - entry[1]
+        times.seconds[name] = times.seconds.get(name, 0.0) + elapsed - entry[2]
+        times.calls[name] = times.calls.get(name, 0) + 1
+        if times.active:
+            times.active[-1][2] += elapsed
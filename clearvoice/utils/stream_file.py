@@ -0,0 +1,193 @@
+#!/usr/bin/env python -u
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import soundfile as sf
+import torch
+from clearvoice.utils.decode import StreamingWindowDecoder, window_forward_fn
+
+# Constant for normalizing audio values
+MAX_WAV_VALUE = 32768.0
+EPS = 1e-6
+
+# Networks whose sliding-window decoding only depends on the window itself (plus whole-file
+# scalars that a statistics pass can compute ahead of time)
+STREAMING_NETWORKS = ['FRCRN_SE_16K', 'MossFormerGAN_SE_16K', 'MossFormer2_SE_48K']
+
+def _read_blocks(path, block_frames):
+    """Yields (frames, channels) float64 blocks of the file at `path`."""
+    with sf.SoundFile(path) as reader:
+        for block in reader.blocks(blocksize=block_frames, dtype='float64', always_2d=True):
+            yield block
+
+def _resampler(orig_sr, target_sr, channels):
+    """Returns a streaming soxr resampler, or None when the rates already match."""
+    if orig_sr == target_sr:
+        return None
+    import soxr  # Only needed when the file isn't at the model's rate
+
+    return soxr.ResampleStream(orig_sr, target_sr, channels, dtype='float64', quality='HQ')
+
+def _file_statistics(path, block_frames, channels, file_sr, model_sr, use_norm, use_power):
+    """Computes the whole-file scalars the offline path derives from the fully loaded signal.
+
+    Args:
+        path (str): The input audio file.
+        block_frames (int): Frames read per block.
+        channels (int): Number of channels in the file.
+        file_sr (int): Sampling rate of the file.
+        model_sr (int): Sampling rate of the model.
+        use_norm (bool): Compute the two audio_norm scalars per channel (at the file rate).
+        use_power (bool): Compute the mean power per channel at the model rate, as used by the
+                          MossFormerGAN_SE_16K norm_factor.
+
+    Returns:
+        tuple: (norm_scalars, mean_power), both arrays of shape (channels,) or None if not requested.
+    """
+    norm_scalars = None
+    mean_power = None
+
+    if use_norm:
+        # audio_norm is scale(x) = x * scalar, then x * scalarx with scalarx taken from the
+        # samples above the average power, so it needs two passes over the file
+        sum_sq = np.zeros(channels)
+        count = 0
+        for block in _read_blocks(path, block_frames):
+            sum_sq += np.sum(block ** 2, axis=0)
+            count += len(block)
+        scalar = 10 ** (-25 / 20) / (np.sqrt(sum_sq / max(count, 1)) + EPS)
+        avg_pow = sum_sq / max(count, 1) * scalar ** 2
+
+        loud_sum = np.zeros(channels)
+        loud_count = np.zeros(channels)
+        for block in _read_blocks(path, block_frames):
+            pow_x = (block * scalar) ** 2
+            loud = pow_x > avg_pow
+            loud_sum += np.sum(np.where(loud, pow_x, 0.0), axis=0)
+            loud_count += np.sum(loud, axis=0)
+        rmsx = np.sqrt(loud_sum / np.maximum(loud_count, 1))
+        scalarx = 10 ** (-25 / 20) / (rmsx + EPS)
+        norm_scalars = scalar * scalarx
+
+    if use_power:
+        resampler = _resampler(file_sr, model_sr, channels)
+        sum_sq = np.zeros(channels)
+        count = 0
+        for block in _read_blocks(path, block_frames):
+            if resampler is not None:
+                block = resampler.resample_chunk(block)
+            sum_sq += np.sum(block.astype(np.float32) ** 2, axis=0)
+            count += len(block)
+        if resampler is not None:
+            tail = resampler.resample_chunk(np.zeros((0, channels)), last=True)
+            sum_sq += np.sum(tail.astype(np.float32) ** 2, axis=0)
+            count += len(tail)
+        mean_power = sum_sq / max(count, 1)
+
+    return norm_scalars, mean_power
+
+def decode_file_streaming(model, device, args, input_path, output_path, block_seconds=10):
+    """Enhances an audio file block by block and writes the result as it goes.
+
+    The offline path loads the whole file, resamples it, decodes it with the sliding window
+    of decode_sliding_windows and resamples it back before writing, so memory grows with the
+    file length. Here the file is read in blocks of `block_seconds`, resampled with a
+    streaming resampler, pushed into one StreamingWindowDecoder per channel, and the finished
+    output is resampled back and appended to the output file right away. Peak memory is
+    about one block plus decode_batch_size windows, whatever the length of the file.
+
+    Whole-file scalars (the audio_norm scalars of FRCRN_SE_16K and the norm_factor of
+    MossFormerGAN_SE_16K) are computed in a statistics pass over the file first.
+
+    Args:
+        model (nn.Module): The trained model used for decoding.
+        device (torch.device): The device (CPU or GPU) for computation.
+        args (Namespace): Contains the network name and decoding configuration.
+        input_path (str): The input audio file, in any format soundfile can read.
+        output_path (str): The output file, written in the format and subtype of the input.
+        block_seconds (float): Amount of audio read from the file per block.
+
+    Returns:
+        bool: True if the file was written, False if it can't be streamed and should go
+              through the offline path instead.
+    """
+    if args.network not in STREAMING_NETWORKS:
+        print(f'Streaming file processing is not supported for {args.network}')
+        return False
+
+    try:
+        info = sf.info(input_path)
+    except Exception:
+        return False  # Left to the offline reader, which supports more formats
+
+    model_sr = args.sampling_rate
+    window = int(model_sr * args.decode_window)
+    stride = int(window * 0.75)
+    channels = info.channels
+    if info.frames * model_sr / info.samplerate <= model_sr * args.one_time_decode_length:
+        return False  # Short enough for one-pass decoding, which the offline path does better
+
+    block_frames = max(1, int(info.samplerate * block_seconds))
+    use_norm = args.network == 'FRCRN_SE_16K'
+    use_power = args.network == 'MossFormerGAN_SE_16K'
+    norm_scalars, mean_power = _file_statistics(input_path, block_frames, channels, info.samplerate,
+                                                model_sr, use_norm, use_power)
+
+    input_scale = np.ones(channels)
+    output_scale = np.ones(channels)
+    if use_norm:
+        input_scale = norm_scalars
+        output_scale = 1 / (norm_scalars + EPS)  # Same renormalization as the offline path
+    if args.network == 'MossFormer2_SE_48K':
+        # The model works on the int16 range
+        input_scale = input_scale * MAX_WAV_VALUE
+        output_scale = output_scale / MAX_WAV_VALUE
+
+    decoders = []
+    for channel in range(channels):
+        norm_factor = None
+        if use_power:
+            norm_factor = torch.tensor([1 / np.sqrt(max(mean_power[channel], 1e-12))], dtype=torch.float32).to(device)
+        decoders.append(StreamingWindowDecoder(window, stride, window_forward_fn(model, device, args, norm_factor),
+                                               args.decode_batch_size))
+
+    down = _resampler(info.samplerate, model_sr, channels)
+    up = _resampler(model_sr, info.samplerate, channels)
+    total = 0  # Output frames written so far, at the file rate
+
+    def write_frames(writer, outputs):
+        nonlocal total
+        outputs = np.stack(outputs, axis=1) * output_scale
+        if up is not None:
+            outputs = up.resample_chunk(outputs)
+        outputs = outputs[:max(0, info.frames - total)]
+        writer.write(np.clip(outputs, -1.0, 1.0))
+        total += len(outputs)
+
+    try:
+        writer = sf.SoundFile(output_path, 'w', samplerate=info.samplerate, channels=channels,
+                              subtype=info.subtype, format=info.format)
+    except Exception as e:
+        print(f'Error writing file: {e}')
+        return False
+
+    with torch.no_grad(), writer:
+        for block in _read_blocks(input_path, block_frames):
+            block = block * input_scale
+            if down is not None:
+                block = down.resample_chunk(block)
+            block = block.astype(np.float32)
+            write_frames(writer, [decoders[c].push(block[:, c]) for c in range(channels)])
+
+        if down is not None:
+            tail = down.resample_chunk(np.zeros((0, channels)), last=True).astype(np.float32)
+            outputs = [np.concatenate([decoders[c].push(tail[:, c]), decoders[c].finish()]) for c in range(channels)]
+        else:
+            outputs = [decoders[c].finish() for c in range(channels)]
+        write_frames(writer, outputs)
+        if up is not None and total < info.frames:
+            tail = up.resample_chunk(np.zeros((0, channels)), last=True)[:info.frames - total]
+            writer.write(np.clip(tail, -1.0, 1.0))
+            total += len(tail)
+
+    return True
@@ -0,0 +1,247 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from itertools import permutations
+import librosa
+import numpy as np
+import soundfile as sf
+import torch
+from clearvoice.dataloader.dataloader import DataReader, audioread
+from clearvoice.network_wrapper import network_wrapper
+from clearvoice.utils.decode import decode_one_audio
+from clearvoice.utils.misc import batch_pesq
+from clearvoice.utils.quantization import synthetic_speech
+from clearvoice.utils.stage_timer import STAGES, recording
+
+# Models run on audio alone, with their task. AV_MossFormer2_TSE_16K needs the speaker's video
+MODELS = {
+    "FRCRN_SE_16K": "speech_enhancement",
+    "MossFormerGAN_SE_16K": "speech_enhancement",
+    "MossFormer2_SE_48K": "speech_enhancement",
+    "MossFormer2_SS_16K": "speech_separation",
+    "MossFormer2_SR_48K": "speech_super_resolution",
+}
+
+# SNR of the noisy inputs of the SE models, in dB
+INPUT_SNR = 5.0
+
+# Rate of the band-limited input files of the super-resolution model
+SR_INPUT_RATE = 16000
+
+FIELDS = ["model", "seconds", "rtf", "wall_seconds", "peak_rss_mb"] + [f"{name}_seconds" for name in STAGES + ["other"]] + [
+    "pesq", "si_snr"]
+
+
+class PeakRSS:
+    """Samples the resident set size of the process in a thread, for the peak within a block."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self.peak = 0
+
+    def rss(self):
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self.page_size
+        except OSError:  # Not Linux, ru_maxrss is the peak of the whole process in KB
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _sample(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, self.rss())
+
+    def __enter__(self):
+        self.peak = self.rss()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.rss())
+
+
+def si_snr(estimate, reference):
+    """Scale-invariant SNR in dB."""
+    estimate, reference = estimate - estimate.mean(), reference - reference.mean()
+    target = np.dot(estimate, reference) / (np.dot(reference, reference) + 1e-8) * reference
+    return float(10 * np.log10(np.dot(target, target) / (np.dot(estimate - target, estimate - target) + 1e-8) + 1e-8))
+
+
+def pesq_scores(estimates, references, sampling_rate):
+    """Wideband PESQ of each estimate at 16 kHz, None if it can't be computed."""
+    if sampling_rate != 16000:
+        estimates = [librosa.resample(x, orig_sr=sampling_rate, target_sr=16000) for x in estimates]
+        references = [librosa.resample(x, orig_sr=sampling_rate, target_sr=16000) for x in references]
+    scores = batch_pesq(references, estimates, device="cpu")
+    return None if scores is None else [float(score) * 3.5 + 1 for score in scores]  # Undo the normalization
+
+
+def speech(sampling_rate, seconds, clean_path, f0=120.0):
+    if clean_path is None:
+        return synthetic_speech(sampling_rate, seconds, f0)
+    audio = audioread(clean_path, sampling_rate, False)[0][0]
+    return np.resize(audio, int(sampling_rate * seconds))  # Loops the file over the duration
+
+
+def test_signal(task, sampling_rate, seconds, clean_path):
+    """The model input at its rate and the references its outputs are scored against."""
+    if task == "speech_separation":
+        # Two talkers at different pitches, with their syllables interleaved
+        first = speech(sampling_rate, seconds, clean_path)
+        second = np.roll(synthetic_speech(sampling_rate, seconds, f0=210.0), sampling_rate // 8)
+        references = [0.5 * first, 0.5 * second]
+        return references[0] + references[1], references
+    clean = speech(sampling_rate, seconds, clean_path)
+    if task == "speech_super_resolution":
+        return clean, [clean]  # Band-limited when written at SR_INPUT_RATE
+    noise = np.random.RandomState(1).randn(len(clean))
+    noise *= np.sqrt(np.mean(clean ** 2) / np.mean(noise ** 2) / 10 ** (INPUT_SNR / 10))
+    noisy = clean + noise
+    scale = min(1.0, 0.99 / np.max(np.abs(noisy)))
+    return noisy * scale, [clean * scale]
+
+
+def quality(outputs, references, sampling_rate):
+    """Mean PESQ and SI-SNR of the outputs, for the permutation of the outputs with the best SI-SNR."""
+    length = min(len(references[0]), min(len(output) for output in outputs))
+    outputs = [np.asarray(output, dtype=np.float64)[:length] for output in outputs]
+    references = [reference[:length] for reference in references]
+    best = max(permutations(range(len(outputs)), len(references)),
+               key=lambda order: sum(si_snr(outputs[i], reference) for i, reference in zip(order, references)))
+    outputs = [outputs[i] for i in best]
+    scores = pesq_scores(outputs, references, sampling_rate)
+    pesq = None if scores is None else float(np.mean(scores))
+    return pesq, float(np.mean([si_snr(output, reference) for output, reference in zip(outputs, references)]))
+
+
+def run(network, path, output_path):
+    """Reads, decodes and writes the file as ClearVoice does, returns the outputs and the wall time."""
+    network.args.input_path = path
+    start = time.perf_counter()
+    inputs, _, length, _, audio_info = DataReader(network.args)[0]
+    outputs = decode_one_audio(network.model, network.device, inputs[0], network.args)
+    outputs = outputs if isinstance(outputs, list) else [outputs]
+    outputs = [np.reshape(output, -1)[:length] for output in outputs]
+    for spk, output in enumerate(outputs):
+        network.write_audio(output_path.format(spk), audio=output[None, :], data=dict(audio_info))
+    return outputs, time.perf_counter() - start
+
+
+def write_input(task, rate, file_rate, seconds, clean_path, path):
+    """Writes the test signal to a 16-bit file at file_rate, returns its references."""
+    audio, references = test_signal(task, rate, seconds, clean_path)
+    if file_rate != rate:
+        audio = librosa.resample(audio, orig_sr=rate, target_sr=file_rate)
+    sf.write(path, audio.astype(np.float32), file_rate, subtype="PCM_16")
+    return references
+
+
+def benchmark(name, seconds_list, args, work_dir):
+    task = MODELS[name]
+    network = network_wrapper()(task, name)
+    rate = network.args.sampling_rate
+    file_rate = args.file_rate or (SR_INPUT_RATE if task == "speech_super_resolution" else rate)
+    path = os.path.join(work_dir, "input.wav")
+    output_path = os.path.join(work_dir, "output_{}.wav")
+
+    write_input(task, rate, file_rate, min(seconds_list), args.clean, path)
+    with torch.no_grad():
+        run(network, path, output_path)  # Warm-up, the first calls allocate the caches and plans
+
+    rows = []
+    for seconds in seconds_list:
+        references = write_input(task, rate, file_rate, seconds, args.clean, path)
+        best = None
+        for _ in range(args.repeat):
+            with torch.no_grad(), recording() as times, PeakRSS() as memory:
+                outputs, wall = run(network, path, output_path)
+            if best is None or wall < best[1]:
+                best = (outputs, wall, times.as_dict(), memory.peak)
+        outputs, wall, stages, peak = best
+        stages["other"] = max(0.0, wall - sum(stages.values()))
+        pesq, snr = (None, None) if args.no_quality else quality(outputs, references, rate)
+        row = {"model": name, "seconds": seconds, "rtf": wall / seconds, "wall_seconds": wall,
+               "peak_rss_mb": peak / 2 ** 20, "pesq": pesq, "si_snr": snr}
+        row.update({f"{stage}_seconds": stages[stage] for stage in STAGES + ["other"]})
+        rows.append(row)
+        print(f"{name:>22} {seconds:>6g}s {row['rtf']:>7.3f} {row['peak_rss_mb']:>8.0f} "
+              + " ".join(f"{stages[stage] / wall:>7.1%}" for stage in STAGES + ["other"])
+              + f" {_format(pesq, '.2f'):>5} {_format(snr, '.1f'):>6}", flush=True)
+    return rows
+
+
+def _format(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def regressions(rows, baseline_path, args):
+    """Rows slower or worse than the baseline results beyond the tolerances."""
+    with open(baseline_path) as f:
+        baseline = {(row["model"], row["seconds"]): row for row in json.load(f)["results"]}
+    found = []
+    for row in rows:
+        base = baseline.get((row["model"], row["seconds"]))
+        if base is None:
+            continue
+        key = f"{row['model']} {row['seconds']:g}s"
+        if row["rtf"] > base["rtf"] * (1 + args.rtf_tolerance):
+            found.append(f"{key}: RTF {row['rtf']:.3f}, baseline {base['rtf']:.3f}")
+        for metric, tolerance in [("pesq", args.pesq_tolerance), ("si_snr", args.si_snr_tolerance)]:
+            if row[metric] is not None and base.get(metric) is not None and row[metric] < base[metric] - tolerance:
+                found.append(f"{key}: {metric} {row[metric]:.2f}, baseline {base[metric]:.2f}")
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Real-time factor, memory, stage times and quality of the ClearVoice models on CPU")
+    parser.add_argument("--models", nargs="+", default=list(MODELS), choices=list(MODELS))
+    parser.add_argument("--seconds", type=float, nargs="+", default=[1, 3, 10, 60, 600], help="Input lengths")
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per length, the fastest is reported")
+    parser.add_argument("--clean", default=None, help="Clean speech file looped over each length, synthetic speech if not set")
+    parser.add_argument("--file-rate", type=int, default=None,
+                        help=f"Rate of the input files, the model's own rate if not set ({SR_INPUT_RATE} for super-resolution)")
+    parser.add_argument("--no-quality", action="store_true", help="Skip PESQ and SI-SNR")
+    parser.add_argument("--output-dir", default="benchmark_results", help="Directory of results.json and results.csv")
+    parser.add_argument("--baseline", default=None, help="results.json to compare against, exits with 1 on regressions")
+    parser.add_argument("--rtf-tolerance", type=float, default=0.2, help="Allowed relative RTF increase")
+    parser.add_argument("--pesq-tolerance", type=float, default=0.05)
+    parser.add_argument("--si-snr-tolerance", type=float, default=0.5, help="In dB")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    environment = {"torch": torch.__version__, "numpy": np.__version__, "python": platform.python_version(),
+                   "platform": platform.platform(), "processor": platform.processor(), "threads": args.threads}
+    print(f"CPU, {args.threads} threads, torch {torch.__version__}, stage shares of the wall time")
+    print(f"{'model':>22} {'input':>7} {'RTF':>7} {'RSS MB':>8} " + " ".join(f"{stage:>7}" for stage in STAGES + ["other"])
+          + f" {'PESQ':>5} {'SI-SNR':>6}")
+    rows = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in args.models:
+            rows += benchmark(name, args.seconds, args, work_dir)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, "results.json"), "w") as f:
+        json.dump({"environment": environment, "results": rows}, f, indent=2)
+    with open(os.path.join(args.output_dir, "results.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Results written to {args.output_dir}")
+
+    if args.baseline:
+        found = regressions(rows, args.baseline, args)
+        for line in found:
+            print(f"Regression: {line}")
+        sys.exit(1 if found else 0)
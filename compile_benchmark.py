@@ -0,0 +1,59 @@
+import argparse
+import time
+from argparse import Namespace
+import torch
+import yaml
+from clearvoice.utils.compiled import COMPILED_NETWORKS, example_input, trace_model
+
+
+def load_network(name):
+    """The network with random weights and its inference config."""
+    with open(f"clearvoice/config/inference/{name}.yaml") as f:
+        args = Namespace(**yaml.safe_load(f))
+    if name == "FRCRN_SE_16K":
+        from clearvoice.models.frcrn_se.frcrn import FRCRN_SE_16K as Network
+    elif name == "MossFormerGAN_SE_16K":
+        from clearvoice.models.mossformer_gan_se.generator import MossFormerGAN_SE_16K as Network
+    elif name == "MossFormer2_SE_48K":
+        from clearvoice.models.mossformer2_se.mossformer2_se_wrapper import MossFormer2_SE_48K as Network
+    else:
+        from clearvoice.models.mossformer2_ss.mossformer2 import MossFormer2_SS_16K as Network
+    return Network(args).model.eval(), args
+
+
+def best_seconds(model, x, repeat):
+    with torch.no_grad():
+        model(x)  # Warm-up, the first calls of a traced module also run its optimization passes
+        model(x)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model(x)
+            times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Real-time factor of the eager and the traced networks")
+    parser.add_argument("--networks", nargs="+", default=COMPILED_NETWORKS, choices=COMPILED_NETWORKS)
+    parser.add_argument("--seconds", type=float, default=2.0, help="Input length")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    print(f"CPU, random weights, {args.seconds:g}s input, batch of {args.batch_size}, torch {torch.__version__}")
+    print(f"{'network':>22} {'trace (s)':>10} {'eager RTF':>10} {'traced RTF':>11} {'speedup':>8}")
+    for name in args.networks:
+        model, config = load_network(name)
+        x = example_input(config, args.seconds, args.batch_size)
+        start = time.perf_counter()
+        traced = trace_model(model, x)
+        trace_time = time.perf_counter() - start
+        audio_seconds = args.seconds * args.batch_size
+        eager = best_seconds(model, x, args.repeat) / audio_seconds
+        if traced is None:
+            print(f"{name:>22} {'failed':>10} {eager:>10.3f} {'-':>11} {'-':>8}")
+            continue
+        compiled = best_seconds(traced, x, args.repeat) / audio_seconds
+        print(f"{name:>22} {trace_time:>10.1f} {eager:>10.3f} {compiled:>11.3f} {eager / compiled:>7.2f}x")
@@ -0,0 +1,61 @@
+import argparse
+import tempfile
+import time
+import numpy as np
+import torch
+from clearvoice.network_wrapper import network_wrapper
+from clearvoice.utils.decode import decode_one_audio
+from clearvoice.utils.onnx_backend import ONNX_NETWORKS, PARITY_ATOL, load_onnx_model
+
+
+def load_network(name, checkpoint_dir, threads):
+    """The network with random weights, and its inference config with the onnxruntime backend."""
+    wrapper = network_wrapper()
+    wrapper.model_name = name
+    wrapper.load_args_se()
+    args = wrapper.args
+    args.network, args.checkpoint_dir, args.backend = name, checkpoint_dir, "onnxruntime"
+    args.onnx_intra_op_threads = threads
+    if name == "FRCRN_SE_16K":
+        from clearvoice.models.frcrn_se.frcrn import FRCRN_SE_16K as Network
+    else:
+        from clearvoice.models.mossformer_gan_se.generator import MossFormerGAN_SE_16K as Network
+    return Network(args).model.eval(), args
+
+
+def decode_seconds(model, inputs, args, repeat):
+    times = []
+    with torch.no_grad():
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs = decode_one_audio(model, torch.device("cpu"), inputs, args)
+            times.append(time.perf_counter() - start)
+    return min(times), np.asarray(outputs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parity and real-time factor of the torch and ONNX Runtime backends")
+    parser.add_argument("--networks", nargs="+", default=ONNX_NETWORKS, choices=ONNX_NETWORKS)
+    parser.add_argument("--seconds", type=float, nargs="+", default=[1.0, 3.0], help="Input lengths")
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads(), help="Threads of both backends")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    print(f"CPU, random weights, {args.threads} threads, torch {torch.__version__}, parity tolerance {PARITY_ATOL}")
+    print(f"{'network':>22} {'input':>6} {'max diff':>9} {'torch RTF':>10} {'onnx RTF':>9} {'speedup':>8}")
+    for name in args.networks:
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            model, config = load_network(name, checkpoint_dir, args.threads)
+            onnx_model = load_onnx_model(model, config, torch.device("cpu"))
+            if onnx_model is model:
+                print(f"{name:>22} export failed")
+                continue
+            for seconds in args.seconds:
+                inputs = np.random.RandomState(0).randn(1, int(config.sampling_rate * seconds)).astype(np.float32) * 0.1
+                torch_time, expected = decode_seconds(model, inputs, config, args.repeat)
+                onnx_time, actual = decode_seconds(onnx_model, inputs, config, args.repeat)
+                difference = np.abs(expected - actual).max()
+                print(f"{name:>22} {seconds:>5g}s {difference:>9.1e} {torch_time / seconds:>10.3f} "
+                      f"{onnx_time / seconds:>9.3f} {torch_time / onnx_time:>7.2f}x")
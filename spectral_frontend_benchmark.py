@@ -0,0 +1,87 @@
+import timeit
+from argparse import Namespace
+import torch
+from clearvoice.utils.misc import get_spectral_frontend, apply_phase
+
+# The MossFormerGAN_SE_16K config, and the 3-second chunks the live path sends
+ARGS = Namespace(win_type="hamming", win_len=400, win_inc=100, fft_len=400, sampling_rate=16000)
+CHUNK_SECONDS = 3
+
+
+def stft_compress_reference(x, args):
+    """The original path: a new window per call, then power_compress through angle, cos and sin."""
+    window = torch.hamming_window(args.win_len, periodic=True).to(x.device)
+    spec = torch.stft(x, args.fft_len, args.win_inc, args.win_len, center=True, window=window,
+                      onesided=True, return_complex=False)
+    spec = torch.complex(spec[..., 0], spec[..., 1])
+    mag = torch.abs(spec) ** 0.3
+    phase = torch.angle(spec)
+    return torch.stack([mag * torch.cos(phase), mag * torch.sin(phase)], 1)
+
+
+def uncompress_istft_reference(real, imag, args):
+    spec = torch.complex(real, imag)
+    mag = torch.abs(spec) ** (1. / 0.3)
+    phase = torch.angle(spec)
+    spec = torch.stack([mag * torch.cos(phase), mag * torch.sin(phase)], -1).squeeze(1)
+    window = torch.hamming_window(args.win_len, periodic=True).to(real.device)
+    return torch.istft(torch.view_as_complex(spec.contiguous()), args.fft_len, args.win_inc, args.win_len,
+                       window=window, center=True, onesided=True)
+
+
+def recompose_reference(out_mag, x):
+    phase = torch.angle(torch.complex(x[:, 0], x[:, 1])).unsqueeze(1)
+    return out_mag * torch.cos(phase), out_mag * torch.sin(phase)
+
+
+def recompose_frontend(out_mag, x):
+    real, imag = x[:, 0:1], x[:, 1:2]
+    return apply_phase(out_mag, real, imag, torch.sqrt(real ** 2 + imag ** 2))
+
+
+def time_ms(fn, number=50):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1000
+
+
+if __name__ == "__main__":
+    torch.set_num_threads(1)
+    devices = ["cpu"] + (["cuda"] if torch.cuda.is_available() else [])
+    for device in devices:
+        x = torch.randn(1, ARGS.sampling_rate * CHUNK_SECONDS, device=device) * 0.1
+        x[:, :1000] = 0  # Silent bins exercise the zero-magnitude case
+        frontend = get_spectral_frontend(ARGS, device)
+
+        expected = stft_compress_reference(x, ARGS)
+        actual = frontend.compress_stft(x)
+        assert torch.allclose(expected, actual, atol=1e-5), "Compressed spectra differ"
+        real, imag = actual[:, 0:1], actual[:, 1:2]
+        expected = uncompress_istft_reference(real, imag, ARGS)
+        actual = frontend.uncompress_istft(real, imag)
+        assert torch.allclose(expected, actual, atol=1e-5), "Reconstructed signals differ"
+
+        spec = frontend.compress_stft(x)
+        out_mag = torch.rand_like(spec[:, 0:1])
+        for e, a in zip(recompose_reference(out_mag, spec), recompose_frontend(out_mag, spec)):
+            assert torch.allclose(e, a, atol=1e-5), "Recomposed spectra differ"
+
+        sync = torch.cuda.synchronize if device == "cuda" else (lambda: None)
+
+        def run(fn):
+            def timed():
+                fn()
+                sync()
+            return time_ms(timed)
+
+        rows = [
+            ("stft + compress", run(lambda: stft_compress_reference(x, ARGS)), run(lambda: frontend.compress_stft(x))),
+            ("uncompress + istft", run(lambda: uncompress_istft_reference(real, imag, ARGS)),
+             run(lambda: frontend.uncompress_istft(real, imag))),
+            ("SyncANet recompose", run(lambda: recompose_reference(out_mag, spec)), run(lambda: recompose_frontend(out_mag, spec))),
+        ]
+        print(f"{CHUNK_SECONDS}s chunk on {device}")
+        print(f"{'stage':>20} {'before (ms)':>12} {'after (ms)':>11} {'speedup':>8}")
+        for name, before, after in rows:
+            print(f"{name:>20} {before:>12.3f} {after:>11.3f} {before / after:>7.2f}x")
+        before = sum(row[1] for row in rows)
+        after = sum(row[2] for row in rows)
+        print(f"{'per chunk':>20} {before:>12.3f} {after:>11.3f} {before / after:>7.2f}x")
@@ -0,0 +1,60 @@
+import argparse
+import time
+import numpy as np
+import torch
+from clearvoice.network_wrapper import network_wrapper
+from clearvoice.utils.decode import decode_one_audio
+from clearvoice.utils.stream_decode import MossFormerGANStreamer
+
+# (block_ms, context_ms, lookahead_ms) settings of MossFormerGANStreamer to compare
+SETTINGS = [(80, 1000, 20), (160, 320, 40), (320, 320, 40), (320, 640, 40), (500, 500, 40)]
+
+
+def load_network():
+    """MossFormerGAN_SE_16K with random weights, and its inference config."""
+    wrapper = network_wrapper()
+    wrapper.model_name = "MossFormerGAN_SE_16K"
+    wrapper.load_args_se()
+    args = wrapper.args
+    args.network = "MossFormerGAN_SE_16K"
+    from clearvoice.models.mossformer_gan_se.generator import MossFormerGAN_SE_16K
+    return MossFormerGAN_SE_16K(args).model.eval(), args
+
+
+def stream_seconds(streamer, pcm, piece_bytes):
+    start = time.perf_counter()
+    for i in range(0, len(pcm), piece_bytes):
+        streamer.push(pcm[i:i + piece_bytes])
+    streamer.flush()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Real-time factor of the MossFormerGAN_SE_16K streamer against offline decoding")
+    parser.add_argument("--seconds", type=float, default=4.0, help="Input length")
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    model, config = load_network()
+    device = torch.device("cpu")
+    audio = np.random.RandomState(0).randn(int(config.sampling_rate * args.seconds)).astype(np.float32) * 0.1
+    pcm = (audio * 32767).astype(np.int16).tobytes()
+    piece_bytes = config.sampling_rate // 50 * 2  # 20 ms WebRTC frames
+
+    with torch.no_grad():
+        decode_one_audio(model, device, audio[None, :1600], config)  # Warm-up
+        start = time.perf_counter()
+        decode_one_audio(model, device, audio[None, :], config)
+        offline = (time.perf_counter() - start) / args.seconds
+
+    print(f"CPU, random weights, {args.threads} threads, {args.seconds:g}s input, torch {torch.__version__}")
+    print(f"{'block ms':>9} {'context ms':>11} {'lookahead ms':>13} {'latency ms':>11} {'RTF':>7} {'vs offline':>11}")
+    print(f"{'offline':>9} {'-':>11} {'-':>13} {'-':>11} {offline:>7.3f} {1:>10.2f}x")
+    for block_ms, context_ms, lookahead_ms in SETTINGS:
+        streamer = MossFormerGANStreamer(model, device, config, block_ms, context_ms, lookahead_ms)
+        latency = (block_ms + lookahead_ms) + (config.win_len - config.win_inc) / config.sampling_rate * 1000
+        rtf = stream_seconds(streamer, pcm, piece_bytes) / args.seconds
+        print(f"{block_ms:>9} {context_ms:>11} {lookahead_ms:>13} {latency:>11.0f} {rtf:>7.3f} {rtf / offline:>10.2f}x",
+              flush=True)
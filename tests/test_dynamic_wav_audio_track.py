@@ -0,0 +1,17 @@
+import asyncio
+from aiortc import RTCPeerConnection
+from transcribe_webrtc_server.dynamic_wav_audio_track import DynamicWavAudioTrack
+
+
+def test_track_can_be_added_to_a_peer_connection():
+    async def add_track():
+        peer_connection = RTCPeerConnection()
+        try:
+            track = DynamicWavAudioTrack()
+            sender = peer_connection.addTrack(track)
+            assert track.kind == "audio"
+            assert sender.track is track
+        finally:
+            await peer_connection.close()
+
+    asyncio.run(add_track())
@@ -0,0 +1,42 @@
+from argparse import Namespace
+import numpy as np
+import torch
+from clearvoice.utils.decode import decode_one_audio
+from clearvoice.utils.quantization import synthetic_speech
+from clearvoice.utils.stream_decode import MossFormerGANStreamer
+
+ARGS = Namespace(network='MossFormerGAN_SE_16K', sampling_rate=16000, win_len=400, win_inc=100, fft_len=400,
+                 win_type='hamming', decode_window=10, one_time_decode_length=10, decode_batch_size=1)
+
+
+class SaturatingModel(torch.nn.Module):
+    """Stands in for SyncANet: soft-clips the compressed magnitude, so its output level depends
+    on the level of its input, as the real network's does."""
+
+    def forward(self, spec):
+        magnitude = torch.sqrt(spec[:, 0] ** 2 + spec[:, 1] ** 2).unsqueeze(1) + 1e-8
+        gain = torch.tanh(magnitude) / magnitude
+        return [spec[:, :1] * gain, spec[:, 1:] * gain]
+
+
+def rms(x):
+    return float(np.sqrt(np.mean(np.asarray(x, dtype=np.float64) ** 2)))
+
+
+def test_speech_after_silence_is_as_loud_as_offline():
+    rate = ARGS.sampling_rate
+    silence = rate // 2
+    audio = np.concatenate([np.zeros(silence), synthetic_speech(rate, 2.0) * 0.3]).astype(np.float32)
+    pcm = (audio * 32767).astype(np.int16).tobytes()
+    model = SaturatingModel()
+
+    offline = np.reshape(decode_one_audio(model, torch.device('cpu'), audio[None, :], ARGS), -1)
+    streamer = MossFormerGANStreamer(model, torch.device('cpu'), ARGS)
+    pieces = [streamer.push(pcm[i:i + 640]) for i in range(0, len(pcm), 640)] + [streamer.flush()]
+    streamed = np.concatenate(pieces).astype(np.float32) / 32768.0
+    assert len(streamed) == len(audio)
+
+    # The first words, and the speech as a whole, within 3 dB of offline decoding
+    for start, end in [(silence, silence + rate // 2), (silence, len(audio))]:
+        ratio = rms(streamed[start:end]) / rms(offline[start:end])
+        assert 2 ** -0.5 < ratio < 2 ** 0.5, (start, end, ratio)
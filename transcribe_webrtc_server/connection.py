@@ -4,8 +4,9 @@ from aiortc import (
 )
 
 from transcriber.transcriber import SpeechTranscriber
+from transcriber.latency import ConnectionLatency
 from .dynamic_wav_audio_track import DynamicWavAudioTrack
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 @dataclass
@@ -15,3 +16,4 @@ class Connection:
     data_channel: RTCDataChannel
     transcriber: SpeechTranscriber
     name: str
+    latency: ConnectionLatency = field(default_factory=ConnectionLatency)
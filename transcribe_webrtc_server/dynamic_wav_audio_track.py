@@ -1,7 +1,8 @@
 import asyncio
+from collections import deque
 from fractions import Fraction
-from queue import Queue
-from av import AudioFrame
+from av import AudioFrame, AudioResampler
+import numpy as np
 import time
 import wave
 import io
@@ -15,10 +16,22 @@ class MediaStreamError(Exception):
 
 
 class DynamicWavAudioTrack(MediaStreamTrack):
+    """Plays queued WAV replies back over WebRTC, and silence in between.
+
+    Every WAV is parsed and converted to the track's format once, before it's queued,
+    so recv only has to move a memoryview cursor over the PCM and copy one frame's
+    worth into a pooled AudioFrame. The track keeps a single sample rate and layout
+    for its whole life, so timestamps never jump between replies.
+
+    The conversion is the slow part, so the server runs `convert` off the event loop,
+    once per reply chunk and `pcm_format`, and hands the same PCM to `enqueue_pcm` of
+    every track with that format.
+    """
+
     kind = "audio"
 
     def __init__(
-        self, sample_rate=48000, channels=2, sample_width=2, frame_duration=0.02
+        self, sample_rate=48000, channels=2, sample_width=2, frame_duration=0.02, pool_size=4
     ):
         super().__init__()
         self.sample_rate = sample_rate
@@ -26,80 +39,125 @@ class DynamicWavAudioTrack(MediaStreamTrack):
         self.sample_width = sample_width
         self.frame_duration = frame_duration
         self.start_time = time.time()
-        self.queue = Queue()  # Queue to hold WAV file bytes
-        self.current_wav = None
+        self.queue = deque()  # (memoryview over PCM already in the track's format, UtteranceTrace or None)
+        self.current_pcm = None
+        self.cursor = 0
         self.timestamp = 0
 
-    def enqueue_wav(self, wav_bytes: bytes):
-        # Call this method to add new WAV file bytes to the track
-        self.queue.put(wav_bytes)
+        self.format = "s16" if sample_width == 2 else "s32"
+        self.layout = "stereo" if channels == 2 else "mono"
+        self.samples_per_frame = int(sample_rate * frame_duration)
+        self.frame_bytes = self.samples_per_frame * channels * sample_width
 
-    async def recv(self):
-        # If no WAV file is currently playing, try to load one from the queue
-        if self.current_wav is None:
-            if not self.queue.empty():
-                print("Playing queued data")
-                wav_bytes = self.queue.get()
-                self.current_wav = wave.open(io.BytesIO(wav_bytes), "rb")
-                self.sample_rate = self.current_wav.getframerate()
-                self.channels = self.current_wav.getnchannels()
-                self.sample_width = self.current_wav.getsampwidth()
-            else:
-                # No WAV data available; output silence
-                return await self._create_silence_frame()
-
-        # Read a chunk corresponding to frame_duration
-        num_samples = int(self.sample_rate * self.frame_duration)
-        raw_data = self.current_wav.readframes(num_samples)
-        if not raw_data:
-            # Finished current WAV file; clear it so next call can load a new one
-            self.current_wav = None
-            return await self._create_silence_frame()
-
-        try:
-            self.timestamp += num_samples
-            fmt = "s16" if self.sample_width == 2 else "s32"
-            layout = "stereo" if self.channels == 2 else "mono"
-            frame = AudioFrame(format=fmt, layout=layout, samples=num_samples)
+        # The encoder may still be holding the last frame or two we handed out,
+        # so frames are rotated through a small pool rather than reused immediately
+        self.audio_frames = [self._allocate_frame() for _ in range(pool_size)]
+        self.silence_frames = [self._allocate_frame() for _ in range(pool_size)]
+        for frame in self.silence_frames:
             for p in frame.planes:
-                p.update(raw_data)
+                p.update(bytes(p.buffer_size))
+        self.frame_index = 0
 
-            frame.sample_rate = self.sample_rate
-            frame.pts = self.timestamp
-            frame.time_base = Fraction(1, self.sample_rate)
+    def _allocate_frame(self):
+        frame = AudioFrame(format=self.format, layout=self.layout, samples=self.samples_per_frame)
+        frame.sample_rate = self.sample_rate
+        frame.time_base = Fraction(1, self.sample_rate)
+        return frame
 
-            wait = self.start_time + \
-                (self.timestamp / self.sample_rate) - time.time()
-            # print(f'{wait}  \t---  {self.start_time}\t{frame.pts}\t{self.sample_rate}')
-            await asyncio.sleep(wait)
-        except Exception as e:
-            print(e)
+    @property
+    def pcm_format(self):
+        """Tracks with the same pcm_format can play the same converted PCM."""
+        return self.sample_rate, self.channels, self.sample_width, self.frame_bytes
 
-        # print('fram')
-        return frame
+    def convert(self, wav_bytes: bytes) -> memoryview:
+        """Converts WAV bytes to PCM in the track's format, padded to whole frames. Thread-safe."""
+        return memoryview(self._convert(wav_bytes))
 
-    async def _create_silence_frame(self):
-        """
-        Receive the next :class:`~av.audio.frame.AudioFrame`.
+    def enqueue_pcm(self, pcm: memoryview, trace=None):
+        # The trace of the utterance it replies to is marked when it's queued and when it starts playing
+        if len(pcm):
+            if trace is not None:
+                trace.mark("reply_queued")
+            self.queue.append((pcm, trace))
 
-        The base implementation just reads silence, subclass
-        :class:`AudioStreamTrack` to provide a useful implementation.
-        """
+    def enqueue_wav(self, wav_bytes: bytes, trace=None):
+        # Call this method to add new WAV file bytes to the track
+        self.enqueue_pcm(self.convert(wav_bytes), trace)
+
+    def cancel(self):
+        """Stops the reply that's playing and drops everything queued after it (barge-in)."""
+        self.queue.clear()
+        self.current_pcm = None
+        self.cursor = 0
+
+    @property
+    def is_playing(self):
+        return self.current_pcm is not None or bool(self.queue)
+
+    def _convert(self, wav_bytes: bytes) -> bytes:
+        """Reads the WAV once and returns its PCM in the track's format, padded to whole frames."""
+        with wave.open(io.BytesIO(wav_bytes), "rb") as wav:
+            sample_rate = wav.getframerate()
+            channels = wav.getnchannels()
+            sample_width = wav.getsampwidth()
+            pcm = wav.readframes(wav.getnframes())
+
+        if (sample_rate, channels, sample_width) != (self.sample_rate, self.channels, self.sample_width):
+            if sample_width not in (2, 4):
+                print(f"Unsupported WAV sample width: {sample_width}")
+                return b""
+
+            dtype = np.int16 if sample_width == 2 else np.int32
+            samples = np.frombuffer(pcm, dtype=dtype)
+            samples = samples[:len(samples) - len(samples) % channels].reshape(1, -1)
+            frame = AudioFrame.from_ndarray(
+                samples, format="s16" if sample_width == 2 else "s32", layout="stereo" if channels == 2 else "mono")
+            frame.sample_rate = sample_rate
+
+            resampler = AudioResampler(format=self.format, layout=self.layout, rate=self.sample_rate)
+            frames = resampler.resample(frame) + resampler.resample(None)
+            pcm = b"".join(f.to_ndarray().tobytes() for f in frames)
+
+        # Pad the tail with silence so every frame is a full slice of the payload
+        remainder = len(pcm) % self.frame_bytes
+        if remainder:
+            pcm += bytes(self.frame_bytes - remainder)
+        return pcm
+
+    def _next_frame(self, frames):
+        frame = frames[self.frame_index % len(frames)]
+        self.frame_index += 1
+        return frame
+
+    async def recv(self):
         if self.readyState != "live":
             raise MediaStreamError
 
-        samples = int(self.frame_duration * self.sample_rate)
+        # If no WAV file is currently playing, try to load one from the queue
+        if self.current_pcm is None and self.queue:
+            print("Playing queued data")
+            self.current_pcm, trace = self.queue.popleft()
+            self.cursor = 0
+            if trace is not None:
+                trace.mark("reply_playing")
+
+        if self.current_pcm is None:
+            # No WAV data available; output silence
+            frame = self._next_frame(self.silence_frames)
+        else:
+            frame = self._next_frame(self.audio_frames)
+            frame.planes[0].update(self.current_pcm[self.cursor:self.cursor + self.frame_bytes])
+            self.cursor += self.frame_bytes
+            if self.cursor >= len(self.current_pcm):
+                # Finished current WAV file; clear it so next call can load a new one
+                self.current_pcm = None
+
+        self.timestamp += self.samples_per_frame
+        frame.pts = self.timestamp
 
-        self.timestamp += samples
         wait = self.start_time + \
             (self.timestamp / self.sample_rate) - time.time()
-        # print(f'{wait}  \t---  {self.start_time}\t{self.timestamp}\t{self.sample_rate}')
+        # print(f'{wait}  \t---  {self.start_time}\t{frame.pts}\t{self.sample_rate}')
         await asyncio.sleep(wait)
 
-        frame = AudioFrame(format="s16", layout="mono", samples=samples)
-        for p in frame.planes:
-            p.update(bytes(p.buffer_size))
-        frame.pts = self.timestamp
-        frame.sample_rate = self.sample_rate
-        frame.time_base = Fraction(1, self.sample_rate)
         return frame
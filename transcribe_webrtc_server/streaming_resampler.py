@@ -0,0 +1,129 @@
+from math import gcd
+import numpy as np
+from av import AudioFrame
+
+
+# Scale that maps each sample format onto [-1, 1). Planar formats share their packed twin's scale
+SAMPLE_SCALES = {
+    "u8": 128.0,
+    "s16": 32768.0,
+    "s32": 2147483648.0,
+    "flt": 1.0,
+    "dbl": 1.0,
+}
+
+
+class StreamingResampler:
+    """Stateful polyphase resampler from incoming WebRTC frames to 16-bit mono PCM.
+
+    The resampling ratio output_rate / input_rate is reduced to up / down, and a
+    Kaiser-windowed sinc lowpass is split into `up` polyphase branches, so each output
+    sample costs one short dot product. The last few input samples and the output
+    position are carried over from one frame to the next, so there are no gaps or
+    dropped remainders at frame boundaries.
+
+    Frames are read according to their own `format` and `layout`: packed and planar
+    layouts are both handled, and multichannel audio is downmixed to mono. If the
+    input rate changes mid-stream, the filter is rebuilt and the history is cleared.
+    """
+
+    def __init__(self, output_rate=16000, zero_crossings=16, kaiser_beta=8.0):
+        self.output_rate = output_rate
+        self.zero_crossings = zero_crossings
+        self.kaiser_beta = kaiser_beta
+        self.input_rate = None
+
+        # Reusable buffers, grown when a larger frame shows up
+        self.mono = np.zeros(0, dtype=np.float32)
+        self.output = np.zeros(0, dtype=np.int16)
+        self.scratch = np.zeros(0, dtype=np.float32)
+
+    def _configure(self, input_rate):
+        self.input_rate = input_rate
+        divisor = gcd(self.output_rate, input_rate)
+        self.up = self.output_rate // divisor
+        self.down = input_rate // divisor
+
+        # Lowpass at the lower of the two Nyquist rates, designed at the upsampled rate
+        self.taps = 2 * self.zero_crossings * max(1, -(-self.down // self.up))
+        length = self.taps * self.up
+        cutoff = 0.5 / max(self.up, self.down)
+        time = np.arange(length) - (length - 1) / 2
+        prototype = np.sinc(2 * cutoff * time) * np.kaiser(length, self.kaiser_beta)
+        prototype *= self.up / prototype.sum()  # Unity gain once the zero-stuffed input is filtered
+
+        # Branch p holds h[p], h[p + up], ... reversed, so it lines up with a forward window
+        self.bank = np.ascontiguousarray(prototype.reshape(self.taps, self.up).T[:, ::-1], dtype=np.float32)
+
+        # Input history, starting with taps - 1 zeros so the first output has a full window.
+        # position is the next output's index times down, in upsampled samples from the history start
+        self.history = np.zeros(self.taps - 1, dtype=np.float32)
+        self.position = 0
+
+    def reset(self):
+        self.input_rate = None
+
+    def _to_mono(self, frame: AudioFrame):
+        """Reads the frame into the reusable mono float buffer and returns a view of it."""
+        channels = len(frame.layout.channels)
+        samples = frame.samples
+        format_name = frame.format.name.rstrip("p")
+
+        # Packed audio comes back as (1, samples * channels), planar as (channels, samples)
+        data = frame.to_ndarray()
+        if frame.format.is_planar:
+            data = data.reshape(channels, samples)
+        else:
+            data = data.reshape(samples, channels).T
+
+        if len(self.mono) < samples:
+            self.mono = np.zeros(samples, dtype=np.float32)
+        mono = self.mono[:samples]
+        np.copyto(mono, data[0], casting="unsafe")
+        for channel in data[1:]:
+            np.add(mono, channel, out=mono, casting="unsafe")
+        if format_name == "u8":
+            mono -= 128.0 * channels
+        mono *= 1.0 / (SAMPLE_SCALES.get(format_name, 1.0) * channels)
+        return mono
+
+    def resample(self, frame: AudioFrame):
+        """Resamples one frame and returns its int16 PCM as a byte memoryview.
+
+        The view points into a reusable buffer and is only valid until the next call.
+        """
+        if frame.sample_rate != self.input_rate:
+            self._configure(frame.sample_rate)
+
+        buffer = np.concatenate([self.history, self._to_mono(frame)])
+
+        # Output n reads the window starting at position // up with branch position % up,
+        # so every output whose window fits in the buffer can be produced now
+        windows_available = len(buffer) - self.taps + 1
+        count = max(0, -(-(windows_available * self.up - self.position) // self.down))
+
+        if len(self.output) < count:
+            self.scratch = np.zeros(count * 2, dtype=np.float32)
+            self.output = np.zeros(count * 2, dtype=np.int16)
+        result = self.scratch[:count]
+
+        # Outputs that share a branch are every up-th one, and their windows are down
+        # samples apart, so each branch is one strided matrix-vector product
+        windows = np.lib.stride_tricks.sliding_window_view(buffer, self.taps)
+        for offset in range(min(self.up, count)):
+            position = self.position + offset * self.down
+            outputs = result[offset::self.up]
+            np.einsum("ij,j->i", windows[position // self.up::self.down][:len(outputs)],
+                      self.bank[position % self.up], out=outputs)
+
+        # Keep the input from the next window's start onwards
+        self.position += count * self.down
+        consumed = self.position // self.up
+        self.history = buffer[consumed:]
+        self.position -= consumed * self.up
+
+        output = self.output[:count]
+        result *= 32768.0
+        np.clip(result, -32768, 32767, out=result)
+        np.copyto(output, result, casting="unsafe")
+        return memoryview(output).cast("B")
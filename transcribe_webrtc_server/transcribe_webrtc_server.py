@@ -16,16 +16,34 @@ from .dynamic_wav_audio_track import DynamicWavAudioTrack
 from .transcribing_audio_track import TranscribingAudioTrack
 from .connection import Connection
 from transcriber.transcriber import SpeechTranscriber
+from transcriber.startup import startup_timer, warm_up_in_background
 import json as jsonlib
 
 
 class TranscribeWebRTCServer:
-    def __init__(self):
+    def __init__(self, bot_host="http://192.168.1.102:8080/processVoice", streaming=False):
         super().__init__()
         self.connections: list[Connection] = []
-
-    def flush_callback(self, username, personality, gender, source_material, transcribed_text):
-        bot_host = "http://192.168.1.102:8080/processVoice"
+        self.bot_host = bot_host
+        # Transcribe while the user is talking, sending the confirmed words as PARTIAL> messages,
+        # so only the last second or so is left to decode when they stop. Off by default, as
+        # clients that don't know the PARTIAL> messages would take them for transcripts
+        self.streaming = streaming
+        self.http_client: httpx.AsyncClient = None
+
+    def flush_callback(self, username, personality, gender, source_material, transcribed_text, trace=None):
+        # Called from the transcriber's thread. The request runs on the server's event loop,
+        # so the transcriber can get back to listening right away
+        future = asyncio.run_coroutine_threadsafe(
+            self.process_voice(username, personality, gender, source_material, transcribed_text, trace), self.loop)
+        future.add_done_callback(self._report_process_voice_error)
+
+    @staticmethod
+    def _report_process_voice_error(future):
+        if not future.cancelled() and future.exception() is not None:
+            print("Voice request failed:", future.exception())
+
+    async def process_voice(self, username, personality, gender, source_material, transcribed_text, trace=None):
         payload = {
             "prompt": transcribed_text,
             "userId": username,
@@ -38,65 +56,75 @@ class TranscribeWebRTCServer:
             "Content-Type": "application/json",
         }
 
-        with httpx.Client(timeout=360) as client:
-            with client.stream("POST", bot_host, json=payload, headers=headers) as response:
-                response.raise_for_status()
-
-                if response.status_code == 204:
-                    return
-
-                buffer = ""
-
-                first_chunk = True
-
-                for chunk in response.iter_text():
-                    if not chunk:
-                        continue
-
-                    buffer += chunk
-                    parts = buffer.split("\n")
-                    buffer = parts.pop() if parts else ""
-
-                    for part in parts:
-                        try:
-                            obj = jsonlib.loads(part)
-                        except jsonlib.JSONDecodeError as e:
-                            # print("❌ Failed to parse JSON part:", part)
-                            continue
-
-                        # print(f"✅ Got JSON object: {obj['response']}")
-
-                        # Save audio to WAV
-                        if "audio" in obj:
-                            audio_bytes = base64.b64decode(obj["audio"])
-                            file_name = f'response_{datetime.now().strftime("%Y-%m-%d %H-%M-%S")}.wav'
-                            with open(file_name, "wb") as f:
-                                f.write(audio_bytes)
-
-                        for connection in self.connections:
-                            if "audio" in obj:
-                                print(
-                                    f'🎧 Playing response chunk for {connection.name}')
-                                connection.reply_track.enqueue_wav(audio_bytes)
-
-                            if first_chunk:
-                                first_chunk = False
-                                self.loop.call_soon_threadsafe(
-                                    connection.data_channel.send, "FROMUSER>" + obj["respondingTo"])
-                                if "audio" in obj:
-                                    self.loop.call_soon_threadsafe(
-                                        connection.data_channel.send, "FROMBOT>" + obj["response"] + "AUDIO>" + obj["audio"])
-                                else:
-                                    self.loop.call_soon_threadsafe(
-                                        connection.data_channel.send, "FROMBOT>" + obj["response"] + "AUDIO>")
-                            else:
-                                if "audio" in obj:
-                                    self.loop.call_soon_threadsafe(
-                                        connection.data_channel.send, "FROMBOTCHUNK>" + obj["response"] + "AUDIO>" + obj["audio"])
-                                else:
-                                    self.loop.call_soon_threadsafe(
-                                        connection.data_channel.send, "FROMBOTCHUNK>" + obj["response"] + "AUDIO>")
-                                # connection.reply_track.enqueue_wav(MediaPlayer(file_name).audio)
+        if trace is not None:
+            trace.mark("request_sent")
+        async with self.http_client.stream("POST", self.bot_host, json=payload, headers=headers) as response:
+            response.raise_for_status()
+
+            if response.status_code == 204:
+                return
+
+            first_chunk = True
+
+            # aiter_lines keeps the partial last line between chunks, so each
+            # NDJSON object is parsed exactly once
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+
+                try:
+                    obj = jsonlib.loads(line)
+                except jsonlib.JSONDecodeError as e:
+                    # print("❌ Failed to parse JSON part:", line)
+                    continue
+
+                if trace is not None:
+                    trace.mark("reply_received")
+
+                # print(f"✅ Got JSON object: {obj['response']}")
+
+                # Decode the audio once, every connection gets the same bytes
+                audio_bytes = None
+                if "audio" in obj:
+                    audio_bytes = base64.b64decode(obj["audio"])
+                    file_name = f'response_{datetime.now().strftime("%Y-%m-%d %H-%M-%S")}.wav'
+                    await asyncio.to_thread(self._save_response, file_name, audio_bytes)
+
+                messages = []
+                if first_chunk:
+                    first_chunk = False
+                    messages.append("FROMUSER>" + obj["respondingTo"])
+                    messages.append("FROMBOT>" + obj["response"] + "AUDIO>" + obj.get("audio", ""))
+                else:
+                    messages.append("FROMBOTCHUNK>" + obj["response"] + "AUDIO>" + obj.get("audio", ""))
+
+                # Convert the chunk once per track format, off the event loop. Every track plays
+                # from the same read-only PCM
+                pcm_by_format = {}
+                if audio_bytes is not None:
+                    for connection in list(self.connections):
+                        track = connection.reply_track
+                        if track.pcm_format not in pcm_by_format:
+                            pcm_by_format[track.pcm_format] = await asyncio.to_thread(track.convert, audio_bytes)
+
+                for connection in self.connections:
+                    if audio_bytes is not None and connection.reply_track.pcm_format in pcm_by_format:
+                        print(
+                            f'🎧 Playing response chunk for {connection.name}')
+                        # Only the speaker's own reply track carries the trace on to the playback
+                        own = trace is not None and connection.latency is trace.latency
+                        connection.reply_track.enqueue_pcm(
+                            pcm_by_format[connection.reply_track.pcm_format], trace if own else None)
+
+                    if connection.data_channel is not None:
+                        for message in messages:
+                            connection.data_channel.send(message)
+                    # connection.reply_track.enqueue_wav(MediaPlayer(file_name).audio)
+
+    @staticmethod
+    def _save_response(file_name, audio_bytes):
+        with open(file_name, "wb") as f:
+            f.write(audio_bytes)
 
     async def offer(self, request):
         data = await request.json()
@@ -147,10 +175,7 @@ class TranscribeWebRTCServer:
                 if isinstance(message, str) and message.startswith("NAME>"):
                     fields = extract_fields(message)
                     found.name = fields["NAME"]
-                    found.transcriber = SpeechTranscriber(
-                        found.name, fields["PERSONALITY"], fields["GENDER"], fields["SOURCEMATERIAL"], self.flush_callback)
-                    found.transcriber.start_processing()
-                    channel.send("<TRANSCRIBERWARMEDUP>")
+                    asyncio.ensure_future(self.create_transcriber(found, channel, fields))
 
         @peer_connection.on("connectionstatechange")
         def on_connection_state_change():
@@ -173,6 +198,21 @@ class TranscribeWebRTCServer:
                 "type": peer_connection.localDescription.type}
         )
 
+    async def create_transcriber(self, found, channel, fields):
+        # Creating the first transcriber waits for the models to finish loading, which
+        # mustn't block the event loop
+        transcriber = await asyncio.to_thread(
+            SpeechTranscriber,
+            found.name, fields["PERSONALITY"], fields["GENDER"], fields["SOURCEMATERIAL"], self.flush_callback,
+            speech_started_callback=lambda username: self.loop.call_soon_threadsafe(found.reply_track.cancel),
+            latency=found.latency,
+            streaming=self.streaming,
+            partial_callback=lambda username, personality, gender, source_material, text:
+                self.loop.call_soon_threadsafe(channel.send, "PARTIAL>" + text))
+        transcriber.start_processing()
+        found.transcriber = transcriber
+        channel.send("<TRANSCRIBERWARMEDUP>")
+
     async def ice_candidate(self, request):
         data = await request.json()
         print("🌍 Received ICE candidate:", data)
@@ -193,6 +233,14 @@ class TranscribeWebRTCServer:
                 await self.connections[-1].peer_connection.addIceCandidate(candidate)
         return web.Response()
 
+    async def metrics(self, request):
+        """p50/p95 latency of every stage for each live connection, in seconds, and the startup timings."""
+        connections = {}
+        for connection in self.connections:
+            name = connection.name or str(id(connection.peer_connection))
+            connections[name] = connection.latency.summary()
+        return web.json_response({"startup": startup_timer.snapshot(), "connections": connections})
+
     async def cleanup(self):
         """Periodically remove inactive peer connections."""
         while True:
@@ -210,6 +258,10 @@ class TranscribeWebRTCServer:
 
         self.loop = asyncio.get_event_loop()
 
+        # One pooled client for the whole server, so replies reuse kept-alive connections
+        self.http_client = httpx.AsyncClient(
+            timeout=360, limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=60))
+
         ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
         ssl_context.load_cert_chain(
             certfile="cert1.pem", keyfile="privkey1.pem")
@@ -229,6 +281,7 @@ class TranscribeWebRTCServer:
 
         app.router.add_post("/offer", self.offer)
         app.router.add_post("/ice-candidate", self.ice_candidate)
+        app.router.add_get("/metrics", self.metrics)
         for route in list(app.router.routes()):
             cors.add(route)
 
@@ -238,6 +291,9 @@ class TranscribeWebRTCServer:
         print("WebRTC server is running on HTTPS!")
         await site.start()
 
+        # Connections are accepted right away, the models load in the background
+        warm_up_in_background()
+
         try:
             while True:
                 await asyncio.sleep(3600)
@@ -248,3 +304,4 @@ class TranscribeWebRTCServer:
 
             await runner.shutdown()
             await runner.cleanup()
+            await self.http_client.aclose()
@@ -1,11 +1,12 @@
+import time
 from av import AudioFrame
-import numpy as np
 from aiortc import (
     MediaStreamTrack,
 )
 # import pyaudio
 
 from transcriber.transcriber import SpeechTranscriber
+from .streaming_resampler import StreamingResampler
 
 # # Audio Config
 # FORMAT = pyaudio.paInt16
@@ -26,28 +27,22 @@ class TranscribingAudioTrack(MediaStreamTrack):
         super().__init__()
         self.transcriber = transcriber
         self.track = track
+        self.resampler = StreamingResampler(output_rate=16000)
 
     async def recv(self):
         frame = await self.track.recv()
+        start = time.perf_counter()
         pcm_bytes = self.frame_to_pcm(frame)
         # stream.write(pcm_bytes)
         self.transcriber.add_audio_frame(pcm_bytes)
+        self.transcriber.latency.observe("ingest", time.perf_counter() - start)
         return frame
 
     def frame_to_pcm(self, frame: AudioFrame):
-        """Extract PCM bytes from an audio frame and resample to 16000Hz if needed."""
-        pcm_bytes = frame.planes[0]
-        if frame.sample_rate != 16000:
-            pcm_array = np.frombuffer(pcm_bytes, dtype=np.int16)
-            # Compute the resampling factor based on the input sample rate
-            factor = (
-                16000 / 96000
-            )  # it should be frame.sample_rate, but for my current implementation, I've found that it lies
-            new_length = int(len(pcm_array) * factor)
-            resampled_array = np.interp(
-                np.linspace(0, len(pcm_array), new_length, endpoint=False),
-                np.arange(len(pcm_array)),
-                pcm_array,
-            ).astype(np.int16)
-            return resampled_array.tobytes()
-        return pcm_bytes
+        """Extract 16000Hz mono PCM bytes from an audio frame.
+
+        The returned view is only valid until the next frame, add_audio_frame copies it.
+        """
+        # Opus frames arrive as 48000Hz packed stereo, which is where the old hardcoded
+        # 96000 came from. The resampler reads the real rate, format and layout instead
+        return self.resampler.resample(frame)
@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+
+
+class AudioRingBuffer:
+    """Preallocated single-producer/single-consumer ring buffer of int16 samples.
+
+    The producer (the WebRTC track) only ever moves the write index and the consumer
+    (the transcriber thread) only ever moves the read index, so the sample data itself
+    is never guarded by a lock. The condition variable is only used to put the consumer
+    to sleep until enough samples have arrived, instead of polling.
+
+    The first `max_read` samples of the buffer are mirrored past its end, which lets
+    `read` hand out any window of up to `max_read` samples as one contiguous memoryview
+    even when it wraps around.
+    """
+
+    def __init__(self, capacity=16000 * 30, max_read=8192):
+        if max_read > capacity:
+            raise ValueError("max_read can't be larger than the buffer capacity")
+
+        self.capacity = capacity
+        self.max_read = max_read
+        self.buffer = np.zeros(capacity + max_read, dtype=np.int16)
+
+        # Monotonic sample counters, only written by their owning side
+        self.write_index = 0
+        self.read_index = 0
+
+        # Samples handed out by the last read, released on the next one
+        self.pending = 0
+        self.wanted = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+        self.overruns = 0
+        self.dropped_samples = 0
+        self.underruns = 0
+
+        # (write index after the write, time of the write), appended by the producer and
+        # trimmed by the consumer. The bound only matters when nobody reads
+        self.arrivals = deque(maxlen=4096)
+
+    def available(self):
+        return self.write_index - self.read_index - self.pending
+
+    def free(self):
+        return self.capacity - (self.write_index - self.read_index)
+
+    def write(self, audio_data):
+        """Producer side. Copies int16 PCM bytes into the buffer, dropping whatever doesn't fit."""
+        samples = np.frombuffer(audio_data, dtype=np.int16)
+        free = self.free()
+        if len(samples) > free:
+            # The consumer has fallen behind. We can't move its read index from here,
+            # so the newest samples are the ones we drop
+            self.overruns += 1
+            self.dropped_samples += len(samples) - free
+            samples = samples[:free]
+
+        count = len(samples)
+        if count == 0:
+            return
+
+        start = self.write_index % self.capacity
+        first = min(count, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        if first < count:
+            self.buffer[:count - first] = samples[first:]
+            head_from, head_to = 0, count - first
+        else:
+            head_from, head_to = start, start + count
+
+        # Keep the mirrored tail in sync with whatever we wrote into the head of the buffer
+        head_to = min(head_to, self.max_read)
+        if head_from < head_to:
+            self.buffer[self.capacity + head_from:self.capacity + head_to] = self.buffer[head_from:head_to]
+
+        self.write_index += count
+        self.arrivals.append((self.write_index, time.perf_counter()))
+
+        wanted = self.wanted
+        if wanted and self.available() >= wanted:
+            with self.condition:
+                self.condition.notify()
+
+    def read(self, size, timeout=None):
+        """Consumer side. Blocks until `size` samples are available and returns them as a memoryview.
+
+        The returned view points straight into the buffer and stays valid until the next call
+        to `read` (or `release`), which is when its samples are handed back to the producer.
+        Returns None if the buffer was closed or the timeout expired.
+        """
+        if size > self.max_read:
+            raise ValueError(f"Can't read more than {self.max_read} samples at a time")
+
+        self.release()
+
+        if self.available() < size:
+            self.underruns += 1
+            with self.condition:
+                self.wanted = size
+                while self.available() < size and not self.closed:
+                    if not self.condition.wait(timeout):
+                        break
+                self.wanted = 0
+
+            if self.available() < size:
+                return None
+
+        start = self.read_index % self.capacity
+        self.pending = size
+        return self.buffer[start:start + size].data
+
+    def arrival_time(self, index):
+        """Consumer side. The perf_counter time the sample at `index` was written, or None if
+        it's no longer known. Forgets the writes before it, so indices must not go backwards."""
+        arrivals = self.arrivals
+        try:
+            while arrivals[0][0] <= index:
+                arrivals.popleft()
+            return arrivals[0][1]
+        except IndexError:
+            return None
+
+    def release(self):
+        """Hands the samples from the last read back to the producer."""
+        self.read_index += self.pending
+        self.pending = 0
+
+    def close(self):
+        """Wakes up a blocked reader, which will then return None."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
@@ -0,0 +1,228 @@
+import dataclasses
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import numpy as np
+import torch
+import whisper
+from .utilities import split_on_silence
+
+# Longer utterances are split at the quietest point of the last seconds of each 30-second window
+SPLIT_SEARCH_SECONDS = 5
+
+# model.transcribe's defaults: a window that fails the thresholds is decoded again at each
+# higher temperature, and one that looks like silence is dropped
+FALLBACK_TEMPERATURES = (0.2, 0.4, 0.6, 0.8, 1.0)
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+
+class WhisperInferenceScheduler:
+    """Batches flush jobs from every SpeechTranscriber into shared Whisper passes.
+
+    Transcribers `submit` their utterance and get a Future back. A single worker thread
+    collects pending jobs until it either has `max_batch_size` of them or the oldest one
+    has waited `max_wait` seconds, then runs all of their log-mel inputs through one
+    batched encoder/decoder pass. Jobs are taken round-robin across connections, so a
+    single chatty connection can't starve the others out of a batch.
+
+    Whisper works on 30-second windows, so longer utterances are split into several
+    windows which are batched like any other job and joined back together afterwards.
+    The windows are decoded without timestamps, so they're cut at a pause rather than at
+    exactly 30 seconds, where a word could be cut in two.
+
+    The batched pass is greedy, like the first attempt of `model.transcribe`. Windows whose
+    result is repetitive (compression ratio) or unlikely (average logprob) are decoded again
+    on their own at rising temperatures, as transcribe would, so batching doesn't lower the
+    quality of the transcripts.
+
+    Streaming decoders `transcribe` their window with word timestamps instead, as a job of
+    its own. Every Whisper call runs on the worker thread: each decode hooks its kv-cache
+    into the shared decoder modules, so two decodes at once would corrupt each other.
+    """
+
+    def __init__(self, model, max_batch_size=8, max_wait=0.05, language="en"):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.options = whisper.DecodingOptions(
+            language=language, without_timestamps=True, fp16=torch.cuda.is_available())
+
+        # connection id -> deque of (submitted_at, mel, window_results, window_index, future)
+        self.pending = OrderedDict()
+        # (submitted_at, audio, transcribe options, future) of the streaming decodes
+        self.transcriptions = deque()
+        self.condition = threading.Condition()
+        self.running = True
+        self.batches_run = 0
+        self.jobs_run = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    @property
+    def queue_depth(self):
+        """Number of 30-second windows waiting to be decoded, across all connections."""
+        with self.condition:
+            return self._depth()
+
+    def queue_depth_for(self, connection_id):
+        with self.condition:
+            return len(self.pending.get(connection_id, ()))
+
+    def submit(self, connection_id, audio_np: np.ndarray) -> Future:
+        """Queues float32 16 kHz audio for transcription. The future resolves to the text."""
+        future = Future()
+        if not self.running:
+            future.set_exception(RuntimeError("The Whisper scheduler is stopped"))
+            return future
+        bounds = split_on_silence(audio_np, whisper.audio.N_SAMPLES, SPLIT_SEARCH_SECONDS * whisper.audio.SAMPLE_RATE)
+        windows = [audio_np[start:end] for start, end in bounds]
+        window_results = [None] * len(windows)
+
+        mels = [whisper.log_mel_spectrogram(whisper.pad_or_trim(window), self.model.dims.n_mels)
+                for window in windows]
+
+        now = time.monotonic()
+        with self.condition:
+            jobs = self.pending.setdefault(connection_id, deque())
+            for index, mel in enumerate(mels):
+                jobs.append((now, mel, window_results, index, future))
+            self.condition.notify()
+        return future
+
+    def transcribe(self, audio_np: np.ndarray, **options) -> Future:
+        """Queues a model.transcribe call on float32 16 kHz audio. The future resolves to its result."""
+        future = Future()
+        if not self.running:
+            future.set_exception(RuntimeError("The Whisper scheduler is stopped"))
+            return future
+        with self.condition:
+            self.transcriptions.append((time.monotonic(), audio_np, options, future))
+            self.condition.notify()
+        return future
+
+    def stop(self):
+        """Stops the worker and fails every job still queued, so no transcriber waits on them forever."""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+
+        with self.condition:
+            futures = [job[-1] for jobs in self.pending.values() for job in jobs]
+            futures += [job[-1] for job in self.transcriptions]
+            self.pending.clear()
+            self.transcriptions.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(RuntimeError("The Whisper scheduler was stopped"))
+
+    def _depth(self):
+        return sum(len(jobs) for jobs in self.pending.values())
+
+    def _oldest_submission(self):
+        return min(jobs[0][0] for jobs in self.pending.values() if jobs)
+
+    def _take_batch(self):
+        """Pops up to max_batch_size jobs, one connection at a time."""
+        batch = []
+        while len(batch) < self.max_batch_size and self.pending:
+            for connection_id in list(self.pending):
+                jobs = self.pending[connection_id]
+                batch.append(jobs.popleft())
+                if jobs:
+                    # Send the connection we just served to the back of the line
+                    self.pending.move_to_end(connection_id)
+                else:
+                    del self.pending[connection_id]
+                if len(batch) == self.max_batch_size:
+                    break
+        return batch
+
+    def run(self):
+        while True:
+            transcription, batch = None, None
+            with self.condition:
+                while self.running and not self.pending and not self.transcriptions:
+                    self.condition.wait()
+                if not self.running:
+                    return
+
+                # Streaming decodes and batches take turns, oldest first
+                if self.transcriptions and (not self.pending or self.transcriptions[0][0] <= self._oldest_submission()):
+                    transcription = self.transcriptions.popleft()
+                else:
+                    # Wait for the batch to fill up, but never past the oldest job's deadline
+                    while self.running and self._depth() < self.max_batch_size:
+                        remaining = self._oldest_submission() + self.max_wait - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.condition.wait(remaining)
+
+                    batch = self._take_batch()
+
+            if transcription is not None:
+                self._transcribe(*transcription[1:])
+            else:
+                self._decode(batch)
+
+    def _transcribe(self, audio_np, options, future):
+        try:
+            with torch.no_grad():
+                result = self.model.transcribe(audio_np, **options)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        future.set_result(result)
+
+    def _decode(self, batch):
+        # Any failure fails the batch's futures instead of the worker, which would leave every
+        # pending and future job unresolved
+        try:
+            mels = torch.stack([mel for _, mel, _, _, _ in batch]).to(self.model.device)
+            with torch.no_grad():
+                results = whisper.decode(self.model, mels, self.options)
+        except Exception as e:
+            for _, _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches_run += 1
+        self.jobs_run += len(batch)
+
+        for (_, mel, window_results, index, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if _needs_fallback(result):
+                try:
+                    result = self._decode_with_fallback(mel)
+                except Exception as e:
+                    future.set_exception(e)
+                    continue
+            window_results[index] = "" if _is_silence(result) else result.text.strip()
+            if all(text is not None for text in window_results) and not future.done():
+                future.set_result(" ".join(text for text in window_results if text))
+
+    def _decode_with_fallback(self, mel):
+        """Decodes one window at each fallback temperature until a result passes the thresholds."""
+        mel = mel.to(self.model.device)
+        for temperature in FALLBACK_TEMPERATURES:
+            options = dataclasses.replace(self.options, temperature=temperature)
+            with torch.no_grad():
+                result = whisper.decode(self.model, mel, options)
+            if not _needs_fallback(result):
+                break
+        return result
+
+
+def _is_silence(result):
+    return result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD
+
+
+def _needs_fallback(result):
+    if _is_silence(result):
+        return False
+    return result.compression_ratio > COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < LOGPROB_THRESHOLD
@@ -0,0 +1,125 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Stages timed on every occurrence: each WebRTC frame, each chunk read from the ring buffer
+# and each chunk sent through ClearVoice
+EVENT_STAGES = ["ingest", "queue_wait", "enhancement"]
+
+# Stages of an utterance, as the marks they run between. speech_end is the last frame the VAD
+# called speech, so end_to_end is the time from the user falling silent to hearing the reply
+UTTERANCE_STAGES = {
+    "silence_flush": ("speech_end", "flush"),
+    "transcribe": ("flush", "transcribed"),
+    "dispatch": ("transcribed", "request_sent"),
+    "http": ("request_sent", "reply_received"),
+    "reply_queue": ("reply_queued", "reply_playing"),
+    "end_to_end": ("speech_end", "reply_playing"),
+}
+
+STAGES = EVENT_STAGES + list(UTTERANCE_STAGES)
+
+
+class LatencyHistogram:
+    """Counts of durations in log-spaced buckets, 100 us to about 20 minutes, each bucket
+    9% wider than the one before. Percentiles are the upper edge of their bucket, so they're
+    at most 9% high, and the memory stays the same however many durations are recorded."""
+
+    MIN_SECONDS = 1e-4
+    GROWTH = 2 ** 0.125
+    BUCKETS = 192
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        if seconds <= self.MIN_SECONDS:
+            index = 0
+        else:
+            index = min(self.BUCKETS - 1, math.ceil(math.log(seconds / self.MIN_SECONDS, self.GROWTH)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.MIN_SECONDS * self.GROWTH ** index, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "max": self.max,
+            "mean": self.total / self.count if self.count else None,
+        }
+
+
+class UtteranceTrace:
+    """Timestamps of one utterance on its way from the microphone to the reply.
+
+    The trace is handed along with the utterance: the transcriber marks the speech and the
+    flush, the server the bot request, and the reply track the start of the playback. A stage
+    is recorded in the connection's histograms as soon as both of its marks are set, so an
+    utterance that never gets an audio reply still counts for the stages it went through.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.marks = {}
+
+    def mark(self, name, overwrite=False):
+        """Sets the mark `name` to now. Only the first time, unless overwrite is set."""
+        if name in self.marks and not overwrite:
+            return
+        self.marks[name] = time.perf_counter()
+        for stage, (start, end) in UTTERANCE_STAGES.items():
+            if end == name and start in self.marks:
+                self.latency.observe(stage, self.marks[name] - self.marks[start])
+
+    def stages(self):
+        """Seconds spent in each stage whose marks are both set."""
+        return {stage: self.marks[end] - self.marks[start]
+                for stage, (start, end) in UTTERANCE_STAGES.items() if start in self.marks and end in self.marks}
+
+
+class ConnectionLatency:
+    """Latency histograms of one connection, per stage. Stages are recorded from the event
+    loop, the transcriber thread and the reply track, so every update takes the lock."""
+
+    def __init__(self):
+        self.histograms = defaultdict(LatencyHistogram)
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            self.histograms[stage].observe(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def new_trace(self):
+        return UtteranceTrace(self)
+
+    def summary(self):
+        """count, p50, p95, max and mean of each stage with at least one duration, in seconds."""
+        with self.lock:
+            return {stage: self.histograms[stage].summary() for stage in STAGES if stage in self.histograms}
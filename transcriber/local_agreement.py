@@ -0,0 +1,104 @@
+import numpy as np
+import torch
+
+
+class LocalAgreementDecoder:
+    """Incremental Whisper decoding in the style of LocalAgreement-2.
+
+    Audio is appended as it is suppressed, and every call to `process` re-decodes the
+    window of audio that hasn't been committed yet. Words that two consecutive decodes
+    agree on are committed and won't change anymore. Once the window grows past
+    `max_buffer_duration`, the audio behind the last committed word is dropped, so the
+    encoder only ever sees a bounded amount of audio. `finish` decodes whatever is left.
+
+    The decodes run on the WhisperInferenceScheduler's worker, the only thread that uses the
+    shared Whisper model.
+    """
+
+    def __init__(self, scheduler, sample_rate=16000, max_buffer_duration=15, prompt_length=200):
+        self.scheduler = scheduler
+        self.sample_rate = sample_rate
+        self.max_buffer_duration = max_buffer_duration
+        self.prompt_length = prompt_length
+        self.reset()
+
+    def reset(self):
+        self.audio = np.zeros(0, dtype=np.float32)
+        self.buffer_offset = 0.0  # Seconds of audio already dropped from the front of self.audio
+        self.committed = []  # (start, end, word) in absolute seconds
+        self.hypothesis = []  # Uncommitted words from the last decode
+        self.has_new_audio = False
+
+    @property
+    def committed_text(self):
+        return "".join(word for _, _, word in self.committed).strip()
+
+    def insert_audio(self, audio_np: np.ndarray):
+        self.audio = np.concatenate([self.audio, audio_np.astype(np.float32)])
+        self.has_new_audio = True
+
+    def _decode(self):
+        """Transcribes the current buffer and returns its words in absolute time."""
+        result = self.scheduler.transcribe(
+            self.audio,
+            fp16=torch.cuda.is_available(),
+            word_timestamps=True,
+            condition_on_previous_text=False,
+            initial_prompt=self.committed_text[-self.prompt_length:] or None,
+        ).result()
+        self.has_new_audio = False
+
+        last_committed_end = self.committed[-1][1] if self.committed else 0.0
+        words = []
+        for segment in result["segments"]:
+            for word in segment.get("words", []):
+                start = word["start"] + self.buffer_offset
+                end = word["end"] + self.buffer_offset
+                # Whisper likes to repeat the tail of the prompt, skip anything we've already committed
+                if end > last_committed_end + 0.05:
+                    words.append((start, end, word["word"]))
+        return words
+
+    @staticmethod
+    def _normalize(word):
+        return word.strip().lower().strip(".,!?;:\"'")
+
+    def process(self):
+        """Re-decodes the uncommitted window and returns the text newly confirmed by it."""
+        if not self.has_new_audio:
+            return ""
+
+        words = self._decode()
+
+        confirmed = []
+        for previous, current in zip(self.hypothesis, words):
+            if self._normalize(previous[2]) != self._normalize(current[2]):
+                break
+            confirmed.append(current)
+
+        self.committed.extend(confirmed)
+        self.hypothesis = words[len(confirmed):]
+
+        if len(self.audio) / self.sample_rate > self.max_buffer_duration and self.committed:
+            self._trim(self.committed[-1][1])
+
+        return "".join(word for _, _, word in confirmed).strip()
+
+    def _trim(self, until):
+        """Drops the audio before `until` (absolute seconds) from the buffer."""
+        cut = int((until - self.buffer_offset) * self.sample_rate)
+        cut = max(0, min(cut, len(self.audio)))
+        self.audio = self.audio[cut:]
+        self.buffer_offset += cut / self.sample_rate
+
+    def finish(self):
+        """Decodes the unconfirmed tail, returns the full utterance text and resets the decoder."""
+        if self.committed:
+            self._trim(self.committed[-1][1])
+
+        if len(self.audio) and (self.has_new_audio or self.hypothesis):
+            self.committed.extend(self._decode())
+
+        text = self.committed_text
+        self.reset()
+        return text
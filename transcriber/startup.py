@@ -0,0 +1,120 @@
+import threading
+import time
+from contextlib import contextmanager
+
+WHISPER_MODEL = "small.en"
+ENHANCEMENT_MODEL = "MossFormerGAN_SE_16K"
+
+
+class StartupTimer:
+    """Wall time of each startup phase, and the time from process start to ready.
+
+    The clock starts when this module is imported, which is the first thing the server does,
+    so `ready_after` is the time-to-ready of the whole process.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}  # name -> seconds, in the order the phases finished
+        self.ready_after = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name] = time.perf_counter() - start
+
+    def mark_ready(self):
+        self.ready_after = time.perf_counter() - self.start
+
+    def snapshot(self):
+        """The phase timings so far and the time to ready, None until ready."""
+        with self.lock:
+            return {"phases": dict(self.phases), "ready_after": self.ready_after}
+
+    def report(self):
+        with self.lock:
+            phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        print(f"Ready after {self.ready_after:.2f}s: {phases}")
+
+
+startup_timer = StartupTimer()
+
+
+class LazyResource:
+    """A shared model that is built on first use, exactly once, even if several threads ask
+    for it at the same time. Building it is timed as a startup phase."""
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.value = None
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.value is not None
+
+    def get(self):
+        if self.value is None:
+            with self.lock:
+                if self.value is None:
+                    with startup_timer.phase(self.name):
+                        self.value = self.factory()
+        return self.value
+
+
+def _load_whisper():
+    import whisper
+    return whisper.load_model(WHISPER_MODEL)
+
+
+def _load_inference_scheduler():
+    from .inference_scheduler import WhisperInferenceScheduler
+    return WhisperInferenceScheduler(whisper_model.get())
+
+
+def _load_enhancement_batcher():
+    from clearvoice.clearvoice import ClearVoice
+    from clearvoice.enhancement_batcher import EnhancementBatcher
+    return EnhancementBatcher(ClearVoice(task="speech_enhancement", model_names=[ENHANCEMENT_MODEL]))
+
+
+def _load_vad_model():
+    from .voice_activity import load_vad_model
+    return load_vad_model()
+
+
+whisper_model = LazyResource("whisper", _load_whisper)
+inference_scheduler = LazyResource("whisper scheduler", _load_inference_scheduler)
+enhancement_batcher = LazyResource("clearvoice", _load_enhancement_batcher)
+vad_model = LazyResource("vad", _load_vad_model)
+
+# In the order a first connection needs them
+RESOURCES = [whisper_model, inference_scheduler, enhancement_batcher, vad_model]
+
+
+def warm_up():
+    """Loads every shared model, then reports the startup timings."""
+    with startup_timer.phase("torch"):
+        import torch
+        print(torch.version.cuda)
+        print(torch.version.__version__)
+        print(torch.cuda.is_available())
+
+    for resource in RESOURCES:
+        resource.get()
+    startup_timer.mark_ready()
+    startup_timer.report()
+
+
+def warm_up_in_background():
+    """Starts warm_up on a daemon thread, so the server can accept connections meanwhile.
+    Transcribers created before it's done wait for the models they need."""
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -1,17 +1,16 @@
-import speech_recognition as sr
-import threading
 import time
-from queue import Queue
+import speech_recognition as sr
+from .audio_ring_buffer import AudioRingBuffer
 
 
 class StreamingAudioSource(sr.AudioSource):
-    def __init__(self, frame_queue, rate=16000, channels=1, sample_width=2):
-        self.frame_queue = frame_queue
+    def __init__(self, ring_buffer: AudioRingBuffer, rate=16000, channels=1, sample_width=2):
+        self.ring_buffer = ring_buffer
         self.SAMPLE_RATE = rate
         self.CHANNELS = channels
         self.SAMPLE_WIDTH = sample_width  # 16-bit PCM
         self.CHUNK = 8192
-        self.stream = self.AudioFrameStream(self.frame_queue, self.CHUNK)
+        self.stream = self.AudioFrameStream(self.ring_buffer, self.CHUNK)
 
     def __enter__(self):
         return self  # Allows using 'with' statements
@@ -20,28 +19,26 @@ class StreamingAudioSource(sr.AudioSource):
         pass  # No cleanup needed
 
     class AudioFrameStream(object):
-        def __init__(self, frame_queue: Queue, chunk: int):
-            self.frame_queue = frame_queue
-            self.lock = threading.Lock()
+        def __init__(self, ring_buffer: AudioRingBuffer, chunk: int, timeout=0.5):
+            self.ring_buffer = ring_buffer
             self.CHUNK = chunk
+            self.timeout = timeout
+            self.queue_wait = 0.0  # Seconds the newest sample of the last read spent buffered
 
         def read(self, size):
-            """Read from the queue, returning silence if no data is available."""
-            with self.lock:
-                frames = []
-
-                # We're still slightly unclear on why the *2 is necessary, but it may have something to do with the sample
-                # originally being 96000 instaed of 48000?
-                remaining_size = size * 2
-
-                while not frames:
-                    while remaining_size > 0:
-                        if self.frame_queue.empty():
-                            time.sleep(0.1)
-
-                        chunk = self.frame_queue.get()
-                        # print(f'Rame queue: {self.frame_queue.qsize()} {size} {remaining_size} {len(chunk)}')
-                        frames.append(chunk)
-                        remaining_size -= len(chunk)
-
-                return b"".join(frames)
+            """Block until `size` samples are buffered and return them as a byte memoryview.
+
+            The view points into the ring buffer and is only valid until the next read,
+            so callers that want to keep the audio around need to copy it. Returns None
+            if no audio arrived within the timeout, so the caller can check whether it
+            should still be running.
+            """
+            # The ring buffer counts in samples, which is where the old `size * 2` came from:
+            # `size` has always been a sample count, and each sample is two bytes
+            window = self.ring_buffer.read(size, timeout=self.timeout)
+            if window is None:
+                return None
+
+            arrived = self.ring_buffer.arrival_time(self.ring_buffer.read_index + size - 1)
+            self.queue_wait = time.perf_counter() - arrived if arrived is not None else 0.0
+            return window.cast('B')
@@ -1,13 +1,13 @@
 import numpy as np
-import torch
-import whisper
 import threading
 import pyaudio
 from datetime import datetime, timedelta
 from queue import Queue
-from clearvoice.clearvoice import ClearVoice
 from .utilities import detect_noise, save_to_wav, trim_silence
 from .streaming_audio_source import StreamingAudioSource
+from .audio_ring_buffer import AudioRingBuffer
+from .latency import ConnectionLatency
+from . import startup
 
 # # Audio Config
 # FORMAT = pyaudio.paInt16
@@ -20,14 +20,8 @@ from .streaming_audio_source import StreamingAudioSource
 # stream = audio.open(format=FORMAT, channels=CHANNELS,
 # rate=RATE, output=True, frames_per_buffer=CHUNK)
 
-print(torch.version.cuda)
-print(torch.version.__version__)
-print(torch.cuda.is_available())
-
-audio_model = whisper.load_model("small.en")
-clearvoice = ClearVoice(
-    task="speech_enhancement", model_names=["MossFormerGAN_SE_16K"]
-)
+# Whisper, ClearVoice and the VAD are shared by every transcriber. They're loaded on first
+# use or by startup.warm_up_in_background(), not at import
 
 
 class SpeechTranscriber:
@@ -40,7 +34,13 @@ class SpeechTranscriber:
         flush_callback,
         record_timeout=3,
         flush_after_silence_duration=2,
-        max_recording_duration=60
+        max_recording_duration=60,
+        partial_callback=None,
+        streaming=False,
+        streaming_interval=0.5,
+        voice_activity_detector=None,
+        speech_started_callback=None,
+        latency=None
     ):
         self.username = username
         self.personality = personality
@@ -51,20 +51,51 @@ class SpeechTranscriber:
         self.flush_after_silence_duration = flush_after_silence_duration
         self.max_recording_duration = max_recording_duration
         self.flush_callback = flush_callback
+        self.partial_callback = partial_callback
+        self.speech_started_callback = speech_started_callback
+        self.streaming = streaming
+        self.streaming_interval = streaming_interval
+        self.last_partial_decode = None
         self.last_loud_audio_detected = None
         self.last_voice_detected = None
         self.record_at_least_this_much_audio = 0
         self.needs_whisper = False
         self.post_flush = False
-        self.data_queue = Queue()
+        self.ring_buffer = AudioRingBuffer()
         self.loud_data_queue = Queue()
         self.voice_data_queue = Queue()
+        self.voice_data_seconds = 0.0
+
+        # Loud audio is enhanced and checked for voice in chunks of this many seconds. The
+        # streaming decoder needs them much shorter than record_timeout, or it only sees new
+        # audio every few seconds and its commits lag behind by two chunks
+        self.chunk_duration = streaming_interval if streaming else record_timeout
         self.running = False
-        self.source = StreamingAudioSource(frame_queue=self.data_queue)
+        self.source = StreamingAudioSource(ring_buffer=self.ring_buffer)
+
+        # Stage latencies of this connection, and the trace of the utterance being recorded.
+        # The trace goes to flush_callback with the text, which passes it on to the reply
+        self.latency = latency if latency is not None else ConnectionLatency()
+        self.trace = None
+
+        # Blocks until the shared models are loaded, if the warm-up hasn't finished yet
+        self.enhancement_batcher = startup.enhancement_batcher.get()
+        self.inference_scheduler = startup.inference_scheduler.get()
+        from .local_agreement import LocalAgreementDecoder
+        self.decoder = LocalAgreementDecoder(
+            self.inference_scheduler, self.source.SAMPLE_RATE) if streaming else None
+
+        # Anything with is_speech(bytes) and reset() will do here, EnergyVoiceActivityDetector
+        # brings back the old RMS-only behavior
+        if voice_activity_detector is None:
+            from .voice_activity import NeuralVoiceActivityDetector
+            voice_activity_detector = NeuralVoiceActivityDetector(
+                startup.vad_model.get(), self.source.SAMPLE_RATE, self.source.SAMPLE_WIDTH)
+        self.voice_activity_detector = voice_activity_detector
 
     def add_audio_frame(self, audio_data: bytes):
         """External method to add audio frames for processing."""
-        self.data_queue.put(audio_data)
+        self.ring_buffer.write(audio_data)
 
     def process_audio(self):
         while self.running:
@@ -82,18 +113,32 @@ class SpeechTranscriber:
             seconds_per_frame = float(
                 self.source.CHUNK) / self.source.SAMPLE_RATE
 
-            # Read frame data, then detect loud audio
+            # Read frame data, then detect loud audio. This is a view into the ring buffer,
+            # so it needs to be copied before we hold on to it
             frame_data = self.source.stream.read(self.source.CHUNK)
+            if frame_data is None:
+                continue
+            self.latency.observe("queue_wait", self.source.stream.queue_wait)
 
-            # If loud audio is detected, we'll add the audio to the voice detection queue,
-            # as well as at least record_timeout seconds worth afterwards
+            # Loud audio keeps the environment from counting as quiet, but only speech
+            # is recorded. If speech is detected, we'll add the audio to the voice detection
+            # queue, as well as at least record_timeout seconds worth afterwards. The VAD
+            # runs its own RMS pre-filter, so quiet frames never reach the model
             if detect_noise(frame_data, self.source.SAMPLE_WIDTH):
-                self.record_at_least_this_much_audio = self.source.SAMPLE_RATE * self.record_timeout
                 self.last_loud_audio_detected = now
 
+            if self.voice_activity_detector.is_speech(frame_data):
+                if self.record_at_least_this_much_audio <= 0:
+                    self.speech_started()
+                if self.trace is None:
+                    self.trace = self.latency.new_trace()
+                    self.trace.mark("speech_start")
+                self.trace.mark("speech_end", overwrite=True)
+                self.record_at_least_this_much_audio = self.source.SAMPLE_RATE * self.record_timeout
+
             if self.record_at_least_this_much_audio > 0:
                 self.record_at_least_this_much_audio -= self.source.CHUNK
-                self.loud_data_queue.put(frame_data)
+                self.loud_data_queue.put(bytes(frame_data))
 
             # This variable will be true when the environment is quiet.
             # It would be nice to be able to check whether the user has also stopped speaking for this,
@@ -106,32 +151,39 @@ class SpeechTranscriber:
                 and now - self.last_loud_audio_detected > timedelta(seconds=self.flush_after_silence_duration)
             )
 
-            # If the loud data queue has at least record_timeout seconds of audio,
+            # If the loud data queue has at least chunk_duration seconds of audio,
             # we'll test it to see if there's voice in there (by suppressing it and seeing
             # if anything is left over). If there is voice, we'll add the suppressed audio
             # to the processing queue for whisper
-            if (self.loud_data_queue.qsize() * seconds_per_frame) > self.record_timeout or (not self.loud_data_queue.empty() and environment_is_quiet):
+            if (self.loud_data_queue.qsize() * seconds_per_frame) > self.chunk_duration or (not self.loud_data_queue.empty() and environment_is_quiet):
                 combined_audio_data = b''.join(self.loud_data_queue.queue)
                 self.loud_data_queue.queue.clear()
-                suppressed = clearvoice.process_bytes(combined_audio_data)
+                # Enhancement is batched with the other connections' chunks
+                with self.latency.stage("enhancement"):
+                    suppressed = self.enhancement_batcher.process_bytes(combined_audio_data)
                 found_voice = detect_noise(
                     suppressed.tobytes(), self.source.SAMPLE_WIDTH)
                 if found_voice:
-                    self.voice_data_queue.put(suppressed)
+                    # The streaming decoder keeps its own copy of the utterance
+                    if self.streaming:
+                        self.decoder.insert_audio(suppressed.astype(np.float32) / 32768.0)
+                    else:
+                        self.voice_data_queue.put(suppressed)
+                    self.voice_data_seconds += len(suppressed) / self.source.SAMPLE_RATE
                     self.last_voice_detected = now
                     self.needs_whisper = True
 
             # This variable will be true when the user has stopped speaking.
-            # Note: we check last_voice_detected against the max of record_timeout and
-            # flush_after_silence_duration because if record_timeout is longer than
+            # Note: we check last_voice_detected against the max of chunk_duration and
+            # flush_after_silence_duration because if chunk_duration is longer than
             # flush_after_silence_duration, we can't expect any voice processing within the
             # window of flush_after_silence_duration, and if flush_after_silence_duration is
-            # longer than record_timeout, we don't want to flush yet anyway
+            # longer than chunk_duration, we don't want to flush yet anyway
             user_stopped_speaking = (
                 environment_is_quiet
                 or (
                     self.last_voice_detected
-                    and now - self.last_voice_detected > timedelta(seconds=max(self.record_timeout, self.flush_after_silence_duration))
+                    and now - self.last_voice_detected > timedelta(seconds=max(self.chunk_duration, self.flush_after_silence_duration))
                 )
             )
 
@@ -141,15 +193,13 @@ class SpeechTranscriber:
             # it to whisper
             # Also, just in case it's picking up a TV or something, we'll flush if we
             # hot 60 seconds of recording
-            # Note: Voice data queue is populated with suppressed data, which is
-            # accumulated in chunks of length record_timeout, so... Here we are
             # TODO: Does this actually fix the TV problem? What if the user starts talking
             # at the end of the 60 seconds, do we lose that?
             flush_now = self.needs_whisper and (
                 user_stopped_speaking
                 or (
                     self.max_recording_duration
-                    and self.voice_data_queue.qsize() * self.record_timeout > self.max_recording_duration
+                    and self.voice_data_seconds > self.max_recording_duration
                 )
             )
 
@@ -159,9 +209,29 @@ class SpeechTranscriber:
             # process the voice_data_queue with whisper
             if flush_now:
                 self.needs_whisper = False
+                trace, self.trace = self.trace or self.latency.new_trace(), None
+                trace.mark("flush")
+
+                # In streaming mode most of the utterance has already been committed,
+                # so only the unconfirmed tail is left to decode
+                if self.streaming:
+                    self.voice_data_seconds = 0.0
+                    self.last_partial_decode = None
+                    try:
+                        text = self.decoder.finish()
+                    except Exception as e:
+                        print(f"Transcription failed: {e}")
+                        self.decoder.reset()
+                        self.post_flush = True
+                        continue
+                    trace.mark("transcribed")
+                    self.flush(text, trace)
+                    self.post_flush = True
+                    continue
 
                 audio_data = b"".join(self.voice_data_queue.queue)
                 self.voice_data_queue.queue.clear()
+                self.voice_data_seconds = 0.0
 
                 # file_name = f'request_{datetime.now().strftime("%Y-%m-%d %H-%M-%S")}_suppressed.wav'
                 # save_to_wav(file_name, audio_data, self.source.SAMPLE_RATE)
@@ -171,17 +241,42 @@ class SpeechTranscriber:
                         np.float32)
                     / 32768.0
                 )
-                result = audio_model.transcribe(
-                    audio_np, fp16=torch.cuda.is_available()
-                )
-                text = result["text"].strip()
-                self.flush(text)
+                # Whisper runs are shared with every other connection, so this blocks
+                # until the batch our utterance landed in has been decoded
+                try:
+                    text = self.inference_scheduler.submit(
+                        id(self), audio_np).result()
+                except Exception as e:
+                    # The utterance is lost, but the transcriber keeps listening
+                    print(f"Transcription failed: {e}")
+                    self.post_flush = True
+                    continue
+                trace.mark("transcribed")
+                self.flush(text, trace)
                 self.post_flush = True
 
+            # While the user is still talking, re-decode the growing window every
+            # streaming_interval seconds and hand out whatever the last two decodes agree on
+            elif self.streaming and self.needs_whisper and self.decoder.has_new_audio and (
+                self.last_partial_decode is None
+                or now - self.last_partial_decode > timedelta(seconds=self.streaming_interval)
+            ):
+                self.last_partial_decode = now
+                try:
+                    confirmed = self.decoder.process()
+                except Exception as e:
+                    # The window stays in the decoder, the next decode or the flush retries it
+                    print(f"Partial transcription failed: {e}")
+                    confirmed = ""
+                if confirmed:
+                    self.partial(self.decoder.committed_text)
+
     def start_processing(self):
         """Starts audio processing in a separate thread."""
         if not self.running:
             self.running = True
+            self.ring_buffer.closed = False
+            self.voice_activity_detector.reset()
             self.thread = threading.Thread(
                 target=self.process_audio, daemon=True)
             self.thread.start()
@@ -190,13 +285,24 @@ class SpeechTranscriber:
     def stop_processing(self):
         """Stops audio processing."""
         self.running = False
+        self.ring_buffer.close()
         if self.thread.is_alive():
             self.thread.join()
 
         print("Processing stopped.")
 
-    def flush(self, text: str):
+    def speech_started(self):
+        if self.speech_started_callback is not None:
+            self.speech_started_callback(self.username)
+
+    def partial(self, text: str):
+        print(f"Partial: {text}")
+        if self.partial_callback is not None:
+            self.partial_callback(self.username, self.personality,
+                                  self.gender, self.sourcematerial, text)
+
+    def flush(self, text: str, trace=None):
         print(f"Flushing: {text}")
         self.flush_callback(self.username, self.personality,
-                            self.gender, self.sourcematerial, text)
+                            self.gender, self.sourcematerial, text, trace=trace)
         # pyautogui.write("say " + text + "\n", interval=0.01)  # Simulates key presses
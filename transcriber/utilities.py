@@ -12,34 +12,64 @@ def detect_noise(audio_bytes: bytes, sample_width=2, threshold=400, debug=False)
     return energy > threshold
 
 
-def trim_silence(audio_np: np.ndarray, sample_rate=16000, threshold=100, silence_duration_ms=800):
-    abs_audio = np.abs(audio_np)
-    is_loud = abs_audio > threshold
+def speech_segments(audio_np: np.ndarray, sample_rate=16000, threshold=100, silence_duration_ms=800):
+    """Returns the [start, end) sample intervals that trim_silence keeps, as an (N, 2) array.
+
+    Every loud sample is kept, and so is the start of every silent stretch, up to
+    silence_duration_ms. If nothing is loud, no intervals are returned.
+    """
+    is_loud = np.abs(audio_np) > threshold
+    if not is_loud.any():
+        return np.zeros((0, 2), dtype=np.int64)
+
     silence_samples = int((silence_duration_ms / 1000) * sample_rate)
 
-    silent_counter = 0
-    speech_indices = []
-    current_segment = []
-    has_loud = False  # Track if current_segment contains loud audio
-
-    for idx, loud in enumerate(is_loud):
-        if loud:
-            if silent_counter >= silence_samples and current_segment:
-                speech_indices.extend(current_segment)
-                current_segment = []
-            silent_counter = 0
-            current_segment.append(idx)
-            has_loud = True
-        else:
-            silent_counter += 1
-            if silent_counter < silence_samples:
-                current_segment.append(idx)
-
-    # Only add the final segment if it contains loud audio
-    if current_segment and has_loud:
-        speech_indices.extend(current_segment)
-
-    trimmed_audio = audio_np[speech_indices]
+    # Split the audio into runs of all-loud or all-quiet samples
+    changes = np.flatnonzero(is_loud[1:] != is_loud[:-1]) + 1
+    starts = np.concatenate([[0], changes])
+    ends = np.concatenate([changes, [len(is_loud)]])
+
+    # Quiet runs only keep their first silence_samples - 1 samples
+    ends = np.where(is_loud[starts], ends, np.minimum(ends, starts + max(silence_samples - 1, 0)))
+    non_empty = ends > starts
+    starts, ends = starts[non_empty], ends[non_empty]
+
+    # Join runs that touch, so each interval is one speech segment with its short pauses
+    gaps = starts[1:] != ends[:-1]
+    segment_starts = np.concatenate([starts[:1], starts[1:][gaps]])
+    segment_ends = np.concatenate([ends[:-1][gaps], ends[-1:]])
+    return np.stack([segment_starts, segment_ends], axis=1)
+
+
+def split_on_silence(audio_np: np.ndarray, max_samples, search_samples, frame_samples=320):
+    """Splits audio into pieces of at most max_samples, returned as [start, end) sample pairs.
+
+    Each cut is made in the middle of the quietest frame within the last search_samples of
+    the piece, so a word is only cut in two if the whole search range is continuous speech.
+    """
+    bounds = []
+    start = 0
+    while len(audio_np) - start > max_samples:
+        end = start + max_samples
+        search_start = end - search_samples
+        frame_count = search_samples // frame_samples
+        frames = audio_np[search_start:search_start + frame_count * frame_samples].reshape(frame_count, frame_samples)
+        quietest = int(np.argmin(np.square(frames, dtype=np.float64).mean(axis=1)))
+        cut = search_start + quietest * frame_samples + frame_samples // 2
+        bounds.append((start, cut))
+        start = cut
+    bounds.append((start, len(audio_np)))
+    return bounds
+
+
+def trim_silence(audio_np: np.ndarray, sample_rate=16000, threshold=100, silence_duration_ms=800):
+    segments = speech_segments(audio_np, sample_rate, threshold, silence_duration_ms)
+
+    # A single segment is just a view, otherwise the kept slices are copied once
+    if len(segments) == 1:
+        trimmed_audio = audio_np[segments[0, 0]:segments[0, 1]]
+    else:
+        trimmed_audio = np.concatenate([audio_np[:0]] + [audio_np[start:end] for start, end in segments])
     has_audio = trimmed_audio.size > 0
 
     return has_audio, trimmed_audio
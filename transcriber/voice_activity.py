@@ -0,0 +1,110 @@
+import numpy as np
+import torch
+from .utilities import detect_noise
+
+
+def load_vad_model(savedir="pretrained_models/vad-crdnn-libriparty"):
+    """Loads the speechbrain CRDNN VAD, the same model suppression_demo.py uses."""
+    from speechbrain.inference.VAD import VAD
+    from speechbrain.utils.fetching import LocalStrategy
+
+    return VAD.from_hparams(
+        source="speechbrain/vad-crdnn-libriparty",
+        savedir=savedir,
+        local_strategy=LocalStrategy.COPY,
+        run_opts={"device": "cuda" if torch.cuda.is_available() else "cpu"},
+    )
+
+
+class EnergyVoiceActivityDetector:
+    """The plain RMS threshold, for when no VAD model should be run at all."""
+
+    def __init__(self, sample_width=2, threshold=400):
+        self.sample_width = sample_width
+        self.threshold = threshold
+
+    def reset(self):
+        pass
+
+    def is_speech(self, audio_bytes) -> bool:
+        return detect_noise(audio_bytes, self.sample_width, self.threshold)
+
+
+class NeuralVoiceActivityDetector:
+    """Streaming speech detection with the speechbrain CRDNN VAD.
+
+    Every chunk is first run through the cheap RMS check from `detect_noise`. Quiet
+    chunks are never shown to the model. Loud chunks get a speech probability per
+    10 ms frame, computed with `context_duration` seconds of the preceding audio in
+    front so the recurrent layers aren't starting cold on every chunk.
+
+    The frame probabilities are thresholded with hysteresis like `VAD.apply_threshold`:
+    speech starts once a frame goes above `activation_threshold` and only ends once a
+    frame drops below `deactivation_threshold`. That state carries over from one chunk
+    to the next, so a single word doesn't flicker in and out of speech.
+
+    The model is shared between connections, so it's passed in rather than loaded here.
+    """
+
+    def __init__(
+        self,
+        vad_model,
+        sample_rate=16000,
+        sample_width=2,
+        energy_threshold=400,
+        activation_threshold=0.7,
+        deactivation_threshold=0.25,
+        context_duration=1.0,
+    ):
+        self.vad_model = vad_model
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.energy_threshold = energy_threshold
+        self.activation_threshold = activation_threshold
+        self.deactivation_threshold = deactivation_threshold
+        self.context_samples = int(context_duration * sample_rate)
+        self.frame_samples = int(vad_model.time_resolution * sample_rate)
+        self.reset()
+
+    def reset(self):
+        self.context = np.zeros(0, dtype=np.float32)
+        self.active = False
+        self.last_probabilities = np.zeros(0, dtype=np.float32)
+
+    def speech_probabilities(self, audio_np: np.ndarray) -> np.ndarray:
+        """Returns one speech probability per frame of `audio_np` (float32, 16 kHz)."""
+        window = np.concatenate([self.context, audio_np])
+        self.context = window[-self.context_samples:]
+
+        with torch.no_grad():
+            probabilities = self.vad_model.get_speech_prob_chunk(torch.from_numpy(window))
+        probabilities = probabilities.squeeze().reshape(-1).cpu().numpy()
+
+        # Only the frames belonging to the new audio count, the rest were context
+        frames = max(1, len(audio_np) // self.frame_samples)
+        return probabilities[-frames:]
+
+    def apply_hysteresis(self, probabilities: np.ndarray) -> np.ndarray:
+        """Turns frame probabilities into a speech mask, carrying the state across calls."""
+        mask = np.zeros(len(probabilities), dtype=bool)
+        for i, probability in enumerate(probabilities):
+            if self.active:
+                self.active = probability >= self.deactivation_threshold
+            else:
+                self.active = probability >= self.activation_threshold
+            mask[i] = self.active
+        return mask
+
+    def is_speech(self, audio_bytes) -> bool:
+        """True if any part of this 16-bit PCM chunk is speech."""
+        audio_np = np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32) / 32768.0
+
+        if not detect_noise(audio_bytes, self.sample_width, self.energy_threshold):
+            # Too quiet to be worth the model, but keep the context continuous
+            self.context = np.concatenate([self.context, audio_np])[-self.context_samples:]
+            self.active = False
+            self.last_probabilities = np.zeros(0, dtype=np.float32)
+            return False
+
+        self.last_probabilities = self.speech_probabilities(audio_np)
+        return bool(self.apply_hysteresis(self.last_probabilities).any())
@@ -0,0 +1,63 @@
+import timeit
+import numpy as np
+from transcriber.utilities import trim_silence
+
+SAMPLE_RATE = 16000
+
+
+def trim_silence_loop(audio_np: np.ndarray, sample_rate=16000, threshold=100, silence_duration_ms=800):
+    """The original per-sample implementation, kept here as the reference."""
+    abs_audio = np.abs(audio_np)
+    is_loud = abs_audio > threshold
+    silence_samples = int((silence_duration_ms / 1000) * sample_rate)
+
+    silent_counter = 0
+    speech_indices = []
+    current_segment = []
+    has_loud = False
+
+    for idx, loud in enumerate(is_loud):
+        if loud:
+            if silent_counter >= silence_samples and current_segment:
+                speech_indices.extend(current_segment)
+                current_segment = []
+            silent_counter = 0
+            current_segment.append(idx)
+            has_loud = True
+        else:
+            silent_counter += 1
+            if silent_counter < silence_samples:
+                current_segment.append(idx)
+
+    if current_segment and has_loud:
+        speech_indices.extend(current_segment)
+
+    trimmed_audio = audio_np[speech_indices]
+    return trimmed_audio.size > 0, trimmed_audio
+
+
+def make_utterance(seconds, seed=0):
+    """Speech-like bursts of noise separated by pauses of 0.2 to 2 seconds."""
+    rng = np.random.default_rng(seed)
+    audio = (rng.standard_normal(int(seconds * SAMPLE_RATE)) * 20).astype(np.int16)
+    position = 0
+    while position < len(audio):
+        burst = int(rng.uniform(0.3, 2.0) * SAMPLE_RATE)
+        audio[position:position + burst] = (rng.standard_normal(len(audio[position:position + burst])) * 3000).astype(np.int16)
+        position += burst + int(rng.uniform(0.2, 2.0) * SAMPLE_RATE)
+    return audio
+
+
+if __name__ == "__main__":
+    print(f"{'length':>8} {'loop (ms)':>12} {'numpy (ms)':>12} {'speedup':>9}")
+    for seconds in (1, 10, 60):
+        audio = make_utterance(seconds)
+
+        expected = trim_silence_loop(audio)[1]
+        actual = trim_silence(audio)[1]
+        assert np.array_equal(expected, actual), f"Output differs for {seconds}s input"
+
+        runs = max(1, 10 // seconds)
+        loop_time = min(timeit.repeat(lambda: trim_silence_loop(audio), number=runs, repeat=3)) / runs
+        numpy_time = min(timeit.repeat(lambda: trim_silence(audio), number=runs * 100, repeat=3)) / (runs * 100)
+        print(f"{seconds:>7}s {loop_time * 1000:>12.2f} {numpy_time * 1000:>12.3f} {loop_time / numpy_time:>8.0f}x")